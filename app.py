@@ -1,12 +1,19 @@
 import os
-from flask import Flask, render_template, request, send_file, redirect, url_for, jsonify, session, flash
+from flask import Flask, render_template, request, send_file, send_from_directory, redirect, url_for, jsonify, session, flash
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user, UserMixin
-from werkzeug.utils import secure_filename
-from report_logic import generate_report_pdf, ensure_image_resized, convert_pdf_to_images
-from io import BytesIO
+from report_jobs import enqueue_report, enqueue_batch, stored_report
+from report_metrics import GenerationMetrics
+import batch_reports
+import upload_store
+import chunked_upload
+from preview_store import (
+    THUMBNAILS_AVAILABLE, DEFAULT_THUMBNAIL_WIDTH, PREVIEW_MAX_AGE_SECONDS, save_preview, preview_path,
+    page_thumbnail, snap_thumbnail_width, is_preview_id
+)
 import time
 import re
 import json
+import uuid
 import hashlib
 from database import (
     init_db, create_user, verify_user, get_user_by_email, get_user_by_id,
@@ -15,14 +22,16 @@ from database import (
     get_new_device_logins, get_all_login_sessions, get_user_login_sessions,
     save_signature, get_user_signatures, get_signature, delete_signature, set_default_signature,
     log_unauthorized_access, get_unauthorized_access_logs,
-    add_collaborator, get_draft_collaborators, get_user_collaborative_drafts, remove_collaborator, can_edit_draft
+    add_collaborator, get_draft_collaborators, get_user_collaborative_drafts, remove_collaborator, can_edit_draft,
+    get_report_job, get_upload_session, find_batch_job
 )
 from config import ALLOWED_EMAILS, ADMIN_EMAIL, SECRET_KEY
 from geolocation import get_location_from_ip, format_location_string
+from image_settings import MAX_IMAGE_PX, COMPRESSION_QUALITY
 from logging_config import setup_logging
 
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['UPLOAD_FOLDER'] = upload_store.STORE_DIR  # The worker's upload GC sweeps the same store
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max
 app.config['SECRET_KEY'] = SECRET_KEY
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -59,10 +68,15 @@ def get_device_fingerprint():
     fingerprint_string = f"{user_agent}_{ip_address}"
     return hashlib.md5(fingerprint_string.encode()).hexdigest()
 
+def wants_json_response():
+    """True when the client (the editor's fetch calls) asked for JSON"""
+    return request.accept_mimetypes.best == 'application/json'
+
 def allowed_file(filename, allowed_set):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_set
 
-def save_uploaded_file(fileobj, subfolder=None, allow_pdf=False):
+def save_uploaded_file(fileobj, allow_pdf=False):
+    """Store an upload by content (identical files are stored once). Returns its path."""
     if not fileobj or fileobj.filename == '':
         return None
     
@@ -74,15 +88,39 @@ def save_uploaded_file(fileobj, subfolder=None, allow_pdf=False):
     if not allowed_file(fileobj.filename, allowed_set):
         return None
     
-    filename = secure_filename(fileobj.filename)
-    ts = int(time.time() * 1000)
-    name = f"{ts}_{filename}"
-    dest_dir = app.config['UPLOAD_FOLDER'] if not subfolder else os.path.join(app.config['UPLOAD_FOLDER'], subfolder)
-    os.makedirs(dest_dir, exist_ok=True)
-    path = os.path.join(dest_dir, name)
-    fileobj.save(path)
+    path, _ = upload_store.store_stream(fileobj.stream, f'.{ext}', app.config['UPLOAD_FOLDER'])
     return path
 
+def has_upload_field(key):
+    """True if the form has a file or a chunked upload ('<key>_asset') for a field"""
+    return key in request.files or f'{key}_asset' in request.form
+
+def save_upload_field(key, user_id, allow_pdf=False, errors=None):
+    """
+    Path of the upload for a form field: the file sent in the request, or
+    the finished chunked upload whose asset id is in '<key>_asset'. An
+    asset id that does not resolve (unknown, or expired) is added to
+    errors, or raises UploadError without an errors list.
+    """
+    fileobj = request.files.get(key)
+    if fileobj and fileobj.filename:
+        return save_uploaded_file(fileobj, allow_pdf=allow_pdf)
+    asset_id = request.form.get(f'{key}_asset')
+    if asset_id:
+        allowed_set = ALLOWED_IMAGE_EXTS | ALLOWED_PDF_EXTS if allow_pdf else ALLOWED_IMAGE_EXTS
+        path = chunked_upload.asset_path(user_id, asset_id, allowed_set, app.config['UPLOAD_FOLDER'])
+        if path is None:
+            message = f"Upload for {key} was not found or has expired; please upload it again"
+            if errors is None:
+                raise chunked_upload.UploadError(message)
+            errors.append(message)
+        return path
+    return None
+
+def image_upload_settings():
+    """Size and JPEG quality the editor downscales photos to before uploading (what the server would shrink them to)"""
+    return {'max_px': MAX_IMAGE_PX, 'jpeg_quality': COMPRESSION_QUALITY / 100}
+
 @app.route('/')
 def landing():
     """Landing page"""
@@ -281,7 +319,7 @@ def load_draft(draft_id):
     saved_signatures = get_user_signatures(current_user.id)
     collaborators = get_draft_collaborators(draft_id)
     is_owner = draft['user_id'] == current_user.id
-    return render_template('index.html', draft_data=form_data, draft_id=draft_id, saved_signatures=saved_signatures, collaborators=collaborators, is_owner=is_owner)
+    return render_template('index.html', draft_data=form_data, draft_id=draft_id, saved_signatures=saved_signatures, collaborators=collaborators, is_owner=is_owner, image_upload_settings=image_upload_settings())
 
 @app.route('/delete-draft/<int:draft_id>', methods=['POST'])
 @login_required
@@ -300,34 +338,17 @@ def save_draft_route():
         
         # Collect all form data
         for key, value in request.form.items():
-            if key not in ['action', 'section']:
+            if key not in ['action', 'section'] and not key.endswith('_asset'):
                 form_data[key] = value
         
         # Collect file information (we'll save file paths)
         file_data = {}
-        for key in request.files:
-            file = request.files[key]
-            if file and file.filename:
-                # Save file temporarily
-                subfolder_map = {
-                    'preparer-signature': 'signatures',
-                    'speakerImage': 'speaker',
-                    'photo': 'photos',
-                    'attendance': 'attendance',
-                    'brochure': 'brochure',
-                    'notice': 'notice',
-                    'feedback': 'feedback',
-                    'impact': 'impact'
-                }
-                subfolder = None
-                for prefix, folder in subfolder_map.items():
-                    if key.startswith(prefix):
-                        subfolder = folder
-                        break
-                
-                file_path = save_uploaded_file(file, subfolder=subfolder, allow_pdf=True)
-                if file_path:
-                    file_data[key] = file_path
+        upload_keys = set(request.files) | {key[:-len('_asset')] for key in request.form if key.endswith('_asset')}
+        for key in upload_keys:
+            # Files sent again with every save are stored only once
+            file_path = save_upload_field(key, current_user.id, allow_pdf=True)
+            if file_path:
+                file_data[key] = file_path
         
         form_data.update(file_data)
         
@@ -344,16 +365,16 @@ def save_draft_route():
 def save_signature_route():
     """Save a signature"""
     try:
-        sig_file = request.files.get('signature')
         signature_name = request.form.get('signature_name', '').strip()
         set_as_default = request.form.get('set_as_default') == 'on'
         
-        if not sig_file or not sig_file.filename:
+        sig_file = request.files.get('signature')
+        if (not sig_file or not sig_file.filename) and not request.form.get('signature_asset'):
             return jsonify({'success': False, 'error': 'No file uploaded'})
         
-        sig_path = save_uploaded_file(sig_file, subfolder='signatures')
+        # The upload itself is kept; reports resize it (through the derivative cache) when they render
+        sig_path = save_upload_field('signature', current_user.id)
         if sig_path:
-            sig_path = ensure_image_resized(sig_path)
             signature_id = save_signature(current_user.id, sig_path, signature_name, set_as_default)
             return jsonify({'success': True, 'signature_id': signature_id})
         else:
@@ -361,6 +382,47 @@ def save_signature_route():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/uploads', methods=['POST'])
+@login_required
+def start_chunked_upload():
+    """Start a chunked, resumable upload (see chunked_upload.py)"""
+    params = request.get_json(silent=True) or request.form
+    try:
+        size = int(params.get('size', 0))
+        upload_id = chunked_upload.start_upload(
+            current_user.id, str(params.get('filename', '')), size,
+            ALLOWED_IMAGE_EXTS | ALLOWED_PDF_EXTS, params.get('sha256') or None, app.config['UPLOAD_FOLDER']
+        )
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid size'}), 400
+    except chunked_upload.UploadError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
+    upload = get_upload_session(upload_id, current_user.id)
+    return jsonify({
+        'success': True,
+        'upload_url': url_for('chunked_upload_route', upload_id=upload_id),
+        **chunked_upload.upload_state(upload)
+    }), 201
+
+@app.route('/uploads/<upload_id>', methods=['GET', 'PUT'])
+@login_required
+def chunked_upload_route(upload_id):
+    """GET: the offset to resume from. PUT: append one chunk at Upload-Offset."""
+    upload = get_upload_session(upload_id, current_user.id)
+    if not upload:
+        return jsonify({'success': False, 'error': 'Upload not found'}), 404
+    if request.method == 'PUT':
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            upload = chunked_upload.append_chunk(upload, offset, request.get_data(cache=False),
+                                                 request.headers.get('X-Chunk-SHA256'), app.config['UPLOAD_FOLDER'])
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Upload-Offset header required'}), 400
+        except chunked_upload.UploadError as e:
+            current = get_upload_session(upload_id, current_user.id) or upload
+            return jsonify({'success': False, 'error': str(e), **chunked_upload.upload_state(current)}), e.status
+    return jsonify({'success': True, **chunked_upload.upload_state(upload)})
+
 @app.route('/delete-signature/<int:signature_id>', methods=['POST'])
 @login_required
 def delete_signature_route(signature_id):
@@ -377,6 +439,165 @@ def set_default_signature_route(signature_id):
     flash('Default signature updated.', 'success')
     return redirect(url_for('report'))
 
+def collect_report_data(user_id):
+    """
+    Build report data from the submitted editor form and save its uploads.
+
+    Uploads are only saved here; they are converted/resized later by
+    preprocess.prepare_report_data. Returns (data, validation_errors).
+    """
+    data = {}
+    errors = []
+
+    # General Information
+    data['general_info'] = {
+        'Activity Type': request.form.get('activityType', ''),
+        'Sub Category': request.form.get('subCategory', '') or request.form.get('otherSubCategory', ''),
+        'Start Date': request.form.get('startDate', ''),
+        'End Date': request.form.get('endDate', ''),
+        'Start Time': request.form.get('startTime', ''),
+        'End Time': request.form.get('endTime', ''),
+        'Venue': request.form.get('venue', ''),
+        'Collaboration/Sponsor': request.form.get('collaboration', '')
+    }
+    data['general_info'] = {k: v for k, v in data['general_info'].items() if v}
+
+    # Extract multiple speakers
+    speakers = []
+    speaker_index = 0
+    while True:
+        name_key = f'speaker-name-{speaker_index}'
+        if name_key not in request.form:
+            break
+        speaker_name = request.form.get(name_key, '').strip()
+        if speaker_name:
+            speaker = {
+                'name': speaker_name,
+                'title': request.form.get(f'speaker-title-{speaker_index}', '').strip(),
+                'organization': request.form.get(f'speaker-org-{speaker_index}', '').strip(),
+                'contact': request.form.get(f'speaker-contact-{speaker_index}', '').strip(),
+                'presentation_title': request.form.get(f'speaker-presentation-{speaker_index}', '').strip()
+            }
+            speakers.append(speaker)
+        speaker_index += 1
+    data['speakers'] = speakers
+
+    # Extract multiple participants
+    participants = []
+    participant_index = 0
+    while True:
+        type_key = f'participant-type-{participant_index}'
+        if type_key not in request.form:
+            break
+        participant_type = request.form.get(type_key, '').strip()
+        if participant_type:
+            count = request.form.get(f'participant-count-{participant_index}', '0').strip()
+            participant = {'type': participant_type, 'count': count}
+            participants.append(participant)
+        participant_index += 1
+    data['participants'] = participants
+
+    # Synopsis with formatting options
+    data['synopsis'] = {
+        'highlights': request.form.get('highlights', '').strip(),
+        'highlights_format': request.form.get('highlights-format', 'plain'),
+        'key_takeaways': request.form.get('keyTakeaways', '').strip(),
+        'key_takeaways_format': request.form.get('keyTakeaways-format', 'plain'),
+        'summary': request.form.get('summary', '').strip(),
+        'summary_format': request.form.get('summary-format', 'plain'),
+        'follow_up': request.form.get('followUp', '').strip(),
+        'follow_up_format': request.form.get('followUp-format', 'plain')
+    }
+
+    # Uploads are only saved here; a render worker converts/resizes them
+    # Extract multiple preparers
+    preparers = []
+    preparer_index = 0
+    while True:
+        name_key = f'preparer-name-{preparer_index}'
+        if name_key not in request.form:
+            break
+        preparer_name = request.form.get(name_key, '').strip()
+        if preparer_name:
+            preparer = {
+                'name': preparer_name,
+                'designation': request.form.get(f'preparer-designation-{preparer_index}', '').strip(),
+                'signature_path': None
+            }
+            # Check if using saved signature
+            saved_sig_id = request.form.get(f'preparer-signature-saved-{preparer_index}')
+            if saved_sig_id and saved_sig_id != 'none':
+                sig_data = get_signature(int(saved_sig_id), user_id)
+                if sig_data:
+                    preparer['signature_upload'] = sig_data['signature_path']
+            else:
+                # Check for uploaded file
+                sig_path = save_upload_field(f'preparer-signature-{preparer_index}', user_id, errors=errors)
+                if sig_path:
+                    preparer['signature_upload'] = sig_path
+                    # Optionally save this signature for future use
+                    preparer['save_signature'] = request.form.get(f'save-signature-{preparer_index}') == 'on'
+            preparers.append(preparer)
+        preparer_index += 1
+    data['preparers'] = preparers
+
+    # Speaker Profile
+    speaker_profile = {}
+    speaker_path = save_upload_field('speakerImage', user_id, errors=errors)
+    if speaker_path:
+        speaker_profile['image_upload'] = speaker_path
+    speaker_bio = request.form.get('speakerBio', '').strip()
+    if speaker_bio:
+        speaker_profile['bio'] = speaker_bio
+    data['speaker_profile'] = speaker_profile
+
+    # Activity Photos
+    photos = []
+    photo_index = 1
+    while True:
+        photo_key = f'photo{photo_index}'
+        if not has_upload_field(photo_key):
+            break
+        photo_path = save_upload_field(photo_key, user_id, allow_pdf=True, errors=errors)
+        if photo_path:
+            photos.append(photo_path)
+        photo_index += 1
+    data['photos'] = photos
+
+    # New sections: Attendance List, Brochure, Notice, Feedback, Impact
+    for section_name in ['attendance_list', 'brochure', 'notice', 'feedback', 'impact']:
+        section_files = []
+        index = 0
+        while True:
+            file_key = f'{section_name.split("_")[0]}-{index}'
+            if not has_upload_field(file_key):
+                break
+            file_path = save_upload_field(file_key, user_id, allow_pdf=True, errors=errors)
+            if file_path:
+                section_files.append(file_path)
+            index += 1
+        data[section_name] = section_files
+
+    # Validate required fields
+    if not data['general_info'].get('Activity Type'):
+        errors.append("Activity Type is required")
+    if not data['general_info'].get('Venue'):
+        errors.append("Venue is required")
+    if not speakers:
+        errors.append("At least one speaker is required")
+    if not participants:
+        errors.append("At least one participant type is required")
+    if not preparers:
+        errors.append("At least one report preparer is required")
+    if len(photos) < 2:
+        errors.append("At least 2 activity photos are required")
+
+    # Decompression bombs are refused from their headers, before anything is decoded
+    from preprocess import report_upload_paths, pixel_budget_errors
+    errors.extend(message for _, message in pixel_budget_errors(report_upload_paths(data)))
+
+    return data, errors
+
 @app.route('/report', methods=['GET', 'POST'])
 @login_required
 def report():
@@ -386,197 +607,82 @@ def report():
     
     if request.method == 'POST':
         try:
-            data = {}
-
-            # General Information
-            data['general_info'] = {
-                'Activity Type': request.form.get('activityType', ''),
-                'Sub Category': request.form.get('subCategory', '') or request.form.get('otherSubCategory', ''),
-                'Start Date': request.form.get('startDate', ''),
-                'End Date': request.form.get('endDate', ''),
-                'Start Time': request.form.get('startTime', ''),
-                'End Time': request.form.get('endTime', ''),
-                'Venue': request.form.get('venue', ''),
-                'Collaboration/Sponsor': request.form.get('collaboration', '')
-            }
-            data['general_info'] = {k: v for k, v in data['general_info'].items() if v}
-
-            # Extract multiple speakers
-            speakers = []
-            speaker_index = 0
-            while True:
-                name_key = f'speaker-name-{speaker_index}'
-                if name_key not in request.form:
-                    break
-                speaker_name = request.form.get(name_key, '').strip()
-                if speaker_name:
-                    speaker = {
-                        'name': speaker_name,
-                        'title': request.form.get(f'speaker-title-{speaker_index}', '').strip(),
-                        'organization': request.form.get(f'speaker-org-{speaker_index}', '').strip(),
-                        'contact': request.form.get(f'speaker-contact-{speaker_index}', '').strip(),
-                        'presentation_title': request.form.get(f'speaker-presentation-{speaker_index}', '').strip()
-                    }
-                    speakers.append(speaker)
-                speaker_index += 1
-            data['speakers'] = speakers
-
-            # Extract multiple participants
-            participants = []
-            participant_index = 0
-            while True:
-                type_key = f'participant-type-{participant_index}'
-                if type_key not in request.form:
-                    break
-                participant_type = request.form.get(type_key, '').strip()
-                if participant_type:
-                    count = request.form.get(f'participant-count-{participant_index}', '0').strip()
-                    participant = {'type': participant_type, 'count': count}
-                    participants.append(participant)
-                participant_index += 1
-            data['participants'] = participants
-
-            # Synopsis with formatting options
-            data['synopsis'] = {
-                'highlights': request.form.get('highlights', '').strip(),
-                'highlights_format': request.form.get('highlights-format', 'plain'),
-                'key_takeaways': request.form.get('keyTakeaways', '').strip(),
-                'key_takeaways_format': request.form.get('keyTakeaways-format', 'plain'),
-                'summary': request.form.get('summary', '').strip(),
-                'summary_format': request.form.get('summary-format', 'plain'),
-                'follow_up': request.form.get('followUp', '').strip(),
-                'follow_up_format': request.form.get('followUp-format', 'plain')
-            }
-
-            # Extract multiple preparers
-            preparers = []
-            preparer_index = 0
-            while True:
-                name_key = f'preparer-name-{preparer_index}'
-                if name_key not in request.form:
-                    break
-                preparer_name = request.form.get(name_key, '').strip()
-                if preparer_name:
-                    preparer = {
-                        'name': preparer_name,
-                        'designation': request.form.get(f'preparer-designation-{preparer_index}', '').strip(),
-                        'signature_path': None
-                    }
-                    # Check if using saved signature
-                    saved_sig_id = request.form.get(f'preparer-signature-saved-{preparer_index}')
-                    if saved_sig_id and saved_sig_id != 'none':
-                        sig_data = get_signature(int(saved_sig_id), current_user.id)
-                        if sig_data:
-                            preparer['signature_path'] = sig_data['signature_path']
-                    else:
-                        # Check for uploaded file
-                    sig_file = request.files.get(f'preparer-signature-{preparer_index}')
-                    if sig_file and sig_file.filename:
-                        sig_path = save_uploaded_file(sig_file, subfolder='signatures')
-                        if sig_path:
-                            preparer['signature_path'] = ensure_image_resized(sig_path)
-                                # Optionally save this signature for future use
-                                save_for_future = request.form.get(f'save-signature-{preparer_index}') == 'on'
-                                if save_for_future:
-                                    save_signature(current_user.id, preparer['signature_path'], 
-                                                 f"{preparer_name} - {preparer['designation']}", False)
-                    preparers.append(preparer)
-                preparer_index += 1
-            data['preparers'] = preparers
-
-            # Speaker Profile
-            speaker_profile = {}
-            speaker_file = request.files.get('speakerImage')
-            if speaker_file and speaker_file.filename:
-                speaker_path = save_uploaded_file(speaker_file, subfolder='speaker')
-                if speaker_path:
-                    speaker_profile['image_path'] = ensure_image_resized(speaker_path)
-            speaker_bio = request.form.get('speakerBio', '').strip()
-            if speaker_bio:
-                speaker_profile['bio'] = speaker_bio
-            data['speaker_profile'] = speaker_profile
-
-            # Activity Photos
-            photos = []
-            photo_index = 1
-            while True:
-                photo_key = f'photo{photo_index}'
-                if photo_key not in request.files:
-                    break
-                photo_file = request.files.get(photo_key)
-                if photo_file and photo_file.filename:
-                    photo_path = save_uploaded_file(photo_file, subfolder='photos', allow_pdf=True)
-                    if photo_path:
-                        if photo_path.lower().endswith('.pdf'):
-                            # Convert PDF to images
-                            pdf_images = convert_pdf_to_images(photo_path)
-                            photos.extend([ensure_image_resized(img) for img in pdf_images])
-                        else:
-                        photos.append(ensure_image_resized(photo_path))
-                photo_index += 1
-            data['photos'] = photos
-
-            # New sections: Attendance List, Brochure, Notice, Feedback, Impact
-            for section_name, subfolder in [
-                ('attendance_list', 'attendance'),
-                ('brochure', 'brochure'),
-                ('notice', 'notice'),
-                ('feedback', 'feedback'),
-                ('impact', 'impact')
-            ]:
-                section_files = []
-                index = 0
-                while True:
-                    file_key = f'{section_name.split("_")[0]}-{index}'
-                    if file_key not in request.files:
-                        break
-                    file_obj = request.files.get(file_key)
-                    if file_obj and file_obj.filename:
-                        file_path = save_uploaded_file(file_obj, subfolder=subfolder, allow_pdf=True)
-                        if file_path:
-                            if file_path.lower().endswith('.pdf'):
-                                pdf_images = convert_pdf_to_images(file_path)
-                                section_files.extend([ensure_image_resized(img) for img in pdf_images])
-                            else:
-                                section_files.append(ensure_image_resized(file_path))
-                    index += 1
-                data[section_name] = section_files
-
-            # Validate required fields
-            errors = []
-            if not data['general_info'].get('Activity Type'):
-                errors.append("Activity Type is required")
-            if not data['general_info'].get('Venue'):
-                errors.append("Venue is required")
-            if not speakers:
-                errors.append("At least one speaker is required")
-            if not participants:
-                errors.append("At least one participant type is required")
-            if not preparers:
-                errors.append("At least one report preparer is required")
-            if len(photos) < 2:
-                errors.append("At least 2 activity photos are required")
-            
+            metrics = GenerationMetrics('report_request', current_user.id)
+            with metrics.activate(), metrics.stage('collect_uploads'):
+                data, errors = collect_report_data(current_user.id)
+            metrics.log()
             if errors:
                 error_msg = "; ".join(errors)
-                return render_template('index.html', error=error_msg, saved_signatures=saved_signatures)
+                if wants_json_response():
+                    return jsonify({'success': False, 'error': error_msg}), 400
+                return render_template('index.html', error=error_msg, saved_signatures=saved_signatures, image_upload_settings=image_upload_settings())
 
-            # Generate PDF
-            pdf_bytes, filename = generate_report_pdf(data)
-            return send_file(
-                BytesIO(pdf_bytes),
-                mimetype='application/pdf',
-                as_attachment=True,
-                download_name=filename
-            )
+            # Queue the PDF build for a render worker
+            job_id = enqueue_report(current_user.id, data)
+            if wants_json_response():
+                return jsonify({
+                    'success': True,
+                    'job_id': job_id,
+                    'status_url': url_for('report_job_status', job_id=job_id),
+                    'download_url': url_for('download_report_job', job_id=job_id)
+                }), 202
+            return redirect(url_for('report_job_status', job_id=job_id))
 
         except Exception as exc:
             app.logger.error(f"Exception in report generation - User: {current_user.email}, Error: {exc}", exc_info=True)
+            if wants_json_response():
+                return jsonify({'success': False, 'error': f"Error generating report: {str(exc)}"}), 500
             saved_signatures = get_user_signatures(current_user.id)
-            return render_template('index.html', error=f"Error generating report: {str(exc)}", saved_signatures=saved_signatures)
+            return render_template('index.html', error=f"Error generating report: {str(exc)}", saved_signatures=saved_signatures, image_upload_settings=image_upload_settings())
 
     saved_signatures = get_user_signatures(current_user.id)
-    return render_template('index.html', saved_signatures=saved_signatures)
+    return render_template('index.html', saved_signatures=saved_signatures, image_upload_settings=image_upload_settings())
+
+@app.route('/report-jobs/<job_id>')
+@login_required
+def report_job_status(job_id):
+    """Poll the status of a queued report"""
+    job = get_report_job(job_id, current_user.id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Report job not found'}), 404
+    response = {
+        'success': True,
+        'job_id': job['id'],
+        'status': job['status'],
+        'created_at': job['created_at'],
+        'finished_at': job['finished_at']
+    }
+    if job['status'] == 'done':
+        response['filename'] = job['filename']
+        response['download_url'] = url_for('download_report_job', job_id=job_id)
+        if job['metrics']:
+            response['metrics'] = json.loads(job['metrics'])
+    elif job['status'] == 'failed':
+        response['error'] = job['error']
+    return jsonify(response)
+
+@app.route('/report-jobs/<job_id>/download')
+@login_required
+def download_report_job(job_id):
+    """Download a finished report"""
+    job = get_report_job(job_id, current_user.id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Report job not found'}), 404
+    if not stored_report(job):  # Also keeps a downloaded report from expiring
+        return jsonify({'success': False, 'status': job['status'], 'error': 'Report is not ready'}), 409
+    # Streamed from disk; conditional mode answers Range and If-* requests.
+    # The content key identifies the exact bytes, so it is a strong ETag.
+    response = send_file(
+        job['result_path'],
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=job['filename'],
+        conditional=True,
+        etag=job['content_key'] or True
+    )
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
 @app.route('/privacy-policy')
 def privacy_policy():
@@ -621,49 +727,77 @@ def admin_locations():
 @login_required
 def preview_report():
     """Generate a live preview of the report"""
+    # The rendering stack (ReportLab, PIL, PyPDF2) loads on the first preview,
+    # not at worker boot
+    from preprocess import prepare_report_data
+    from report_logic import spool_preview_pdf
+
     try:
-        form_data = dict(request.form)
-        file_data = {}
-        
-        # Process uploaded files
-        for key in request.files:
-            file = request.files[key]
-            if file and file.filename:
-                subfolder_map = {
-                    'preparer-signature': 'signatures',
-                    'speakerImage': 'speaker',
-                    'photo': 'photos',
-                    'attendance': 'attendance',
-                    'brochure': 'brochure',
-                    'notice': 'notice',
-                    'feedback': 'feedback',
-                    'impact': 'impact'
-                }
-                subfolder = None
-                for prefix, folder in subfolder_map.items():
-                    if key.startswith(prefix):
-                        subfolder = folder
-                        break
-                
-                file_path = save_uploaded_file(file, subfolder=subfolder, allow_pdf=True)
-                if file_path:
-                    file_data[key] = file_path
-        
-        form_data.update(file_data)
-        
-        # Generate preview PDF
-        from report_logic import generate_report_pdf
-        pdf_data = generate_report_pdf(form_data)
-        
-        # Convert to base64 for embedding
-        import base64
-        pdf_base64 = base64.b64encode(pdf_data).decode('utf-8')
+        # Previews are partial by nature, so validation errors are not enforced
+        metrics = GenerationMetrics('preview', current_user.id)
+        with metrics.activate():
+            with metrics.stage('collect_uploads'):
+                data, _ = collect_report_data(current_user.id)
+            # Inline: only render workers run a preprocess pool (see DEPLOYMENT.md)
+            data, _ = prepare_report_data(data, max_workers=1)
+            
+            # Generate preview PDF, rebuilding only the sections that changed
+            pdf_file, _ = spool_preview_pdf(data)
+        metrics.log()
+        with pdf_file:
+            if request.form.get('preview_mode') == 'thumbnails' and THUMBNAILS_AVAILABLE:
+                # Store the PDF once and let the browser fetch small page images
+                preview_id, page_count = save_preview(current_user.id, pdf_file)
+                width = snap_thumbnail_width(request.form.get('thumbnail_width', DEFAULT_THUMBNAIL_WIDTH))
+                pages = [
+                    url_for('preview_page', preview_id=preview_id, page_no=page_no, w=width)
+                    for page_no in range(1, page_count + 1)
+                ]
+                return jsonify({
+                    'success': True,
+                    'mode': 'thumbnails',
+                    'page_count': page_count,
+                    'pages': pages,
+                    'pdf_url': url_for('preview_pdf', preview_id=preview_id)
+                })
+            
+            # Convert to base64 for embedding
+            import base64
+            pdf_base64 = base64.b64encode(pdf_file.read()).decode('utf-8')
         
-        return jsonify({'success': True, 'pdf': pdf_base64})
+        return jsonify({'success': True, 'mode': 'pdf', 'pdf': pdf_base64})
     except Exception as e:
-            import traceback
+        import traceback
         return jsonify({'success': False, 'error': str(e), 'traceback': traceback.format_exc()}), 500
 
+@app.route('/preview/<preview_id>/page-<int:page_no>.jpg')
+@login_required
+def preview_page(preview_id, page_no):
+    """Serve one preview page as a JPEG thumbnail"""
+    path = page_thumbnail(current_user.id, preview_id, page_no,
+                          request.args.get('w', DEFAULT_THUMBNAIL_WIDTH))
+    if not path:
+        return jsonify({'success': False, 'error': 'Preview page not found'}), 404
+    # Preview ids are content hashes, so a given URL never changes
+    response = send_file(os.path.abspath(path), mimetype='image/jpeg', max_age=PREVIEW_MAX_AGE_SECONDS)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
+@app.route('/preview/<preview_id>.pdf')
+@login_required
+def preview_pdf(preview_id):
+    """Serve the full preview PDF behind a set of thumbnails"""
+    if not is_preview_id(preview_id):
+        return jsonify({'success': False, 'error': 'Preview not found'}), 404
+    path = os.path.abspath(preview_path(current_user.id, preview_id))
+    if not os.path.exists(path):
+        return jsonify({'success': False, 'error': 'Preview not found'}), 404
+    response = send_file(path, mimetype='application/pdf', max_age=PREVIEW_MAX_AGE_SECONDS)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
 @app.route('/add-collaborator/<int:draft_id>', methods=['POST'])
 @login_required
 def add_collaborator_route(draft_id):
@@ -828,6 +962,83 @@ def admin_unauthorized_access():
     logs = get_unauthorized_access_logs(limit=200)
     return render_template('admin_unauthorized.html', logs=logs)
 
+@app.route('/admin/batch-reports', methods=['POST'])
+@login_required
+def admin_start_batch():
+    """Start a batch of reports from an uploaded CSV/XLSX (folders are read from BATCH_INPUT_DIR)"""
+    if current_user.email.lower() != ADMIN_EMAIL.lower():
+        return jsonify({'success': False, 'error': 'Admin access required'}), 403
+    
+    sheet = request.files.get('spreadsheet')
+    ext = os.path.splitext(sheet.filename)[1].lower() if sheet and sheet.filename else ''
+    if ext not in ('.csv', '.xlsx'):
+        return jsonify({'success': False, 'error': 'Upload a .csv or .xlsx spreadsheet'}), 400
+    
+    # Re-using a batch id resumes that batch instead of starting over
+    batch_id = request.form.get('batch_id') or uuid.uuid4().hex
+    if not re.fullmatch(r'[0-9a-f]{32}', batch_id):
+        return jsonify({'success': False, 'error': 'Invalid batch id'}), 400
+    output_dir = os.path.join(batch_reports.BATCH_DIR, batch_id)
+    os.makedirs(output_dir, exist_ok=True)
+    # Each run reads its own copy, so a rejected resubmission cannot replace a running batch's sheet
+    sheet_path = os.path.join(output_dir, f'source-{uuid.uuid4().hex[:8]}{ext}')
+    sheet.save(sheet_path)
+    
+    # A render worker runs the batch (and its process pool), not this web worker
+    if not enqueue_batch(current_user.id, batch_id, sheet_path, force=request.form.get('force') == 'on'):
+        os.remove(sheet_path)
+        return jsonify({'success': False, 'error': 'This batch is already queued or running'}), 409
+    app.logger.info(f"Batch report generation queued - Admin: {current_user.email}, Batch: {batch_id}")
+    return jsonify({
+        'success': True,
+        'batch_id': batch_id,
+        'status_url': url_for('admin_batch_status', batch_id=batch_id)
+    }), 202
+
+@app.route('/admin/batch-reports/<batch_id>')
+@login_required
+def admin_batch_status(batch_id):
+    """Manifest of a batch: per-row status, errors and PDF links"""
+    if current_user.email.lower() != ADMIN_EMAIL.lower():
+        return jsonify({'success': False, 'error': 'Admin access required'}), 403
+    output_dir = os.path.join(batch_reports.BATCH_DIR, batch_id)
+    if not re.fullmatch(r'[0-9a-f]{32}', batch_id) or not os.path.isdir(output_dir):
+        return jsonify({'success': False, 'error': 'Batch not found'}), 404
+    manifest = batch_reports.load_manifest(output_dir)
+    for entry in manifest['rows'].values():
+        if entry.get('status') == 'done':
+            entry['download_url'] = url_for('admin_batch_download', batch_id=batch_id, filename=entry['pdf'])
+    job = find_batch_job(batch_id)
+    run = {'status': job['status'], 'error': job['error']} if job else None
+    return jsonify({'success': True, 'batch_id': batch_id, 'run': run, **manifest})
+
+@app.route('/admin/batch-reports/<batch_id>/<filename>')
+@login_required
+def admin_batch_download(batch_id, filename):
+    """Download one PDF of a batch"""
+    if current_user.email.lower() != ADMIN_EMAIL.lower():
+        return jsonify({'success': False, 'error': 'Admin access required'}), 403
+    if not re.fullmatch(r'[0-9a-f]{32}', batch_id) or not filename.endswith('.pdf'):
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    return send_from_directory(os.path.abspath(os.path.join(batch_reports.BATCH_DIR, batch_id)),
+                               filename, mimetype='application/pdf', as_attachment=True)
+
+@app.route('/admin/uploads-gc', methods=['POST'])
+@login_required
+def admin_uploads_gc():
+    """Sweep unreferenced uploads and expired previews now; returns files deleted and bytes reclaimed"""
+    if current_user.email.lower() != ADMIN_EMAIL.lower():
+        return jsonify({'success': False, 'error': 'Admin access required'}), 403
+    import upload_gc
+    dry_run = request.form.get('dry_run') == 'on'
+    if request.form.get('all') == 'on':
+        stats = upload_gc.sweep_all(app.config['UPLOAD_FOLDER'], dry_run=dry_run)
+    else:
+        stats = upload_gc.sweep(app.config['UPLOAD_FOLDER'], dry_run=dry_run)
+    stats['previews'] = upload_gc.expire_previews(dry_run=dry_run)
+    app.logger.info(f"Upload GC run - Admin: {current_user.email}, Stats: {json.dumps(stats, sort_keys=True)}")
+    return jsonify({'success': True, 'dry_run': dry_run, **stats})
+
 @app.route('/my-locations')
 @login_required
 def my_locations():
@@ -849,4 +1060,8 @@ def my_locations():
 
 if __name__ == '__main__':
     init_db()
+    # Under gunicorn the render workers are started by gunicorn_config.py
+    from report_jobs import start_render_workers
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_render_workers()
     app.run(debug=True, host='0.0.0.0', port=5000)
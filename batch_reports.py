@@ -0,0 +1,314 @@
+"""
+Batch report generation from a spreadsheet.
+
+Each row of a CSV/XLSX file is one activity. Text columns fill the report
+fields; folder columns point at directories of photos/scans (images or
+PDFs). Every row is rendered through the normal report pipeline in a
+process pool, and a manifest.json next to the PDFs records the outcome of
+each row. Re-running a batch skips rows whose content has not changed and
+whose PDF is still present, so an interrupted batch resumes where it
+stopped.
+
+    python batch_reports.py activities.xlsx output_dir [--base-dir DIR] [--workers N] [--force]
+
+Columns (all optional except Activity Type and Venue):
+    Report ID, Activity Type, Sub Category, Title of the Activity,
+    Start Date, End Date, Start Time, End Time, Venue, Collaboration/Sponsor,
+    Speaker Name, Speaker Title, Speaker Organization, Speaker Contact,
+    Presentation Title, Participant Type, Participant Count,
+    Highlights, Key Takeaways, Summary, Follow-up Plan,
+    Prepared By, Designation, Signature, Speaker Bio, Speaker Image,
+    Photos Folder, Attendance Folder, Brochure Folder, Notice Folder,
+    Feedback Folder, Impact Folder
+Several speakers, participant types or preparers go in one cell,
+separated by ';' (matching positions across the related columns).
+"""
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+from datetime import datetime, date, time as dt_time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+logger = logging.getLogger('report_generator.report')
+
+# =============================
+# CONFIGURATION
+# =============================
+BATCH_MAX_WORKERS = os.cpu_count() or 1
+BATCH_DIR = 'batch_reports'  # Admin batches: one output directory per batch
+BATCH_INPUT_DIR = 'batch_inputs'  # Admin batches may only read folders below this
+BATCH_RETENTION_SECONDS = 30 * 24 * 3600  # Admin batch outputs not written to for this long are deleted
+BATCH_INPUT_RETENTION_SECONDS = 30 * 24 * 3600  # So are folders below BATCH_INPUT_DIR not modified for this long
+MANIFEST_NAME = 'manifest.json'
+BATCH_FILE_EXTS = {'.jpg', '.jpeg', '.png', '.gif', '.pdf'}
+LIST_SEPARATOR = ';'
+
+GENERAL_INFO_COLUMNS = [
+    'Activity Type', 'Sub Category', 'Title of the Activity', 'Start Date', 'End Date',
+    'Start Time', 'End Time', 'Venue', 'Collaboration/Sponsor'
+]
+SPEAKER_COLUMNS = {
+    'name': 'Speaker Name', 'title': 'Speaker Title', 'organization': 'Speaker Organization',
+    'contact': 'Speaker Contact', 'presentation_title': 'Presentation Title'
+}
+PARTICIPANT_COLUMNS = {'type': 'Participant Type', 'count': 'Participant Count'}
+PREPARER_COLUMNS = {'name': 'Prepared By', 'designation': 'Designation', 'signature': 'Signature'}
+SYNOPSIS_COLUMNS = {
+    'highlights': 'Highlights', 'key_takeaways': 'Key Takeaways',
+    'summary': 'Summary', 'follow_up': 'Follow-up Plan'
+}
+FOLDER_COLUMNS = {
+    'photos': 'Photos Folder', 'attendance_list': 'Attendance Folder', 'brochure': 'Brochure Folder',
+    'notice': 'Notice Folder', 'feedback': 'Feedback Folder', 'impact': 'Impact Folder'
+}
+
+
+def read_rows(sheet_path):
+    """Read a CSV/XLSX file into a list of {column: text} dicts"""
+    import pandas as pd
+
+    if sheet_path.lower().endswith(('.xlsx', '.xlsm', '.xls')):
+        frame = pd.read_excel(sheet_path)
+    else:
+        frame = pd.read_csv(sheet_path)
+    frame.columns = [str(c).strip() for c in frame.columns]
+    return [{column: cell_text(value) for column, value in row.items()}
+            for row in frame.to_dict(orient='records')]
+
+
+def cell_text(value):
+    """Spreadsheet cell to the text the report form would have sent"""
+    if value is None or (isinstance(value, float) and value != value):  # NaN
+        return ''
+    if isinstance(value, datetime):
+        if value.hour or value.minute:
+            return value.strftime('%Y-%m-%d %H:%M')
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, dt_time):
+        return value.strftime('%H:%M')
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def resolve_path(base_dir, value, restrict):
+    """Resolve a path from the sheet against base_dir; optionally refuse paths outside it"""
+    path = os.path.realpath(os.path.join(base_dir, os.path.expanduser(value)))
+    if restrict and os.path.commonpath([path, os.path.realpath(base_dir)]) != os.path.realpath(base_dir):
+        raise ValueError(f"Path outside the batch input directory: {value}")
+    return path
+
+
+def folder_files(folder):
+    """Images/PDFs in a folder, in name order"""
+    if not os.path.isdir(folder):
+        raise ValueError(f"Folder not found: {folder}")
+    return [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+            if os.path.splitext(name)[1].lower() in BATCH_FILE_EXTS]
+
+
+def split_records(row, columns):
+    """Build records from ';'-separated cells, e.g. several speakers in one row"""
+    values = {key: [v.strip() for v in row.get(column, '').split(LIST_SEPARATOR)]
+              for key, column in columns.items()}
+    count = max(len(v) for v in values.values())
+    records = []
+    for i in range(count):
+        record = {key: (v[i] if i < len(v) else '') for key, v in values.items()}
+        if any(record.values()):
+            records.append(record)
+    return records
+
+
+def row_to_report_data(row, base_dir, restrict=False):
+    """Convert one spreadsheet row into report data with raw upload paths"""
+    general_info = {column: row.get(column, '') for column in GENERAL_INFO_COLUMNS}
+    general_info = {k: v for k, v in general_info.items() if v}
+    if not general_info.get('Activity Type'):
+        raise ValueError("Activity Type is required")
+    if not general_info.get('Venue'):
+        raise ValueError("Venue is required")
+
+    data = {
+        'general_info': general_info,
+        'speakers': split_records(row, SPEAKER_COLUMNS),
+        'participants': split_records(row, PARTICIPANT_COLUMNS),
+        'synopsis': {key: row.get(column, '') for key, column in SYNOPSIS_COLUMNS.items()},
+        'preparers': split_records(row, PREPARER_COLUMNS),
+        'speaker_profile': {},
+    }
+
+    for preparer in data['preparers']:
+        signature = preparer.pop('signature')
+        preparer['signature_path'] = None
+        if signature:
+            signature_path = resolve_path(base_dir, signature, restrict)
+            if not os.path.isfile(signature_path):
+                raise ValueError(f"Signature not found: {signature}")
+            preparer['signature_upload'] = signature_path
+    if row.get('Speaker Bio'):
+        data['speaker_profile']['bio'] = row['Speaker Bio']
+    if row.get('Speaker Image'):
+        image = resolve_path(base_dir, row['Speaker Image'], restrict)
+        if not os.path.isfile(image):
+            raise ValueError(f"Speaker image not found: {row['Speaker Image']}")
+        data['speaker_profile']['image_upload'] = image
+
+    for key, column in FOLDER_COLUMNS.items():
+        data[key] = folder_files(resolve_path(base_dir, row[column], restrict)) if row.get(column) else []
+    return data
+
+
+def row_key(row, index):
+    """Stable, filename-safe id for a row: its Report ID, else its row number"""
+    key = row.get('Report ID') or f"row{index + 2}"  # +2: header row, 1-based
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', key).strip('._') or f"row{index + 2}"
+
+
+def render_row(key, data, output_path):
+    """Render one row's report (runs in a pool worker). Returns a manifest entry."""
+    from preprocess import prepare_report_data
+    from report_logic import write_report_pdf
+    from report_metrics import GenerationMetrics
+
+    metrics = GenerationMetrics('batch', None, row=key)
+    with metrics.activate():
+        # One process per row already; no nested preprocessing pool
+        data, errors = prepare_report_data(data, max_workers=1)
+        tmp_path = f"{output_path}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                filename = write_report_pdf(data, f)
+            os.replace(tmp_path, output_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    metrics.log()
+    return {
+        'status': 'done',
+        'filename': filename,
+        'warnings': [f"{os.path.basename(path)}: {message}" for path, message in errors],
+        'seconds': round(metrics.total, 3),
+    }
+
+
+def load_manifest(output_dir):
+    """Read a batch manifest (empty if missing)"""
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'rows': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(output_dir, manifest):
+    """Write the manifest atomically"""
+    manifest['updated_at'] = datetime.now().isoformat(timespec='seconds')
+    rows = manifest['rows'].values()
+    manifest['summary'] = {
+        status: sum(1 for r in rows if r['status'] == status) for status in ('done', 'failed', 'pending')
+    }
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def run_batch(sheet_path, output_dir, base_dir=None, max_workers=None, force=False, restrict=False):
+    """
+    Render every row of a spreadsheet into output_dir and keep manifest.json
+    up to date. Rows already rendered from identical content are skipped
+    unless force is set. Returns the manifest.
+    """
+    from report_logic import report_content_key
+
+    if base_dir is None:
+        base_dir = os.path.dirname(os.path.abspath(sheet_path))
+    if max_workers is None:
+        max_workers = BATCH_MAX_WORKERS
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest = load_manifest(output_dir)
+    manifest['source'] = os.path.basename(sheet_path)
+    previous = manifest.get('rows', {})
+    manifest['rows'] = {}
+
+    jobs = []
+    for index, row in enumerate(read_rows(sheet_path)):
+        key = row_key(row, index)
+        if key in manifest['rows']:
+            key = f"{key}_row{index + 2}"
+        entry = {'row': index + 2, 'pdf': f"{key}.pdf"}
+        try:
+            data = row_to_report_data(row, base_dir, restrict)
+            entry['content_key'] = report_content_key(data)
+        except Exception as e:
+            entry.update(status='failed', error=str(e))
+            manifest['rows'][key] = entry
+            continue
+
+        old = previous.get(key, {})
+        if (not force and old.get('status') == 'done' and old.get('content_key') == entry['content_key']
+                and os.path.exists(os.path.join(output_dir, old['pdf']))):
+            manifest['rows'][key] = old
+            continue
+        entry['status'] = 'pending'
+        manifest['rows'][key] = entry
+        jobs.append((key, data))
+    save_manifest(output_dir, manifest)
+
+    skipped = sum(1 for r in manifest['rows'].values() if r['status'] == 'done')
+    logger.info(f"Batch {sheet_path}: {len(jobs)} to render, {skipped} already done, "
+                f"{len(manifest['rows']) - len(jobs) - skipped} invalid")
+
+    if jobs:
+        with ProcessPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as pool:
+            futures = {
+                pool.submit(render_row, key, data, os.path.join(output_dir, manifest['rows'][key]['pdf'])): key
+                for key, data in jobs
+            }
+            for future in as_completed(futures):
+                key = futures[future]
+                entry = manifest['rows'][key]
+                try:
+                    entry.update(future.result())
+                    entry.pop('error', None)
+                except Exception as e:
+                    logger.error(f"Batch row {key} failed: {e}", exc_info=True)
+                    entry.update(status='failed', error=str(e) or e.__class__.__name__)
+                save_manifest(output_dir, manifest)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('spreadsheet', help='CSV or XLSX file, one activity per row')
+    parser.add_argument('output_dir', help='where PDFs and manifest.json are written')
+    parser.add_argument('--base-dir', help='folder paths in the sheet are relative to this '
+                                           '(default: the spreadsheet\'s directory)')
+    parser.add_argument('--workers', type=int, default=None, help='render processes (default: CPU count)')
+    parser.add_argument('--force', action='store_true', help='re-render rows that are already done')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+    start = time.perf_counter()
+    manifest = run_batch(args.spreadsheet, args.output_dir, args.base_dir, args.workers, args.force)
+
+    for key, entry in manifest['rows'].items():
+        detail = entry.get('error') or entry.get('filename', '')
+        print(f"{key:<30} {entry['status']:<8} {detail}")
+    summary = manifest['summary']
+    print(f"\n{summary['done']} done, {summary['failed']} failed in {time.perf_counter() - start:.1f}s. "
+          f"Manifest: {os.path.join(args.output_dir, MANIFEST_NAME)}")
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Benchmark full-resolution decoding against reduced-resolution (draft) decoding
+for oversized phone photos.
+
+Run this script to compare CPU time and peak memory per photo:
+    python benchmark_image_resize.py [megapixels ...]
+"""
+import os
+import sys
+import time
+import shutil
+import resource
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageDraw
+
+from image_settings import MAX_IMAGE_PX, COMPRESSION_QUALITY
+
+REPEATS = 3
+
+
+def create_photo(path, megapixels):
+    """Create a noisy 4:3 JPEG of roughly the given size"""
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    img = Image.effect_noise((width, height), 64).convert('RGB')
+    draw = ImageDraw.Draw(img)
+    for i in range(0, width, max(1, width // 40)):
+        draw.line([(i, 0), (width - i, height)], fill=(i % 255, 120, 200), width=8)
+    img.save(path, 'JPEG', quality=92)
+    return width, height
+
+
+def resize_full_decode(src, dst):
+    """The previous path: decode at full size, then LANCZOS down to MAX_IMAGE_PX"""
+    img = Image.open(src)
+    w, h = img.size
+    ratio = min(MAX_IMAGE_PX / float(w), MAX_IMAGE_PX / float(h))
+    img = img.resize((int(w * ratio), int(h * ratio)), Image.LANCZOS)
+    img.save(dst, 'JPEG', quality=COMPRESSION_QUALITY, optimize=True)
+
+
+def resize_draft_decode(src, dst):
+    """The current path: DCT-scaled decode, then LANCZOS down to MAX_IMAGE_PX"""
+    img = Image.open(src)
+    w, h = img.size
+    ratio = min(MAX_IMAGE_PX / float(w), MAX_IMAGE_PX / float(h))
+    target = (int(w * ratio), int(h * ratio))
+    img.draft('RGB', target)
+    img = img.resize(target, Image.LANCZOS)
+    img.save(dst, 'JPEG', quality=COMPRESSION_QUALITY, optimize=True)
+
+
+def measure(func_name, src, dst):
+    """Run one variant in a fresh process; return wall, CPU and peak RSS"""
+    func = globals()[func_name]
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for _ in range(REPEATS):
+        func(src, dst)
+    cpu = (time.process_time() - cpu_start) / REPEATS
+    wall = (time.perf_counter() - wall_start) / REPEATS
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return wall, cpu, (rss_peak - rss_before) / 1024.0  # ru_maxrss is KB on Linux
+
+
+def run_benchmark(megapixel_sizes):
+    """Print a comparison table for each photo size"""
+    temp_dir = tempfile.mkdtemp()
+    try:
+        print(f"{'Photo':>12} {'Variant':>8} {'Wall (s)':>9} {'CPU (s)':>8} {'Peak RSS (MB)':>14}")
+        for mp in megapixel_sizes:
+            src = os.path.join(temp_dir, f'photo_{mp}mp.jpg')
+            w, h = create_photo(src, mp)
+            results = {}
+            for label, func_name in [('full', 'resize_full_decode'), ('draft', 'resize_draft_decode')]:
+                dst = os.path.join(temp_dir, f'out_{label}.jpg')
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    results[label] = pool.submit(measure, func_name, src, dst).result()
+                wall, cpu, rss = results[label]
+                print(f"{f'{w}x{h}':>12} {label:>8} {wall:>9.3f} {cpu:>8.3f} {rss:>14.1f}")
+            speedup = results['full'][1] / max(results['draft'][1], 1e-9)
+            print(f"{'':>12} {'speedup':>8} {speedup:>8.1f}x CPU")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sizes = [float(a) for a in sys.argv[1:]] or [12, 24, 48]
+    run_benchmark(sizes)
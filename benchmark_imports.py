@@ -0,0 +1,104 @@
+"""
+Import-time budget for the app and its helper modules.
+
+Each module is imported in a fresh interpreter under `python -X importtime`
+(after one warm-up run, so bytecode is cached) and the median cumulative
+import time is compared with its budget in IMPORT_BUDGETS_MS. The report
+also lists the slowest imports below each module, and a module fails when
+it loads one of LAZY_MODULES: those are only imported on first use.
+
+    python benchmark_imports.py [--repeats N] [--top N] [module ...]
+
+Exits with status 1 when a module is over budget, so it can run in CI.
+"""
+import os
+import sys
+import argparse
+import tempfile
+import subprocess
+from statistics import median
+
+REPEATS = 5
+TOP_IMPORTS = 8
+
+# Median cumulative import time per module, in milliseconds
+IMPORT_BUDGETS_MS = {
+    'app': 400,  # Flask and flask_login account for most of this
+    'database': 40,
+    'report_jobs': 80,
+    'preview_store': 60,
+    'batch_reports': 80,
+    'create_accounts': 60,
+}
+
+# Heavy dependencies that must not be loaded just by importing the modules above
+LAZY_MODULES = ('reportlab', 'PIL', 'PyPDF2', 'pdf2image', 'pandas', 'requests')
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_profile(module):
+    """Import a module in a new interpreter. Returns (cumulative_us, {name: cumulative_us})."""
+    # Run from an empty directory, so files the import creates (logs, uploads) land there
+    with tempfile.TemporaryDirectory() as cwd:
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            cwd=cwd, env={**os.environ, 'PYTHONPATH': HERE}, capture_output=True, text=True, check=True
+        )
+    # Lines are in completion order and nested imports are indented, so the
+    # imports below the module are the ones since the previous top-level line
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue  # The header line
+        name = fields[2].strip()
+        timings[name] = int(fields[1])
+        if name == module:
+            break
+        if fields[2].startswith(' ') and not fields[2].startswith('  '):
+            timings = {}  # site, encodings... run before the module itself
+    return timings.get(module, 0), timings
+
+
+def lazy_modules_loaded(timings):
+    """The LAZY_MODULES (top-level packages) that an import pulled in"""
+    return sorted({name.split('.')[0] for name in timings} & set(LAZY_MODULES))
+
+
+def check_module(module, repeats=REPEATS, top=TOP_IMPORTS):
+    """Measure one module against its budget and print the result. Returns True if within budget."""
+    import_profile(module)  # Warm-up: compile and cache bytecode
+    runs = [import_profile(module) for _ in range(repeats)]
+    total_ms = median(total for total, _ in runs) / 1000
+    timings = runs[-1][1]
+    budget_ms = IMPORT_BUDGETS_MS.get(module)
+    loaded = lazy_modules_loaded(timings)
+
+    ok = not loaded and (budget_ms is None or total_ms <= budget_ms)
+    budget = f"{budget_ms} ms" if budget_ms is not None else "no budget"
+    print(f"{'ok  ' if ok else 'FAIL'} {module:<20} {total_ms:8.1f} ms  ({budget})")
+    if loaded:
+        print(f"       loads at import: {', '.join(loaded)}")
+    slowest = sorted(((us, name) for name, us in timings.items() if name != module), reverse=True)
+    for us, name in slowest[:top]:
+        print(f"       {us / 1000:8.1f} ms  {name}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('modules', nargs='*', help='modules to check (default: every module with a budget)')
+    parser.add_argument('--repeats', type=int, default=REPEATS)
+    parser.add_argument('--top', type=int, default=TOP_IMPORTS, help='slowest imports to list per module')
+    args = parser.parse_args(argv)
+
+    modules = args.modules or list(IMPORT_BUDGETS_MS)
+    results = [check_module(module, args.repeats, args.top) for module in modules]
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,334 @@
+"""
+Benchmark report generation across scaling profiles.
+
+Builds synthetic reports over a matrix of photo count, photo resolution,
+scanned PDF pages (attendance list + brochure) and synopsis length, and
+records wall time, CPU time, peak RSS and output size for each stage
+(upload preprocessing, PDF build). Every stage runs in a freshly spawned
+interpreter, so its peak RSS is its own (ru_maxrss is a lifetime high-water
+mark), and every run gets a fresh working directory, so the derivative
+cache is always cold.
+
+By default each axis is varied on its own around BASE_PROFILE; --full-matrix
+runs every combination. Results can be saved as a baseline and later runs
+compared against it:
+
+    python benchmark_report.py --save-baseline benchmark_baseline.json
+    python benchmark_report.py --baseline benchmark_baseline.json --threshold 0.25
+
+The comparison exits with status 1 if any metric regressed by more than the
+threshold.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import itertools
+import resource
+import multiprocessing
+import statistics
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageDraw
+
+# =============================
+# CONFIGURATION
+# =============================
+BASE_PROFILE = {'photos': 4, 'megapixels': 12, 'pdf_pages': 0, 'synopsis_words': 150}
+AXES = {
+    'photos': [2, 8, 24],
+    'megapixels': [2, 12, 24],
+    'pdf_pages': [0, 8, 32],
+    'synopsis_words': [150, 600, 1200],
+}
+REPEATS = 3
+DEFAULT_THRESHOLD = 0.25  # 25% slower/larger than baseline fails
+MIN_SECONDS_DELTA = 0.05  # Ignore timing differences below this (noise)
+MIN_MB_DELTA = 5.0  # Ignore RSS differences below this
+METRICS = ['wall_s', 'cpu_s', 'peak_rss_mb', 'output_bytes']
+
+WORDS = ('students participated actively in the hands-on session and discussed '
+         'practical applications of the concepts presented by the speaker').split()
+
+
+def profile_name(profile):
+    """Stable name for a profile, e.g. photos=4,megapixels=12,..."""
+    return ','.join(f"{axis}={profile[axis]}" for axis in AXES)
+
+
+def build_profiles(full_matrix=False):
+    """Return the list of profiles to benchmark"""
+    if full_matrix:
+        return [dict(zip(AXES, values)) for values in itertools.product(*AXES.values())]
+    profiles = {profile_name(BASE_PROFILE): dict(BASE_PROFILE)}
+    for axis, values in AXES.items():
+        for value in values:
+            profile = dict(BASE_PROFILE, **{axis: value})
+            profiles.setdefault(profile_name(profile), profile)
+    return list(profiles.values())
+
+
+def create_photo(path, megapixels, seed):
+    """Create a noisy 4:3 JPEG (noise keeps it from compressing unrealistically well)"""
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    # Seeded noise, so output sizes are comparable between runs
+    noise = Image.frombytes('L', (width, height), random.Random(seed).randbytes(width * height))
+    noise = noise.point(lambda v: 64 + v // 2)
+    img = Image.merge('RGB', (noise, noise.transpose(Image.FLIP_LEFT_RIGHT), noise.transpose(Image.FLIP_TOP_BOTTOM)))
+    draw = ImageDraw.Draw(img)
+    for i in range(0, width, max(1, width // 30)):
+        draw.line([(i, 0), (width - i, height)], fill=((i + seed * 40) % 255, 120, 200), width=6)
+    img.save(path, 'JPEG', quality=90)
+
+
+def create_scanned_pdf(path, pages, photo_path):
+    """Create a PDF whose pages are full-page images, like a scanned document"""
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.utils import ImageReader
+
+    pdf = canvas.Canvas(path, pagesize=A4)
+    image = ImageReader(photo_path)
+    for page in range(pages):
+        pdf.drawImage(image, 20, 20, A4[0] - 40, A4[1] - 40)
+        pdf.drawString(40, 40, f"Page {page + 1}")
+        pdf.showPage()
+    pdf.save()
+
+
+def synopsis_text(words):
+    """Synopsis fields with the given total number of words"""
+    fields = ['highlights', 'key_takeaways', 'summary', 'follow_up']
+    per_field = max(1, words // len(fields))
+    text = ' '.join(WORDS[i % len(WORDS)] for i in range(per_field))
+    return {field: text for field in fields}
+
+
+def create_inputs(profile, input_dir):
+    """Create the synthetic uploads for a profile; returns report data with raw upload paths"""
+    photos = []
+    for i in range(profile['photos']):
+        path = os.path.join(input_dir, f'photo_{i}.jpg')
+        create_photo(path, profile['megapixels'], i)
+        photos.append(path)
+
+    data = {
+        'general_info': {
+            'Activity Type': 'Workshop',
+            'Title of the Activity': 'Benchmark Workshop',
+            'Start Date': '2025-01-15',
+            'End Date': '2025-01-15',
+            'Venue': 'Main Auditorium'
+        },
+        'speakers': [{'name': 'Dr. Benchmark', 'title': 'Speaker', 'organization': 'Test Org'}],
+        'participants': [{'type': 'Student', 'count': '60'}],
+        'synopsis': synopsis_text(profile['synopsis_words']),
+        'preparers': [{'name': 'Test Preparer', 'designation': 'Faculty', 'signature_path': None}],
+        'speaker_profile': {},
+        'photos': photos,
+    }
+
+    if profile['pdf_pages']:
+        scan_photo = os.path.join(input_dir, 'scan.jpg')
+        create_photo(scan_photo, 2, 99)
+        attendance_pages = profile['pdf_pages'] // 2
+        for key, pages in [('attendance_list', attendance_pages),
+                           ('brochure', profile['pdf_pages'] - attendance_pages)]:
+            if pages:
+                path = os.path.join(input_dir, f'{key}.pdf')
+                create_scanned_pdf(path, pages, scan_photo)
+                data[key] = [path]
+    return data
+
+
+def peak_rss_mb():
+    """Peak RSS of this process or its largest reaped child, in MB"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        # ru_maxrss survives exec, so a spawned stage would report the launcher's
+        # peak; VmHWM belongs to this address space only
+        with open('/proc/self/status') as f:
+            own = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+    except (OSError, StopIteration):
+        pass
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024.0  # ru_maxrss is KB on Linux
+
+
+def cpu_seconds():
+    """CPU time of this process and its reaped children"""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def preprocess_stage(data, work_dir, workers):
+    """Preprocess the uploads (in a fresh process); returns (metrics, processed report data)"""
+    os.makedirs(work_dir, exist_ok=True)
+    os.chdir(work_dir)  # Relative cache directories start empty
+
+    import preprocess
+
+    wall_start, cpu_start = time.perf_counter(), cpu_seconds()
+    data, errors = preprocess.prepare_report_data(data, max_workers=workers)
+    preprocess.shutdown_executor(wait=True)  # Reap workers so their CPU time and RSS are counted
+    if errors:
+        raise RuntimeError(f"Preprocessing failed: {errors}")
+    processed = {p for key in preprocess.UPLOAD_LIST_KEYS for p in data.get(key, [])}
+    return {
+        'wall_s': time.perf_counter() - wall_start,
+        'cpu_s': cpu_seconds() - cpu_start,
+        'peak_rss_mb': peak_rss_mb(),
+        'output_bytes': sum(os.path.getsize(p) for p in processed),
+    }, data
+
+
+def build_stage(data, work_dir):
+    """Build the PDF from preprocessed data (in a fresh process); returns metrics"""
+    os.chdir(work_dir)  # Derivative paths are relative to the run's directory
+
+    from report_logic import write_report_pdf
+
+    wall_start, cpu_start = time.perf_counter(), cpu_seconds()
+    pdf_path = os.path.join(work_dir, 'report.pdf')
+    with open(pdf_path, 'wb') as f:
+        write_report_pdf(data, f)
+    return {
+        'wall_s': time.perf_counter() - wall_start,
+        'cpu_s': cpu_seconds() - cpu_start,
+        'peak_rss_mb': peak_rss_mb(),
+        'output_bytes': os.path.getsize(pdf_path),
+    }
+
+
+def in_fresh_process(stage, *args):
+    """Run a stage function in a newly spawned interpreter and return its result"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(stage, *args).result()
+
+
+def run_once(data, work_dir, workers):
+    """Run every stage once, each in its own process; returns {stage: metrics}"""
+    stages = {}
+    stages['preprocess'], data = in_fresh_process(preprocess_stage, data, work_dir, workers)
+    stages['build'] = in_fresh_process(build_stage, data, work_dir)
+    return stages
+
+
+def run_profile(profile, temp_dir, repeats, workers):
+    """Benchmark one profile; returns {stage: metrics} using the median of each metric"""
+    case_dir = os.path.join(temp_dir, profile_name(profile).replace(',', '_').replace('=', '-'))
+    input_dir = os.path.join(case_dir, 'inputs')
+    os.makedirs(input_dir)
+    data = create_inputs(profile, input_dir)
+
+    runs = [run_once(data, os.path.join(case_dir, f'run_{i}'), workers) for i in range(repeats)]
+
+    return {
+        stage: {metric: statistics.median(run[stage][metric] for run in runs) for metric in METRICS}
+        for stage in runs[0]
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return a list of regression messages (empty if none)"""
+    regressions = []
+    for name, stages in results.items():
+        for stage, metrics in stages.items():
+            base = baseline.get(name, {}).get(stage)
+            if not base:
+                continue
+            for metric in METRICS:
+                current, previous = metrics[metric], base.get(metric)
+                if previous is None:
+                    continue
+                delta = current - previous
+                if metric in ('wall_s', 'cpu_s') and delta < MIN_SECONDS_DELTA:
+                    continue
+                if metric == 'peak_rss_mb' and delta < MIN_MB_DELTA:
+                    continue
+                if current > previous * (1 + threshold):
+                    regressions.append(f"{name} [{stage}] {metric}: {previous:.3f} -> {current:.3f} "
+                                       f"(+{delta / previous * 100 if previous else float('inf'):.0f}%)")
+    return regressions
+
+
+def print_table(results):
+    """Print one line per profile and stage"""
+    print(f"{'Profile':<58} {'Stage':<11} {'Wall (s)':>9} {'CPU (s)':>8} {'Peak RSS (MB)':>14} {'Output (KB)':>12}")
+    for name, stages in results.items():
+        if 'error' in stages:
+            print(f"{name:<58} {'ERROR':<11} {stages['error']}")
+            continue
+        for stage, m in stages.items():
+            print(f"{name:<58} {stage:<11} {m['wall_s']:>9.3f} {m['cpu_s']:>8.3f} "
+                  f"{m['peak_rss_mb']:>14.1f} {m['output_bytes'] / 1024:>12.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--full-matrix', action='store_true', help='run every combination of AXES')
+    parser.add_argument('--repeats', type=int, default=REPEATS)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='preprocessing workers (default: PREPROCESS_MAX_WORKERS)')
+    parser.add_argument('--profile', action='append', default=[],
+                        help='only run profiles whose name contains this text (repeatable)')
+    parser.add_argument('--save-baseline', metavar='PATH', help='write results as a baseline JSON')
+    parser.add_argument('--baseline', metavar='PATH', help='compare against a baseline JSON')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed relative regression (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    if not shutil.which('pdftoppm'):
+        print("poppler not installed: skipping profiles with scanned PDF pages")
+    profiles = [
+        p for p in build_profiles(args.full_matrix)
+        if (shutil.which('pdftoppm') or not p['pdf_pages'])
+        and (not args.profile or any(f in profile_name(p) for f in args.profile))
+    ]
+
+    results = {}
+    temp_dir = tempfile.mkdtemp(prefix='report_benchmark_')
+    try:
+        for profile in profiles:
+            name = profile_name(profile)
+            print(f"Running {name} ...", flush=True)
+            try:
+                results[name] = run_profile(profile, temp_dir, args.repeats, args.workers)
+            except Exception as e:
+                results[name] = {'error': str(e)}
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    print()
+    print_table(results)
+    failed = any('error' in stages for stages in results.values())
+    measured = {name: stages for name, stages in results.items() if 'error' not in stages}
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(measured, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(measured, baseline, args.threshold)
+        print()
+        if regressions:
+            print(f"{len(regressions)} regression(s) above {args.threshold:.0%}:")
+            for message in regressions:
+                print(f"  {message}")
+            failed = True
+        else:
+            print(f"No regressions above {args.threshold:.0%} against {args.baseline}")
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
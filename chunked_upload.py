@@ -0,0 +1,188 @@
+"""
+Chunked, resumable uploads.
+
+Large photos and scans can be sent in chunks instead of one multipart POST,
+so a dropped connection only loses the chunk in flight:
+
+    POST /uploads                  filename, size (and optionally sha256)
+                                   -> upload_id, offset 0, chunk_size
+    PUT  /uploads/<upload_id>      body: one chunk
+         Upload-Offset: <n>        where the chunk starts
+         X-Chunk-SHA256: <hex>     checksum of the chunk
+                                   -> the new offset; asset_id after the last chunk
+    GET  /uploads/<upload_id>      -> the offset to resume from
+
+Chunks are written to a staging file below <store>/.staging. When the last one
+arrives the file is moved into the content-addressed store (upload_store)
+and the upload gets an asset id, '<sha256><ext>'. The report and draft
+forms accept '<field>_asset' = asset id in place of a file in '<field>'.
+A finished upload keeps its stored file (the upload GC counts it as a
+reference) for UPLOAD_SESSION_TTL_SECONDS; after that its session is
+dropped and the asset id must be uploaded again unless a draft or job
+refers to the file.
+
+Every function takes the store directory (app.config['UPLOAD_FOLDER']),
+the way upload_store does, and defaults to upload_store.STORE_DIR.
+"""
+import os
+import re
+import time
+import fcntl
+import hashlib
+import logging
+
+from database import (
+    create_upload_session, get_upload_session, advance_upload_session, complete_upload_session,
+    user_has_asset, delete_stale_upload_sessions
+)
+from upload_store import STORE_DIR, object_path, store_file, touch
+
+logger = logging.getLogger('report_generator.report')
+
+# =============================
+# CONFIGURATION
+# =============================
+STAGING_SUBDIR = '.staging'  # Inside the store: same filesystem, so finishing is a rename
+UPLOAD_CHUNK_BYTES = 1024 * 1024  # Chunk size suggested to clients
+UPLOAD_MAX_CHUNK_BYTES = 8 * 1024 * 1024
+UPLOAD_MAX_BYTES = 50 * 1024 * 1024  # Same limit as a whole multipart request
+UPLOAD_SESSION_TTL_SECONDS = 24 * 3600  # Sessions (and unused asset ids) idle this long are dropped
+
+ASSET_ID_PATTERN = re.compile(r'([0-9a-f]{64})(\.[a-z0-9]+)')
+
+
+class UploadError(Exception):
+    """A rejected upload request, with the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def staging_dir(store_dir=STORE_DIR):
+    """Directory of the staging files below a store"""
+    return os.path.join(store_dir, STAGING_SUBDIR)
+
+
+def staging_path(upload_id, store_dir=STORE_DIR):
+    """Staging file of an upload session"""
+    return os.path.join(staging_dir(store_dir), f"{upload_id}.part")
+
+
+def upload_state(upload):
+    """Client view of an upload session"""
+    return {
+        'upload_id': upload['id'],
+        'size': upload['size'],
+        'offset': upload['received'],
+        'complete': upload['asset_id'] is not None,
+        'asset_id': upload['asset_id'],
+        'chunk_size': UPLOAD_CHUNK_BYTES,
+    }
+
+
+def start_upload(user_id, filename, size, allowed_exts, sha256=None, store_dir=STORE_DIR):
+    """Open an upload session. Returns its id."""
+    ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    if ext not in allowed_exts:
+        raise UploadError("File type not allowed")
+    if not 0 < size <= UPLOAD_MAX_BYTES:
+        raise UploadError(f"Uploads must be between 1 byte and {UPLOAD_MAX_BYTES // (1024 * 1024)}MB")
+    if sha256 is not None and not re.fullmatch(r'[0-9a-fA-F]{64}', sha256):
+        raise UploadError("sha256 must be a hex digest")
+    upload_id = create_upload_session(user_id, filename, f'.{ext}', size, sha256 and sha256.lower())
+    os.makedirs(staging_dir(store_dir), exist_ok=True)
+    open(staging_path(upload_id, store_dir), 'wb').close()
+    return upload_id
+
+
+def append_chunk(upload, offset, chunk, chunk_sha256, store_dir=STORE_DIR):
+    """
+    Write one chunk of an upload session at offset (which must be the
+    session's current offset). After the last chunk the file is stored and
+    the session completed. Returns the updated session.
+    """
+    if upload['asset_id'] is not None:
+        raise UploadError("Upload already complete", 409)
+    if offset != upload['received']:
+        raise UploadError(f"Expected offset {upload['received']}", 409)
+    if not chunk or len(chunk) > UPLOAD_MAX_CHUNK_BYTES:
+        raise UploadError(f"Chunks must be between 1 byte and {UPLOAD_MAX_CHUNK_BYTES // (1024 * 1024)}MB")
+    if offset + len(chunk) > upload['size']:
+        raise UploadError("Chunk goes past the declared size")
+    if hashlib.sha256(chunk).hexdigest() != (chunk_sha256 or '').lower():
+        raise UploadError("Chunk checksum does not match")
+
+    path = staging_path(upload['id'], store_dir)
+    try:
+        fd = os.open(path, os.O_WRONLY)
+    except FileNotFoundError:
+        raise UploadError("Upload expired", 410)
+    try:
+        # Writes to a session are serialized on its staging file, and the offset
+        # is checked again under the lock: a retried or concurrent request for the
+        # same offset must not overwrite bytes another request already committed
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        current = get_upload_session(upload['id'], upload['user_id'])
+        if current is None:
+            raise UploadError("Upload expired", 410)
+        if current['asset_id'] is not None or offset != current['received']:
+            # The client resumes from GET
+            raise UploadError("Offset moved by another request", 409)
+        os.pwrite(fd, chunk, offset)
+        if not advance_upload_session(upload['id'], offset, offset + len(chunk)):
+            raise UploadError("Upload expired", 410)  # Dropped by expire_uploads meanwhile
+    finally:
+        os.close(fd)  # Releases the lock
+    upload = dict(current, received=offset + len(chunk))
+
+    if upload['received'] == upload['size']:
+        try:
+            stored_path, _ = store_file(path, upload['ext'], store_dir, upload['sha256'])
+        except ValueError as e:
+            raise UploadError(f"{e}; start a new upload")
+        asset_id = os.path.basename(stored_path)
+        complete_upload_session(upload['id'], asset_id)
+        upload['asset_id'] = asset_id
+        logger.info(f"Chunked upload complete - User: {upload['user_id']}, Asset: {asset_id}, "
+                    f"Bytes: {upload['size']}")
+    return upload
+
+
+def asset_object_path(asset_id, store_dir=STORE_DIR):
+    """Where the content of an asset id is stored, or None for a malformed id"""
+    match = ASSET_ID_PATTERN.fullmatch(asset_id or '')
+    return object_path(match.group(1), match.group(2), store_dir) if match else None
+
+
+def asset_path(user_id, asset_id, allowed_exts, store_dir=STORE_DIR):
+    """Stored path of an asset id the user uploaded, or None"""
+    path = asset_object_path(asset_id, store_dir)
+    if not path or os.path.splitext(path)[1][1:] not in allowed_exts or not user_has_asset(user_id, asset_id):
+        return None
+    # Refreshed so the upload GC gives the new reference its grace period
+    return path if touch(path) else None
+
+
+def expire_uploads(max_age_seconds=UPLOAD_SESSION_TTL_SECONDS, store_dir=STORE_DIR):
+    """Drop upload sessions idle for max_age_seconds and their staging files. Returns the count."""
+    upload_ids = delete_stale_upload_sessions(max_age_seconds)
+    for upload_id in upload_ids:
+        try:
+            os.remove(staging_path(upload_id, store_dir))
+        except FileNotFoundError:
+            pass
+    # Staging files whose session is gone (a crash between the two steps)
+    cutoff = time.time() - max_age_seconds
+    staging = staging_dir(store_dir)
+    if os.path.isdir(staging):
+        for name in os.listdir(staging):
+            path = os.path.join(staging, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+    if upload_ids:
+        logger.info(f"Expired {len(upload_ids)} chunked upload sessions")
+    return len(upload_ids)
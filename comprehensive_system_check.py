@@ -353,11 +353,7 @@ check("Image Processing", test_image_processing)
 # 18. Check upload directories
 def check_upload_directories():
     try:
-        upload_dirs = [
-            'uploads/photos', 'uploads/speaker', 'uploads/signatures',
-            'uploads/attendance', 'uploads/brochure', 'uploads/notice',
-            'uploads/feedback', 'uploads/impact'
-        ]
+        upload_dirs = ['uploads']  # Uploads are stored by content hash below this
         for dir_path in upload_dirs:
             os.makedirs(dir_path, exist_ok=True)
         return True
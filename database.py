@@ -1,20 +1,42 @@
 import sqlite3
 import os
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
 import json
+import uuid
+import threading
 
 DB_NAME = 'report_generator.db'
 
-def get_db():
-    """Get database connection"""
+# Database files whose schema this process has already set up. Tables are
+# created on the first connection rather than at import, so importing this
+# module (every worker, test and helper script) does no I/O.
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+def _connect():
+    """Open a connection without touching the schema"""
     conn = sqlite3.connect(DB_NAME)
     conn.row_factory = sqlite3.Row
     return conn
 
+def ensure_schema():
+    """Create and migrate the tables once per process and database file"""
+    if DB_NAME in _schema_ready:
+        return
+    with _schema_lock:
+        if DB_NAME not in _schema_ready:
+            init_db()
+            migrate_database()
+            _schema_ready.add(DB_NAME)
+
+def get_db():
+    """Get database connection"""
+    ensure_schema()
+    return _connect()
+
 def init_db():
     """Initialize database tables"""
-    conn = get_db()
+    conn = _connect()
     cursor = conn.cursor()
     
     # Users table
@@ -128,11 +150,61 @@ def init_db():
         )
     ''')
     
+    # Background report generation jobs
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS report_jobs (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            payload TEXT NOT NULL,
+            content_key TEXT,
+            filename TEXT,
+            metrics TEXT,
+            result_path TEXT,
+            error TEXT,
+            attempts INTEGER DEFAULT 0,
+            kind TEXT DEFAULT 'report',
+            worker TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            heartbeat_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_report_jobs_status ON report_jobs(status, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_report_jobs_content ON report_jobs(content_key, status)')
+    # At most one queued or running run per batch
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_report_jobs_active_batch ON report_jobs(content_key)
+        WHERE kind = 'batch' AND status IN ('queued', 'running')
+    ''')
+    
+    # Chunked (resumable) uploads
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            filename TEXT,
+            ext TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            sha256 TEXT,
+            received INTEGER NOT NULL DEFAULT 0,
+            asset_id TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_upload_sessions_asset ON upload_sessions(user_id, asset_id)')
+    
     conn.commit()
     conn.close()
 
 def create_user(email, password):
     """Create a new user"""
+    from werkzeug.security import generate_password_hash  # werkzeug is slow to import
+
     conn = get_db()
     cursor = conn.cursor()
     try:
@@ -151,6 +223,8 @@ def create_user(email, password):
 
 def verify_user(email, password):
     """Verify user credentials"""
+    from werkzeug.security import check_password_hash
+
     conn = get_db()
     cursor = conn.cursor()
     cursor.execute('SELECT * FROM users WHERE email = ? AND is_active = 1', (email,))
@@ -343,6 +417,7 @@ def use_reset_token(token, new_password):
     cursor = conn.cursor()
     
     # Update password
+    from werkzeug.security import generate_password_hash
     password_hash = generate_password_hash(new_password)
     cursor.execute(
         'UPDATE users SET password_hash = ? WHERE id = ?',
@@ -608,9 +683,309 @@ def can_edit_draft(draft_id, user_id):
     conn.close()
     return collaborator is not None
 
+def create_report_job(user_id, payload, content_key=None):
+    """Queue a report generation job"""
+    job_id = uuid.uuid4().hex
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO report_jobs (id, user_id, status, payload, content_key)
+        VALUES (?, ?, 'queued', ?, ?)
+    ''', (job_id, user_id, json.dumps(payload), content_key))
+    conn.commit()
+    conn.close()
+    return job_id
+
+def create_batch_job(user_id, batch_id, payload):
+    """
+    Queue a spreadsheet batch run. Its queued or running job row is the
+    batch's lock: returns None if that batch is already queued or running.
+    """
+    job_id = uuid.uuid4().hex
+    conn = get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            INSERT INTO report_jobs (id, user_id, status, payload, content_key, kind)
+            VALUES (?, ?, 'queued', ?, ?, 'batch')
+        ''', (job_id, user_id, json.dumps(payload), f'batch:{batch_id}'))
+        conn.commit()
+    except sqlite3.IntegrityError:
+        return None
+    finally:
+        conn.close()
+    return job_id
+
+def find_batch_job(batch_id):
+    """Get the latest run of a batch"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT * FROM report_jobs
+        WHERE content_key = ? AND kind = 'batch'
+        ORDER BY created_at DESC, rowid DESC
+        LIMIT 1
+    ''', (f'batch:{batch_id}',))
+    job = cursor.fetchone()
+    conn.close()
+    return dict(job) if job else None
+
+def get_active_batch_ids():
+    """Ids of the batches that are queued or running"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT content_key FROM report_jobs
+        WHERE kind = 'batch' AND status IN ('queued', 'running')
+    ''')
+    batch_ids = {row['content_key'][len('batch:'):] for row in cursor.fetchall()}
+    conn.close()
+    return batch_ids
+
+def get_report_job(job_id, user_id=None):
+    """Get a report job (optionally restricted to its owner)"""
+    conn = get_db()
+    cursor = conn.cursor()
+    if user_id is None:
+        cursor.execute('SELECT * FROM report_jobs WHERE id = ?', (job_id,))
+    else:
+        cursor.execute('SELECT * FROM report_jobs WHERE id = ? AND user_id = ?', (job_id, user_id))
+    job = cursor.fetchone()
+    conn.close()
+    return dict(job) if job else None
+
+def find_report_job(user_id, content_key):
+    """Get a user's latest queued, running or finished job for the same report content"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT * FROM report_jobs
+        WHERE user_id = ? AND content_key = ? AND status != 'failed'
+        ORDER BY created_at DESC, rowid DESC
+        LIMIT 1
+    ''', (user_id, content_key))
+    job = cursor.fetchone()
+    conn.close()
+    return dict(job) if job else None
+
+def find_finished_report(content_key):
+    """Get the latest finished job (of any user) that produced a report with this content"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT * FROM report_jobs
+        WHERE content_key = ? AND status = 'done'
+        ORDER BY finished_at DESC, rowid DESC
+        LIMIT 1
+    ''', (content_key,))
+    job = cursor.fetchone()
+    conn.close()
+    return dict(job) if job else None
+
+def claim_report_job(worker):
+    """Atomically take the oldest queued job and mark it running"""
+    conn = get_db()
+    conn.isolation_level = None
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+            SELECT * FROM report_jobs
+            WHERE status = 'queued'
+            ORDER BY created_at, rowid
+            LIMIT 1
+        ''')
+        job = cursor.fetchone()
+        if job:
+            cursor.execute('''
+                UPDATE report_jobs
+                SET status = 'running', worker = ?, attempts = attempts + 1,
+                    started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (worker, job['id']))
+        cursor.execute('COMMIT')
+        return dict(job, status='running', worker=worker, attempts=job['attempts'] + 1) if job else None
+    except Exception:
+        cursor.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+def finish_report_job(job_id, result_path, filename, metrics=None, worker=None):
+    """
+    Mark a report job as done, with optional generation metrics. With a
+    worker, only if the job is still running on that worker. Returns
+    whether the job was updated.
+    """
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE report_jobs
+        SET status = 'done', result_path = ?, filename = ?, error = NULL,
+            metrics = ?, finished_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND (? IS NULL OR (status = 'running' AND worker = ?))
+    ''', (result_path, filename, json.dumps(metrics) if metrics else None, job_id, worker, worker))
+    updated = cursor.rowcount > 0
+    conn.commit()
+    conn.close()
+    return updated
+
+def fail_report_job(job_id, error, worker=None):
+    """Mark a report job as failed (with a worker, only if it still runs there). Returns whether it was updated."""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE report_jobs
+        SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND (? IS NULL OR (status = 'running' AND worker = ?))
+    ''', (error, job_id, worker, worker))
+    updated = cursor.rowcount > 0
+    conn.commit()
+    conn.close()
+    return updated
+
+def heartbeat_report_job(job_id, worker):
+    """Record that a worker is still running a job. Returns False if the job is no longer its."""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE report_jobs
+        SET heartbeat_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND status = 'running' AND worker = ?
+    ''', (job_id, worker))
+    updated = cursor.rowcount > 0
+    conn.commit()
+    conn.close()
+    return updated
+
+def requeue_stale_report_jobs(timeout_seconds, max_attempts):
+    """
+    Requeue running jobs whose worker has not sent a heartbeat for
+    timeout_seconds (it died); fail them after too many attempts
+    """
+    conn = get_db()
+    cursor = conn.cursor()
+    cutoff = f'-{int(timeout_seconds)} seconds'
+    cursor.execute('''
+        UPDATE report_jobs
+        SET status = 'failed', error = 'Report generation did not finish', finished_at = CURRENT_TIMESTAMP
+        WHERE status = 'running' AND COALESCE(heartbeat_at, started_at) < datetime('now', ?) AND attempts >= ?
+    ''', (cutoff, max_attempts))
+    cursor.execute('''
+        UPDATE report_jobs
+        SET status = 'queued', worker = NULL
+        WHERE status = 'running' AND COALESCE(heartbeat_at, started_at) < datetime('now', ?)
+    ''', (cutoff,))
+    requeued = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return requeued
+
+def delete_finished_report_jobs(max_age_seconds):
+    """Drop done and failed jobs that finished more than max_age_seconds ago. Returns how many."""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('''
+        DELETE FROM report_jobs
+        WHERE status IN ('done', 'failed') AND finished_at < datetime('now', ?)
+    ''', (f'-{int(max_age_seconds)} seconds',))
+    deleted = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return deleted
+
+def create_upload_session(user_id, filename, ext, size, sha256=None):
+    """Start a chunked upload"""
+    session_id = uuid.uuid4().hex
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO upload_sessions (id, user_id, filename, ext, size, sha256)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (session_id, user_id, filename, ext, size, sha256))
+    conn.commit()
+    conn.close()
+    return session_id
+
+def get_upload_session(session_id, user_id):
+    """Get a chunked upload owned by the user"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM upload_sessions WHERE id = ? AND user_id = ?', (session_id, user_id))
+    upload = cursor.fetchone()
+    conn.close()
+    return dict(upload) if upload else None
+
+def advance_upload_session(session_id, offset, new_offset):
+    """Record a received chunk; False if another request moved the offset first"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('''
+        UPDATE upload_sessions SET received = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND received = ? AND asset_id IS NULL
+    ''', (new_offset, session_id, offset))
+    advanced = cursor.rowcount == 1
+    conn.commit()
+    conn.close()
+    return advanced
+
+def complete_upload_session(session_id, asset_id):
+    """Mark a chunked upload as stored under an asset id"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(
+        'UPDATE upload_sessions SET asset_id = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+        (asset_id, session_id)
+    )
+    conn.commit()
+    conn.close()
+
+def user_has_asset(user_id, asset_id):
+    """Check that the user finished a chunked upload with this asset id"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(
+        'SELECT 1 FROM upload_sessions WHERE user_id = ? AND asset_id = ? LIMIT 1',
+        (user_id, asset_id)
+    )
+    found = cursor.fetchone() is not None
+    conn.close()
+    return found
+
+def delete_stale_upload_sessions(max_age_seconds):
+    """Drop chunked uploads (finished or not) not touched for max_age_seconds. Returns their ids."""
+    conn = get_db()
+    cursor = conn.cursor()
+    cutoff = f'-{int(max_age_seconds)} seconds'
+    cursor.execute('''
+        SELECT id FROM upload_sessions WHERE updated_at < datetime('now', ?)
+    ''', (cutoff,))
+    session_ids = [row['id'] for row in cursor.fetchall()]
+    cursor.executemany('DELETE FROM upload_sessions WHERE id = ?', [(i,) for i in session_ids])
+    conn.commit()
+    conn.close()
+    return session_ids
+
+def get_upload_references():
+    """Everything that may refer to saved uploads: draft form data, saved signature paths,
+    the payloads of report jobs that have not finished and the asset ids of finished
+    chunked uploads (until their sessions expire)"""
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('SELECT form_data FROM drafts WHERE form_data IS NOT NULL')
+    drafts = [row['form_data'] for row in cursor.fetchall()]
+    cursor.execute('SELECT signature_path FROM saved_signatures')
+    signatures = [row['signature_path'] for row in cursor.fetchall()]
+    cursor.execute("SELECT payload FROM report_jobs WHERE status IN ('queued', 'running')")
+    jobs = [row['payload'] for row in cursor.fetchall()]
+    cursor.execute('SELECT DISTINCT asset_id FROM upload_sessions WHERE asset_id IS NOT NULL')
+    assets = [row['asset_id'] for row in cursor.fetchall()]
+    conn.close()
+    return {'drafts': drafts, 'signatures': signatures, 'jobs': jobs, 'assets': assets}
+
 def migrate_database():
     """Add location columns to existing login_sessions table if they don't exist"""
-    conn = get_db()
+    conn = _connect()
     cursor = conn.cursor()
     
     try:
@@ -633,8 +1008,3 @@ def migrate_database():
         conn.rollback()
     finally:
         conn.close()
-
-# Initialize database on import
-init_db()
-migrate_database()
-
@@ -1,7 +1,6 @@
 """
 IP Geolocation functions using free IP-API service
 """
-import requests
 import time
 
 def get_location_from_ip(ip_address):
@@ -20,6 +19,8 @@ def get_location_from_ip(ip_address):
             'isp': 'Local Network'
         }
     
+    import requests  # Loaded on first lookup; it is slow to import
+
     try:
         # Using ip-api.com free service (no API key needed, 45 requests/minute limit)
         url = f"http://ip-api.com/json/{ip_address}?fields=status,message,country,regionName,city,lat,lon,isp,query"
@@ -29,6 +29,20 @@ user = None
 group = None
 tmp_upload_dir = None
 
+# Background report rendering
+render_workers = []
+
+def when_ready(server):
+    """Start the report render workers once, in the master process"""
+    from report_jobs import start_render_workers, RENDER_WORKERS
+    render_workers.extend(start_render_workers(RENDER_WORKERS))
+    server.log.info(f"Started {RENDER_WORKERS} report render workers")
+
+def on_exit(server):
+    """Stop the report render workers"""
+    from report_jobs import stop_render_workers
+    stop_render_workers(render_workers)
+
 # SSL (if needed)
 # keyfile = None
 # certfile = None
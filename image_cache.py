@@ -0,0 +1,311 @@
+"""
+Content-addressed cache for processed image derivatives.
+
+Resized photos/signatures and rasterized PDF pages are stored under a key
+derived from the SHA-256 of the source file plus the processing parameters
+(MAX_IMAGE_PX, quality, DPI, page index...). The index is a small SQLite
+database shared by every gunicorn worker; eviction is size-based LRU for
+files and a row budget (also LRU) for metadata-only entries. Entries record
+the source's SHA-256 ('source' in their meta), so the upload GC can keep the
+source of a derivative something still refers to, and drop the entries of
+sources it deleted (forget_sources).
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import tempfile
+
+logger = logging.getLogger('report_generator.report')
+
+# =============================
+# CONFIGURATION
+# =============================
+CACHE_DIR = os.path.join('cache', 'derivatives')
+CACHE_INDEX_DB = os.path.join('cache', 'derivatives.db')
+CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 2GB
+CACHE_EVICT_RATIO = 0.9  # Evict down to 90% of the budget
+CACHE_MIN_AGE_SECONDS = 600  # Never evict entries used in the last 10 minutes
+CACHE_MAX_META_ROWS = 200_000  # Metadata-only entries (passthrough results, dHashes, PDF page manifests) kept
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_initialized_indexes = set()
+_digest_memo = {}
+
+
+def get_index_db():
+    """Get a connection to the shared derivative index"""
+    os.makedirs(os.path.dirname(CACHE_INDEX_DB) or '.', exist_ok=True)
+    conn = sqlite3.connect(CACHE_INDEX_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    if CACHE_INDEX_DB not in _initialized_indexes:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS derivatives (
+                cache_key TEXT PRIMARY KEY,
+                path TEXT,
+                size INTEGER DEFAULT 0,
+                meta TEXT,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_derivatives_access ON derivatives(last_access)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_derivatives_path ON derivatives(path)')
+        conn.commit()
+        _initialized_indexes.add(CACHE_INDEX_DB)
+    return conn
+
+
+def file_digest(path):
+    """Return the SHA-256 hex digest of a file's content (memoized per mtime/size)."""
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    digest = _digest_memo.get(memo_key)
+    if digest:
+        return digest
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            h.update(chunk)
+    digest = h.hexdigest()
+    if len(_digest_memo) > 4096:
+        _digest_memo.clear()
+    _digest_memo[memo_key] = digest
+    return digest
+
+
+def make_key(digest, **params):
+    """Build a cache key from a content digest and processing parameters."""
+    payload = json.dumps({'digest': digest, 'params': params}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def derivative_path(cache_key, ext='.jpg'):
+    """Return the on-disk location for a cached derivative."""
+    return os.path.join(CACHE_DIR, cache_key[:2], f"{cache_key}{ext}")
+
+
+def new_temp_path(ext='.jpg'):
+    """Return a temp file path inside the cache dir (same filesystem, so rename is atomic)."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=ext, prefix='.tmp_', dir=CACHE_DIR)
+    os.close(fd)
+    return tmp_path
+
+
+def lookup(cache_key):
+    """Return the cached derivative path for a key, or None on a miss."""
+    return lookup_with_meta(cache_key)[0]
+
+
+def lookup_with_meta(cache_key):
+    """Return (path, meta) for a cached derivative, or (None, None) on a miss."""
+    try:
+        conn = get_index_db()
+        try:
+            row = conn.execute(
+                'SELECT path, meta FROM derivatives WHERE cache_key = ?', (cache_key,)
+            ).fetchone()
+            if not row or not row['path']:
+                return None, None
+            if not os.path.exists(row['path']):
+                conn.execute('DELETE FROM derivatives WHERE cache_key = ?', (cache_key,))
+                conn.commit()
+                return None, None
+            conn.execute(
+                'UPDATE derivatives SET last_access = ? WHERE cache_key = ?',
+                (time.time(), cache_key)
+            )
+            conn.commit()
+            return row['path'], json.loads(row['meta']) if row['meta'] else None
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.warning(f"Derivative cache lookup failed for {cache_key}: {e}")
+        return None, None
+
+
+def put(cache_key, tmp_path, ext='.jpg', meta=None):
+    """Move a freshly written derivative into the cache and index it. Returns the final path."""
+    final_path = derivative_path(cache_key, ext)
+    try:
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(tmp_path, final_path)
+        now = time.time()
+        conn = get_index_db()
+        try:
+            conn.execute('''
+                INSERT OR REPLACE INTO derivatives (cache_key, path, size, meta, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (cache_key, final_path, os.path.getsize(final_path),
+                  json.dumps(meta) if meta else None, now, now))
+            conn.commit()
+        finally:
+            conn.close()
+        evict()
+        return final_path
+    except Exception as e:
+        logger.warning(f"Derivative cache store failed for {cache_key}: {e}")
+        return final_path if os.path.exists(final_path) else tmp_path
+
+
+def get_meta(cache_key):
+    """Return the metadata dict stored for a key (e.g. a PDF page manifest), or None."""
+    try:
+        conn = get_index_db()
+        try:
+            row = conn.execute(
+                'SELECT meta FROM derivatives WHERE cache_key = ?', (cache_key,)
+            ).fetchone()
+            if not row or not row['meta']:
+                return None
+            conn.execute(
+                'UPDATE derivatives SET last_access = ? WHERE cache_key = ?',
+                (time.time(), cache_key)
+            )
+            conn.commit()
+            return json.loads(row['meta'])
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.warning(f"Derivative cache meta lookup failed for {cache_key}: {e}")
+        return None
+
+
+def put_meta(cache_key, meta):
+    """Store a metadata-only entry (no file) for a key."""
+    try:
+        now = time.time()
+        conn = get_index_db()
+        try:
+            conn.execute('''
+                INSERT OR REPLACE INTO derivatives (cache_key, path, size, meta, created_at, last_access)
+                VALUES (?, NULL, 0, ?, ?, ?)
+            ''', (cache_key, json.dumps(meta), now, now))
+            conn.commit()
+        finally:
+            conn.close()
+        evict()
+    except Exception as e:
+        logger.warning(f"Derivative cache meta store failed for {cache_key}: {e}")
+
+
+def derivative_sources(paths):
+    """SHA-256 of the source file of each cached derivative among paths, where recorded. Returns {path: digest}."""
+    paths = list(dict.fromkeys(paths))
+    sources = {}
+    if not paths:
+        return sources
+    conn = get_index_db()
+    try:
+        for start in range(0, len(paths), 500):
+            batch = paths[start:start + 500]
+            rows = conn.execute(
+                f"SELECT path, meta FROM derivatives WHERE path IN ({', '.join('?' * len(batch))})", batch
+            ).fetchall()
+            for row in rows:
+                meta = json.loads(row['meta']) if row['meta'] else {}
+                if meta.get('source'):
+                    sources[row['path']] = meta['source']
+    finally:
+        conn.close()
+    return sources
+
+
+def forget_sources(digests):
+    """Drop the entries (and files) made from sources that were deleted, by SHA-256. Returns how many."""
+    digests = list(set(digests))
+    removed = 0
+    if not digests:
+        return removed
+    conn = get_index_db()
+    try:
+        for start in range(0, len(digests), 500):
+            batch = digests[start:start + 500]
+            rows = conn.execute(
+                f"SELECT cache_key, path FROM derivatives "
+                f"WHERE json_extract(meta, '$.source') IN ({', '.join('?' * len(batch))})", batch
+            ).fetchall()
+            for row in rows:
+                if row['path']:
+                    try:
+                        os.remove(row['path'])
+                    except FileNotFoundError:
+                        pass
+                conn.execute('DELETE FROM derivatives WHERE cache_key = ?', (row['cache_key'],))
+                removed += 1
+        conn.commit()
+    finally:
+        conn.close()
+    if removed:
+        logger.info(f"Derivative cache dropped {removed} entries of deleted sources")
+    return removed
+
+
+def evict(max_bytes=None, max_meta_rows=None):
+    """
+    Evict least recently used derivatives until the cache fits its size budget,
+    and least recently used metadata-only entries until they fit their row budget.
+    """
+    if max_bytes is None:
+        max_bytes = CACHE_MAX_BYTES
+    if max_meta_rows is None:
+        max_meta_rows = CACHE_MAX_META_ROWS
+    removed = 0
+    try:
+        conn = get_index_db()
+        try:
+            cutoff = time.time() - CACHE_MIN_AGE_SECONDS
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) AS total FROM derivatives').fetchone()['total']
+            if total > max_bytes:
+                target = int(max_bytes * CACHE_EVICT_RATIO)
+                rows = conn.execute('''
+                    SELECT cache_key, path, size FROM derivatives
+                    WHERE path IS NOT NULL AND last_access < ?
+                    ORDER BY last_access ASC
+                ''', (cutoff,)).fetchall()
+                for row in rows:
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(row['path'])
+                    except FileNotFoundError:
+                        pass
+                    conn.execute('DELETE FROM derivatives WHERE cache_key = ?', (row['cache_key'],))
+                    total -= row['size']
+                    removed += 1
+            
+            meta_rows = conn.execute('SELECT COUNT(*) AS n FROM derivatives WHERE path IS NULL').fetchone()['n']
+            if meta_rows > max_meta_rows:
+                removed += conn.execute('''
+                    DELETE FROM derivatives WHERE cache_key IN (
+                        SELECT cache_key FROM derivatives
+                        WHERE path IS NULL AND last_access < ?
+                        ORDER BY last_access ASC
+                        LIMIT ?
+                    )
+                ''', (cutoff, meta_rows - int(max_meta_rows * CACHE_EVICT_RATIO))).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        if removed:
+            logger.info(f"Derivative cache evicted {removed} entries")
+    except Exception as e:
+        logger.warning(f"Derivative cache eviction failed: {e}")
+    return removed
+
+
+def cache_stats():
+    """Return entry count and total bytes held by the derivative cache."""
+    conn = get_index_db()
+    try:
+        row = conn.execute(
+            'SELECT COUNT(*) AS entries, COALESCE(SUM(size), 0) AS total FROM derivatives'
+        ).fetchone()
+        return {'entries': row['entries'], 'bytes': row['total']}
+    finally:
+        conn.close()
@@ -0,0 +1,14 @@
+"""
+Image size and quality settings shared by the report pipeline and the web app.
+
+report_logic resizes and encodes uploads with these values, and the editor
+downscales photos in the browser to the same size before uploading them. They
+live here, with no imports, so pages that only need the numbers do not load
+report_logic (and with it ReportLab and Pillow).
+"""
+
+# =============================
+# CONFIGURATION
+# =============================
+MAX_IMAGE_PX = 1200  # Long side of embedded images, in pixels
+COMPRESSION_QUALITY = 75  # Highest JPEG quality used for embedded images
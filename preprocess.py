@@ -0,0 +1,250 @@
+"""
+Parallel preprocessing of saved uploads for report generation.
+
+Each saved upload (photo, signature, scanned PDF...) is converted and resized
+in a bounded process pool so a report with many photos uses more than one
+core. Results come back in the original order, and a failure in one file
+never affects the others.
+"""
+import os
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import report_metrics
+from report_logic import (
+    process_image, convert_pdf_to_images, pdf_vector_pages, near_duplicate_pairs, open_for_decode, check_decode_size,
+    ProcessedAsset, ImageTooLarge, IMAGE_BYTE_BUDGET
+)
+
+logger = logging.getLogger('report_generator.report')
+
+# =============================
+# CONFIGURATION
+# =============================
+PREPROCESS_MAX_WORKERS = min(4, os.cpu_count() or 1)  # Per render worker (see DEPLOYMENT.md)
+PREPROCESS_TIMEOUT_SECONDS = 90  # Per file
+REPORT_IMAGE_BUDGET_BYTES = None  # Total for all embedded images of a report; None = per-image budget only
+IMAGE_MIN_BYTE_BUDGET = 48 * 1024  # A report budget never squeezes one image below this
+IMAGE_BUDGET_STEP_BYTES = 16 * 1024  # Split budgets are rounded down to this so derivatives stay cacheable
+REPORT_PIXEL_BUDGET = 200_000_000  # Pixels all images of one report may decode to (PDF pages are bounded by MAX_IMAGE_PX)
+FLAG_NEAR_DUPLICATES = True  # Log photos/attachments that look alike (identical ones are embedded once anyway)
+
+# Report data keys that hold lists of saved uploads
+UPLOAD_LIST_KEYS = ['photos', 'attendance_list', 'brochure', 'notice', 'feedback', 'impact']
+
+_executor = None
+_executor_workers = 0
+
+
+def split_budget(total, count):
+    """Share of a byte budget for one of count images (None if there is no budget)"""
+    if not total or not count:
+        return None
+    share = total // count
+    share -= share % IMAGE_BUDGET_STEP_BYTES
+    return max(IMAGE_MIN_BYTE_BUDGET, min(share, IMAGE_BYTE_BUDGET))
+
+
+def pixel_budget_errors(paths, budget=None):
+    """
+    Read the headers of image uploads (nothing is decoded) and check them
+    against MAX_IMAGE_PIXELS and the report's pixel budget. Returns a list of
+    (path, message) for uploads that must not be processed.
+    """
+    if budget is None:
+        budget = REPORT_PIXEL_BUDGET
+    errors = []
+    total = 0
+    for path in dict.fromkeys(paths):
+        if path.lower().endswith('.pdf') or not os.path.exists(path):
+            continue
+        try:
+            img, _ = open_for_decode(path)
+            with img:
+                check_decode_size(img, path)
+                pixels = img.size[0] * img.size[1]
+        except ImageTooLarge as e:
+            errors.append((path, str(e)))
+            continue
+        except Exception:
+            continue  # Unreadable files are reported by preprocessing
+        if total + pixels > budget:
+            errors.append((path, f"{os.path.basename(path)} exceeds the report's pixel budget "
+                                 f"({budget // 1_000_000} megapixels for all images)"))
+            continue
+        total += pixels
+    return errors
+
+
+def process_upload(path, byte_budget=None):
+    """Convert/resize one saved upload. Returns (assets, error, stats)."""
+    start = time.perf_counter()
+    is_pdf = path.lower().endswith('.pdf')
+    stats = {'pdf': is_pdf, 'vector': False, 'seconds': 0.0, 'bytes_in': 0, 'bytes_out': 0}
+    try:
+        if os.path.exists(path):
+            stats['bytes_in'] = os.path.getsize(path)
+        vector_pages = pdf_vector_pages(path) if is_pdf else None
+        if vector_pages:
+            # Born-digital PDFs are merged into the report as they are
+            images = vector_pages
+            stats['vector'] = True
+        elif is_pdf:
+            # Pages are already rendered at their final size; scans are re-encoded as 1-bit
+            page_paths = convert_pdf_to_images(path)
+            page_budget = split_budget(byte_budget, len(page_paths))
+            pages = [process_image(p, page_budget) for p in page_paths]
+            images = [page for page in pages if page]
+        else:
+            asset = process_image(path, byte_budget)
+            images = [asset] if asset else []
+        stats['bytes_out'] = sum(os.path.getsize(p) for p in {asset.path for asset in images})
+        return images, None, stats
+    except Exception as e:
+        return [], str(e), stats
+    finally:
+        stats['seconds'] = time.perf_counter() - start
+
+
+def record_upload_stats(images, stats):
+    """Add one upload's stats to the active report metrics"""
+    if stats['vector']:
+        report_metrics.add_time('read_pdfs', stats['seconds'])
+        report_metrics.count('pdfs_merged')
+        report_metrics.count('pdf_pages_merged', len(images))
+    elif stats['pdf']:
+        report_metrics.add_time('convert_pdfs', stats['seconds'])
+        report_metrics.count('pdfs_converted')
+        report_metrics.count('pdf_pages_produced', len(images))
+    else:
+        report_metrics.add_time('resize_images', stats['seconds'])
+        report_metrics.count('images_processed', len(images))
+    report_metrics.count('bytes_in', stats['bytes_in'])
+    report_metrics.count('bytes_out', stats['bytes_out'])
+
+
+def get_executor(max_workers):
+    """Return the shared process pool, recreating it if the size changed."""
+    global _executor, _executor_workers
+    if _executor is None or _executor_workers != max_workers:
+        shutdown_executor()
+        _executor = ProcessPoolExecutor(max_workers=max_workers)
+        _executor_workers = max_workers
+    return _executor
+
+
+def shutdown_executor(wait=False):
+    """Shut down the shared process pool (if any)."""
+    global _executor, _executor_workers
+    if _executor is not None:
+        _executor.shutdown(wait=wait, cancel_futures=True)
+    _executor = None
+    _executor_workers = 0
+
+
+def preprocess_uploads(paths, max_workers=None, byte_budget=None):
+    """
+    Preprocess saved uploads in parallel. byte_budget, if given, is the
+    encoded-size target for each upload (shared by the pages of a PDF).
+
+    Returns (results, errors): results[i] is the list of ProcessedAssets
+    for paths[i] (empty on failure), errors is a list of (path, message).
+    """
+    if max_workers is None:
+        max_workers = PREPROCESS_MAX_WORKERS
+    max_workers = max(1, min(max_workers, len(paths)))
+
+    if max_workers == 1:
+        outcomes = [process_upload(path, byte_budget) for path in paths]
+    else:
+        outcomes = []
+        try:
+            executor = get_executor(max_workers)
+            futures = [executor.submit(process_upload, path, byte_budget) for path in paths]
+        except Exception as e:
+            logger.warning(f"Preprocess pool unavailable, processing inline: {e}")
+            shutdown_executor()
+            futures = None
+
+        if futures is None:
+            outcomes = [process_upload(path, byte_budget) for path in paths]
+        else:
+            for path, future in zip(paths, futures):
+                try:
+                    outcomes.append(future.result(timeout=PREPROCESS_TIMEOUT_SECONDS))
+                except BrokenProcessPool as e:
+                    shutdown_executor()
+                    outcomes.append(([], f"worker crashed: {e}", None))
+                except Exception as e:
+                    future.cancel()
+                    outcomes.append(([], str(e) or e.__class__.__name__, None))
+
+    results = []
+    errors = []
+    for path, (images, error, stats) in zip(paths, outcomes):
+        if stats:
+            record_upload_stats(images, stats)
+        if error:
+            logger.error(f"Preprocessing failed for {path}: {error}")
+            errors.append((path, error))
+        results.append(images)
+    return results, errors
+
+
+def report_upload_paths(data):
+    """Saved upload paths referenced by report data, in report order"""
+    paths = [p['signature_upload'] for p in data.get('preparers', []) if p.get('signature_upload')]
+    if data.get('speaker_profile', {}).get('image_upload'):
+        paths.append(data['speaker_profile']['image_upload'])
+    for key in UPLOAD_LIST_KEYS:
+        paths.extend(data.get(key, []))
+    return paths
+
+
+def prepare_report_data(data, max_workers=None):
+    """
+    Replace saved upload paths in report data with ProcessedAssets.
+
+    Raw uploads live in preparers[i]['signature_upload'],
+    speaker_profile['image_upload'] and the UPLOAD_LIST_KEYS lists.
+    With REPORT_IMAGE_BUDGET_BYTES set, the budget is split between uploads.
+    Images over the pixel budgets are left out and reported as errors.
+    Returns (data, errors).
+    """
+    preparers = data.get('preparers', [])
+    profile = data.get('speaker_profile', {})
+    upload_paths = report_upload_paths(data)
+
+    with report_metrics.stage('preprocess'):
+        # Images over the pixel budget are rejected before any worker decodes them
+        errors = pixel_budget_errors(upload_paths)
+        rejected = {path for path, _ in errors}
+        upload_paths = [path for path in upload_paths if path not in rejected]
+        if rejected:
+            report_metrics.count('images_rejected', len(rejected))
+        byte_budget = split_budget(REPORT_IMAGE_BUDGET_BYTES, len(upload_paths))
+        results, upload_errors = preprocess_uploads(upload_paths, max_workers=max_workers, byte_budget=byte_budget)
+        errors.extend(upload_errors)
+    processed = dict(zip(upload_paths, results))
+
+    for preparer in preparers:
+        sig_path = preparer.pop('signature_upload', None)
+        if sig_path and processed.get(sig_path):
+            preparer['signature_path'] = processed[sig_path][0]
+    image_path = profile.pop('image_upload', None)
+    if image_path and processed.get(image_path):
+        profile['image_path'] = processed[image_path][0]
+    for key in UPLOAD_LIST_KEYS:
+        data[key] = [img for path in data.get(key, []) for img in processed.get(path, [])]
+
+    if FLAG_NEAR_DUPLICATES:
+        with report_metrics.stage('near_duplicates'):
+            pairs = near_duplicate_pairs([img for key in UPLOAD_LIST_KEYS for img in data[key]
+                                          if isinstance(img, ProcessedAsset)])
+        for first, second in pairs:
+            logger.info(f"Near-duplicate images in report: {first.path} ~ {second.path}")
+        report_metrics.count('near_duplicate_pairs', len(pairs))
+
+    return data, errors
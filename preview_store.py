@@ -0,0 +1,108 @@
+"""
+Page-thumbnail previews.
+
+Instead of sending the whole preview PDF back as base64, the preview PDF is
+stored once under a content-derived id and its pages are served as small,
+individually cacheable JPEG thumbnails. The browser can show page 1 while
+the remaining pages are still being rendered.
+"""
+import os
+import hashlib
+import logging
+import tempfile
+import importlib.util
+
+import image_cache
+
+logger = logging.getLogger('report_generator.report')
+
+# pdf2image pulls in PIL; only check that it is installed until a page is rendered
+THUMBNAILS_AVAILABLE = importlib.util.find_spec('pdf2image') is not None
+
+# =============================
+# CONFIGURATION
+# =============================
+PREVIEW_DIR = os.path.join('cache', 'previews')
+THUMBNAIL_WIDTHS = (240, 480, 960)  # Allowed widths, so cached variants stay few
+DEFAULT_THUMBNAIL_WIDTH = 480
+THUMBNAIL_QUALITY = 60
+PREVIEW_MAX_AGE_SECONDS = 86400  # Preview URLs are content-addressed
+COPY_CHUNK_BYTES = 256 * 1024
+
+
+def save_preview(user_id, pdf_file):
+    """Store a preview PDF read from a file object. Returns (preview_id, page_count)."""
+    from PyPDF2 import PdfReader
+
+    user_dir = os.path.join(PREVIEW_DIR, str(int(user_id)))
+    os.makedirs(user_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(prefix='.preview_', suffix='.pdf', dir=user_dir)
+    try:
+        # Copy in chunks while hashing, so the PDF is never read into memory whole
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter(lambda: pdf_file.read(COPY_CHUNK_BYTES), b''):
+                digest.update(chunk)
+                f.write(chunk)
+        preview_id = hashlib.sha256(f"{user_id}:{digest.hexdigest()}".encode('utf-8')).hexdigest()
+        path = preview_path(user_id, preview_id)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    page_count = len(PdfReader(path).pages)
+    return preview_id, page_count
+
+
+def is_preview_id(preview_id):
+    """Check that a preview id looks like one save_preview produced"""
+    return len(preview_id) == 64 and all(c in '0123456789abcdef' for c in preview_id)
+
+
+def preview_path(user_id, preview_id):
+    """Location of a stored preview PDF"""
+    return os.path.join(PREVIEW_DIR, str(int(user_id)), f"{preview_id}.pdf")
+
+
+def snap_thumbnail_width(width):
+    """Round a requested width to the nearest allowed thumbnail width"""
+    try:
+        width = int(width)
+    except (TypeError, ValueError):
+        return DEFAULT_THUMBNAIL_WIDTH
+    return min(THUMBNAIL_WIDTHS, key=lambda w: abs(w - width))
+
+
+def page_thumbnail(user_id, preview_id, page_no, width=DEFAULT_THUMBNAIL_WIDTH):
+    """Return the path of a JPEG thumbnail for one preview page, or None."""
+    if not THUMBNAILS_AVAILABLE:
+        return None
+    if not is_preview_id(preview_id):
+        return None
+    pdf_path = preview_path(user_id, preview_id)
+    if not os.path.exists(pdf_path):
+        return None
+
+    width = snap_thumbnail_width(width)
+    cache_key = image_cache.make_key(preview_id, op='preview_page', page=page_no,
+                                     width=width, quality=THUMBNAIL_QUALITY)
+    cached_path = image_cache.lookup(cache_key)
+    if cached_path:
+        return cached_path
+
+    from pdf2image import convert_from_path
+
+    try:
+        os.makedirs(image_cache.CACHE_DIR, exist_ok=True)
+        with tempfile.TemporaryDirectory(prefix='.thumb_', dir=image_cache.CACHE_DIR) as out_dir:
+            page_files = convert_from_path(
+                pdf_path, first_page=page_no, last_page=page_no, size=(width, None),
+                output_folder=out_dir, fmt='jpeg', paths_only=True,
+                jpegopt={'quality': THUMBNAIL_QUALITY, 'optimize': True, 'progressive': True}
+            )
+            if not page_files:
+                return None
+            return image_cache.put(cache_key, page_files[0], '.jpg')
+    except Exception as e:
+        logger.error(f"Preview thumbnail failed for {preview_id} page {page_no}: {e}", exc_info=True)
+        return None
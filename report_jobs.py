@@ -0,0 +1,320 @@
+"""
+Background report generation.
+
+/report validates the form and queues a job; a small pool of render worker
+processes claims queued jobs from SQLite, preprocesses the uploads, builds the
+PDF and stores it under REPORTS_DIR, named by the hash of its content. Admin
+spreadsheet batches (batch_reports.py) are queued as jobs of kind 'batch'. Job state lives in the database, so
+queued jobs survive a restart. Stored reports that nobody built, reused or
+downloaded for REPORT_RETENTION_SECONDS are deleted, together with job rows
+that finished before that; a later request for the same content renders it again.
+Old batch outputs and batch input folders expire the same way (expire_batches). A worker sends heartbeats while it runs a job;
+jobs whose worker stops sending them (it crashed) are requeued.
+
+Run workers standalone with:
+    python report_jobs.py [number_of_workers]
+"""
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import logging
+import threading
+import multiprocessing
+
+from database import (
+    create_report_job, create_batch_job, claim_report_job, finish_report_job, fail_report_job, heartbeat_report_job,
+    requeue_stale_report_jobs, save_signature, find_report_job, find_finished_report, delete_finished_report_jobs,
+    get_active_batch_ids
+)
+import upload_store
+
+logger = logging.getLogger('report_generator.report')
+
+# =============================
+# CONFIGURATION
+# =============================
+REPORTS_DIR = 'generated_reports'
+RENDER_WORKERS = 2
+POLL_INTERVAL_SECONDS = 1.0
+HEARTBEAT_INTERVAL_SECONDS = 30  # How often a worker confirms it is still running its job
+JOB_TIMEOUT_SECONDS = 180  # A running job without a heartbeat for this long is considered orphaned
+MAX_JOB_ATTEMPTS = 3
+UPLOAD_GC_INTERVAL_SECONDS = 300  # Idle workers sweep one batch of unreferenced uploads this often
+REPORT_RETENTION_SECONDS = 14 * 24 * 3600  # Stored reports not built, reused or downloaded for this long are deleted
+
+
+def stored_report(job):
+    """Return the job if its stored PDF still exists (refreshing its age for expire_reports), else None"""
+    if job and job['status'] == 'done' and job['result_path'] and upload_store.touch(job['result_path']):
+        return job
+    return None
+
+
+def expire_reports(max_age_seconds=REPORT_RETENTION_SECONDS, dry_run=False):
+    """
+    Delete stored reports untouched for max_age_seconds and the done or failed
+    job rows that finished before that. Returns files deleted, bytes reclaimed
+    and job rows deleted.
+    """
+    import upload_gc
+
+    stats = upload_gc.expire_entries(REPORTS_DIR, max_age_seconds, dry_run)
+    stats['jobs_deleted'] = 0 if dry_run else delete_finished_report_jobs(max_age_seconds)
+    return stats
+
+
+def enqueue_report(user_id, data):
+    """
+    Queue report data (with raw upload paths) for background generation.
+
+    Reports are stored by content key: a repeat submission returns the
+    user's pending or finished job, and data someone already rendered is
+    answered from storage without running the pipeline again.
+    """
+    from report_logic import report_content_key
+
+    content_key = report_content_key(data)
+    existing = find_report_job(user_id, content_key)
+    if existing and (existing['status'] != 'done' or stored_report(existing)):
+        logger.info(f"Report job reused - User: {user_id}, Job: {existing['id']}")
+        return existing['id']
+
+    job_id = create_report_job(user_id, data, content_key)
+    # Saving a signature is a side effect of rendering, so those jobs always run
+    wants_signature = any(p.get('save_signature') for p in data.get('preparers', []))
+    stored = None if wants_signature else stored_report(find_finished_report(content_key))
+    if stored:
+        finish_report_job(job_id, stored['result_path'], stored['filename'])
+        logger.info(f"Report served from storage - User: {user_id}, Job: {job_id}")
+    else:
+        logger.info(f"Report job queued - User: {user_id}, Job: {job_id}")
+    return job_id
+
+
+def heartbeat_loop(job_id, worker, stop):
+    """Send heartbeats for a running job until stop is set or the job is taken away"""
+    # Runs while the preprocess pool forks, so it never logs (a forked child
+    # would inherit the logging lock held by this thread)
+    while not stop.wait(HEARTBEAT_INTERVAL_SECONDS):
+        try:
+            if not heartbeat_report_job(job_id, worker):
+                return
+        except Exception:
+            continue  # Database busy; the next beat retries
+
+
+def start_heartbeat(job):
+    """Send heartbeats for a claimed job in a thread; set the returned event to stop"""
+    stop = threading.Event()
+    if job.get('worker'):
+        threading.Thread(target=heartbeat_loop, args=(job['id'], job['worker'], stop), daemon=True).start()
+    return stop
+
+
+def enqueue_batch(user_id, batch_id, sheet_path, force=False):
+    """
+    Queue a spreadsheet batch for a render worker. Returns the job id, or
+    None if the batch is already queued or running.
+    """
+    job_id = create_batch_job(user_id, batch_id, {'batch_id': batch_id, 'sheet_path': sheet_path, 'force': force})
+    if job_id:
+        logger.info(f"Batch job queued - User: {user_id}, Batch: {batch_id}, Job: {job_id}")
+    return job_id
+
+
+def run_batch_job(job):
+    """Render a spreadsheet batch; rows done by an earlier, interrupted run are skipped"""
+    import batch_reports
+
+    payload = json.loads(job['payload'])
+    output_dir = os.path.join(batch_reports.BATCH_DIR, payload['batch_id'])
+    stop_heartbeat = start_heartbeat(job)
+    try:
+        manifest = batch_reports.run_batch(payload['sheet_path'], output_dir, batch_reports.BATCH_INPUT_DIR,
+                                           force=payload.get('force', False), restrict=True)
+        finish_report_job(job['id'], os.path.abspath(os.path.join(output_dir, batch_reports.MANIFEST_NAME)),
+                          batch_reports.MANIFEST_NAME, manifest['summary'], worker=job.get('worker'))
+    except Exception as e:
+        logger.error(f"Batch job {job['id']} failed: {e}", exc_info=True)
+        fail_report_job(job['id'], str(e), worker=job.get('worker'))
+    finally:
+        stop_heartbeat.set()
+        # A sheet staged in the output directory is only needed until the run ends; resuming uploads it again
+        sheet_path = os.path.abspath(payload['sheet_path'])
+        if os.path.dirname(sheet_path) == os.path.abspath(output_dir) and os.path.exists(sheet_path):
+            os.remove(sheet_path)
+
+
+def expire_batches(dry_run=False):
+    """
+    Delete admin batch output directories (PDFs, manifest and staged sheets)
+    not written to for BATCH_RETENTION_SECONDS, and folders below
+    BATCH_INPUT_DIR not modified for BATCH_INPUT_RETENTION_SECONDS. Queued or
+    running batches keep their output, and no input is deleted while any batch
+    is queued or running. Returns the stats of both.
+    """
+    import batch_reports
+    import upload_gc
+
+    active = get_active_batch_ids()
+    stats = {'outputs': upload_gc.expire_entries(batch_reports.BATCH_DIR, batch_reports.BATCH_RETENTION_SECONDS,
+                                                 dry_run, keep=active)}
+    if active:
+        stats['inputs'] = {'deleted': 0, 'bytes_reclaimed': 0}
+    else:
+        stats['inputs'] = upload_gc.expire_entries(batch_reports.BATCH_INPUT_DIR,
+                                                   batch_reports.BATCH_INPUT_RETENTION_SECONDS, dry_run)
+    return stats
+
+
+def run_job(job):
+    """Preprocess uploads, build the PDF and store it for download"""
+    # Imported here so the gunicorn master can load this module cheaply
+    from preprocess import prepare_report_data
+    from report_logic import write_report_pdf
+    from report_metrics import GenerationMetrics
+    from logging_config import log_report_generation
+
+    job_id = job['id']
+    user_id = job['user_id']
+    worker = job.get('worker')
+    metrics = GenerationMetrics('report', user_id, job_id=job_id)
+    stop_heartbeat = start_heartbeat(job)
+    try:
+        with metrics.activate():
+            data = json.loads(job['payload'])
+            # Saved signatures keep the upload, not its resized copy (the derivative cache evicts those)
+            for preparer in data.get('preparers', []):
+                if preparer.pop('save_signature', False) and preparer.get('signature_upload'):
+                    save_signature(user_id, preparer['signature_upload'],
+                                   f"{preparer['name']} - {preparer['designation']}", False)
+
+            data, errors = prepare_report_data(data)
+            for path, message in errors:
+                logger.warning(f"Upload preprocessing failed - Job: {job_id}, File: {path}, Error: {message}")
+
+            # Build straight into the destination file; the PDF is never held in memory
+            os.makedirs(REPORTS_DIR, exist_ok=True)
+            # Builds are deterministic, so jobs with the same content share one file
+            result_path = os.path.abspath(os.path.join(REPORTS_DIR, f"{job.get('content_key') or job_id}.pdf"))
+            tmp_path = f"{result_path}.{job_id}.tmp"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    filename = write_report_pdf(data, f)
+                os.replace(tmp_path, result_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        metrics.log()
+        if finish_report_job(job_id, result_path, filename, metrics.as_dict(), worker=worker):
+            log_report_generation(user_id, success=True, filename=filename)
+        else:
+            logger.warning(f"Report job {job_id} was requeued while it ran; result left to the new attempt")
+    except Exception as e:
+        logger.error(f"Report job {job_id} failed: {e}", exc_info=True)
+        metrics.log()
+        if fail_report_job(job_id, str(e), worker=worker):
+            log_report_generation(user_id, success=False, error=e)
+    finally:
+        stop_heartbeat.set()
+
+
+def worker_loop(max_jobs=None):
+    """Claim and run queued jobs until stopped (or max_jobs have run)"""
+    worker_name = f"{socket.gethostname()}:{os.getpid()}"
+    logger.info(f"Render worker started: {worker_name}")
+    jobs_run = 0
+    last_requeue = 0
+    last_upload_gc = time.time()
+    while max_jobs is None or jobs_run < max_jobs:
+        try:
+            if time.time() - last_requeue > 60:
+                requeued = requeue_stale_report_jobs(JOB_TIMEOUT_SECONDS, MAX_JOB_ATTEMPTS)
+                if requeued:
+                    logger.warning(f"Requeued {requeued} orphaned report jobs")
+                last_requeue = time.time()
+
+            job = claim_report_job(worker_name)
+        except Exception as e:
+            logger.error(f"Render worker could not claim a job: {e}", exc_info=True)
+            job = None
+
+        if not job:
+            if max_jobs is not None:
+                break
+            if time.time() - last_upload_gc > UPLOAD_GC_INTERVAL_SECONDS:
+                try:
+                    import upload_gc
+                    import chunked_upload
+                    upload_gc.sweep()
+                    upload_gc.expire_previews()
+                    chunked_upload.expire_uploads()
+                    expire_reports()
+                    expire_batches()
+                except Exception as e:
+                    logger.error(f"Upload GC failed: {e}", exc_info=True)
+                last_upload_gc = time.time()
+            time.sleep(POLL_INTERVAL_SECONDS)
+            continue
+
+        if job.get('kind') == 'batch':
+            run_batch_job(job)
+        else:
+            run_job(job)
+        jobs_run += 1
+    return jobs_run
+
+
+def reset_inherited_signals():
+    """
+    Restore default signal handling in a worker forked from the gunicorn
+    master: its handlers only queue signals for the master's loop, so
+    terminate() would not stop the worker, and its SIGCHLD handler would
+    reap the worker's own preprocess pool.
+    """
+    for name in ('SIGTERM', 'SIGINT', 'SIGQUIT', 'SIGHUP', 'SIGCHLD'):
+        signal.signal(getattr(signal, name), signal.SIG_DFL)
+
+
+def render_worker_main():
+    """Entry point of a render worker process"""
+    reset_inherited_signals()
+    worker_loop()
+
+
+def start_render_workers(count=None):
+    """Start render worker processes; returns the Process objects"""
+    if count is None:
+        count = RENDER_WORKERS
+    processes = []
+    for i in range(count):
+        # Not daemonic: workers use their own process pool for image preprocessing
+        process = multiprocessing.Process(target=render_worker_main, name=f"report-render-{i}")
+        process.start()
+        processes.append(process)
+    return processes
+
+
+def stop_render_workers(processes):
+    """Terminate render worker processes"""
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join(timeout=10)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+    worker_count = int(sys.argv[1]) if len(sys.argv) > 1 else RENDER_WORKERS
+    workers = start_render_workers(worker_count)
+    print(f"Started {worker_count} render workers. Press Ctrl+C to stop.")
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        stop_render_workers(workers)
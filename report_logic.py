@@ -1,22 +1,37 @@
 import os
+import copy
+import json
+import struct
+import hashlib
 import logging
+import threading
+from contextlib import contextmanager
 from io import BytesIO
+from collections import OrderedDict
 from datetime import datetime
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import inch
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import (
-    SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak
+    SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak, Flowable
 )
 from reportlab.lib import colors
-from PIL import Image as PILImage
+from reportlab import rl_config
+from reportlab.pdfbase import pdfdoc
+from PIL import Image as PILImage, ImageChops
 import tempfile
+from PyPDF2 import PdfReader, PdfWriter, Transformation
+from PyPDF2.generic import ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject, NameObject, NumberObject
+import image_cache
+import report_metrics
+from image_settings import MAX_IMAGE_PX, COMPRESSION_QUALITY
+from report_templates import TEMPLATES, ACTIVITY_TEMPLATES
 
 # Setup logger
 logger = logging.getLogger('report_generator.report')
 
 try:
-    from pdf2image import convert_from_path
+    from pdf2image import convert_from_path, pdfinfo_from_path
     PDF2IMAGE_AVAILABLE = True
     logger.info("PDF2IMAGE library available - PDF conversion enabled")
 except ImportError:
@@ -28,9 +43,53 @@ except ImportError:
 # CONFIGURATION
 # =============================
 MAX_IMAGE_WIDTH_INCH = 6.0
-MAX_IMAGE_PX = 1200
 MAX_FILE_SIZE_MB = 10
-COMPRESSION_QUALITY = 75  # Lower quality for better compression
+MAX_IMAGE_PIXELS = 40_000_000  # Pixels one image may decode to (after DCT scaling), else it is rejected
+IMAGE_BYTE_BUDGET = 300 * 1024  # Target encoded size per embedded image
+JPEG_QUALITY_MIN = 40  # Quality never drops below this to meet the budget
+JPEG_SEARCH_STEPS = 5  # Quality probes per image (on a sample, not the full image)
+JPEG_SAMPLE_BAND = 64  # Size estimates encode every JPEG_SAMPLE_STRIDE-th band of rows
+JPEG_SAMPLE_STRIDE = 4
+JPEG_BUDGET_TOLERANCE = 0.1  # Overshoot allowed before one corrective re-encode
+DHASH_SIZE = 8  # Perceptual hash grid (DHASH_SIZE**2 bits)
+NEAR_DUPLICATE_DISTANCE = 4  # Max differing hash bits for two images to count as near-duplicates
+IMAGE_CODEC_VERSION = 1  # Bump when classification/encoding changes, to re-derive cached images
+COLOR_MIN_CHROMA = 24  # Channel spread above which a pixel counts as coloured
+PHOTO_MIN_COLOR_FRACTION = 0.01  # Fewer coloured pixels than this: the image is treated as grayscale
+SCAN_MAX_MIDTONES = 0.06  # Grayscale images with fewer mid-tone pixels than this are stored as 1-bit
+BILEVEL_THRESHOLD = 128
+LINEART_MAX_COLORS = 256  # Lossless sources with at most this many colours are stored as palette PNG
+JPEG_KEEP_MARKERS = {0xE0, 0xEE}  # APP0 (JFIF) and APP14 (Adobe colour transform); other APPn/COM are metadata
+RESIZE_REDUCING_GAP = 3.0  # Reduce-then-resample for non-JPEG sources
+PDF_RASTER_DPI = 200  # Upper bound; small pages are not rendered above this
+PDF_PAGE_BATCH = 8  # Pages rendered per poppler call (written to disk, never held in memory)
+PDF_SPOOL_MAX_BYTES = 8 * 1024 * 1024  # Reports larger than this are spooled to disk
+PDF_ATTACHMENT_MODE = 'auto'  # 'vector': merge uploaded PDF pages as is; 'raster': render them as images;
+                              # 'auto': merge born-digital PDFs, render scanned ones
+PDF_PAGE_MAX_HEIGHT_INCH = 9.5  # Must fit in the page frame
+PDF_PAGE_MIN_FIT = 0.75  # A merged PDF page shrinks at most this far to fit the rest of a page, else moves on
+REPORT_BUILD_VERSION = 4  # Bump when code changes what a report looks like, so stored reports are not reused
+NON_CONTENT_KEYS = {'save_signature'}  # Report data keys that do not affect the PDF
+
+# Settings that change a report's bytes; their values are part of report_content_key
+OUTPUT_SETTINGS = [
+    'MAX_IMAGE_WIDTH_INCH', 'MAX_IMAGE_PX', 'MAX_FILE_SIZE_MB', 'MAX_IMAGE_PIXELS', 'COMPRESSION_QUALITY',
+    'IMAGE_BYTE_BUDGET', 'JPEG_QUALITY_MIN', 'JPEG_SEARCH_STEPS', 'JPEG_SAMPLE_BAND', 'JPEG_SAMPLE_STRIDE',
+    'JPEG_BUDGET_TOLERANCE', 'IMAGE_CODEC_VERSION', 'COLOR_MIN_CHROMA', 'PHOTO_MIN_COLOR_FRACTION',
+    'SCAN_MAX_MIDTONES', 'BILEVEL_THRESHOLD', 'LINEART_MAX_COLORS', 'JPEG_KEEP_MARKERS', 'RESIZE_REDUCING_GAP',
+    'PDF_RASTER_DPI', 'PDF_ATTACHMENT_MODE', 'PDF_PAGE_MAX_HEIGHT_INCH', 'PDF_PAGE_MIN_FIT',
+    'BASE_FONT', 'BOLD_FONT', 'REPORTLAB_SETTINGS',
+]
+PREPROCESS_OUTPUT_SETTINGS = [
+    'REPORT_IMAGE_BUDGET_BYTES', 'IMAGE_MIN_BYTE_BUDGET', 'IMAGE_BUDGET_STEP_BYTES', 'REPORT_PIXEL_BUDGET',
+]
+
+# ReportLab options for report builds; rl_config is process-wide, so they are
+# applied around each build (see reportlab_settings) rather than at import
+REPORTLAB_SETTINGS = {
+    'useA85': 0,  # Image streams are binary already; ASCII85 would add 25% to every one of them
+}
+_reportlab_settings_lock = threading.Lock()
 
 BASE_FONT = "Times-Roman"
 BOLD_FONT = "Times-Bold"
@@ -82,26 +141,281 @@ styles.add(ParagraphStyle(
 # UTILITIES
 # =============================
 
-def ensure_image_resized(path):
-    """Resize and compress image if too large."""
+class Asset:
+    """Immutable, picklable record of a prepared upload. Subclasses name their
+    fields in __slots__ (path first); the object is usable as a path."""
+    __slots__ = ()
+
+    def __init__(self, *values):
+        if len(values) != len(self.__slots__):
+            raise TypeError(f"{type(self).__name__} takes {len(self.__slots__)} values, got {len(values)}")
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        return type(self), tuple(getattr(self, name) for name in self.__slots__)
+
+    def __fspath__(self):
+        return self.path
+
+    def __eq__(self, other):
+        return type(other) is type(self) and self.__reduce__() == other.__reduce__()
+
+    def __hash__(self):
+        return hash(self.__reduce__()[1])
+
+
+class ProcessedAsset(Asset):
+    """An image ready for embedding: final path, pixel size, mode and content hash."""
+    __slots__ = ('path', 'width', 'height', 'mode', 'digest')
+
+    def __repr__(self):
+        return f"ProcessedAsset({self.path!r}, {self.width}x{self.height}, {self.mode}, {self.digest[:12]})"
+
+
+class PdfPageAsset(Asset):
+    """One page of an uploaded PDF to merge as is: file, page index, displayed size in points, content hash."""
+    __slots__ = ('path', 'page', 'width', 'height', 'digest')
+
+    def __repr__(self):
+        return f"PdfPageAsset({self.path!r}, page {self.page}, {self.width:.0f}x{self.height:.0f}pt, {self.digest[:12]})"
+
+
+def asset_from_file(path, digest=None):
+    """Build a ProcessedAsset by reading an image header (no decode)."""
     try:
+        with PILImage.open(path) as img:
+            width, height = img.size
+            mode = img.mode
+        return ProcessedAsset(path, width, height, mode, digest or image_cache.file_digest(path))
+    except Exception as e:
+        logger.error(f"Cannot read image {path}: {e}")
+        return None
+
+
+def jpeg_size_sample(img):
+    """
+    Every JPEG_SAMPLE_STRIDE-th band of rows, stacked. Encoding this keeps the
+    image's local detail (unlike a downscale) at a fraction of the cost.
+    Returns (sample, scale) where encoded size * scale estimates the full size.
+    """
+    w, h = img.size
+    step = JPEG_SAMPLE_BAND * JPEG_SAMPLE_STRIDE
+    if h <= step:
+        return img, 1.0
+    bands = [(y, min(y + JPEG_SAMPLE_BAND, h)) for y in range(0, h, step)]
+    sample = PILImage.new(img.mode, (w, sum(bottom - top for top, bottom in bands)))
+    offset = 0
+    for top, bottom in bands:
+        sample.paste(img.crop((0, top, w, bottom)), (0, offset))
+        offset += bottom - top
+    return sample, h / float(sample.size[1])
+
+
+def jpeg_quality_for_budget(img, byte_budget):
+    """Highest quality in [JPEG_QUALITY_MIN, COMPRESSION_QUALITY] whose estimated size fits the budget"""
+    sample, scale = jpeg_size_sample(img)
+    
+    def estimate(quality):
+        buf = BytesIO()
+        sample.save(buf, 'JPEG', quality=quality)
+        return buf.tell() * scale
+    
+    low, high = JPEG_QUALITY_MIN, COMPRESSION_QUALITY
+    if estimate(high) <= byte_budget:
+        return high
+    # Bisect: low is the answer unless something higher is shown to fit
+    for _ in range(JPEG_SEARCH_STEPS - 1):
+        if high - low <= 1:
+            break
+        mid = (low + high) // 2
+        if estimate(mid) <= byte_budget:
+            low = mid
+        else:
+            high = mid
+    return low
+
+
+def save_jpeg_to_budget(img, path, byte_budget=IMAGE_BYTE_BUDGET):
+    """
+    Save an RGB image as JPEG aiming at byte_budget. Quality is chosen from
+    size estimates on a sample, so the full image is normally encoded once;
+    a second encode only happens if the estimate overshot. Returns the quality used.
+    """
+    quality = jpeg_quality_for_budget(img, byte_budget)
+    img.save(path, 'JPEG', quality=quality, optimize=True)
+    size = os.path.getsize(path)
+    if size > byte_budget * (1 + JPEG_BUDGET_TOLERANCE) and quality > JPEG_QUALITY_MIN:
+        # Scale the target by how far the estimate was off and re-encode once
+        corrected = jpeg_quality_for_budget(img, byte_budget * byte_budget / float(size))
+        if corrected < quality:
+            quality = corrected
+            img.save(path, 'JPEG', quality=quality, optimize=True)
+    return quality
+
+
+def classify_image(img, lossless):
+    """
+    Pick the encoding class of an RGB image: 'photo' (RGB JPEG), 'gray'
+    (grayscale JPEG), 'bilevel' (1-bit PNG) or 'lineart' (palette PNG, only
+    for lossless sources, whose exact colours are kept).
+    """
+    small = img.copy()
+    small.thumbnail((256, 256))
+    r, g, b = small.split()
+    spread = ImageChops.lighter(ImageChops.lighter(ImageChops.difference(r, g), ImageChops.difference(g, b)),
+                                ImageChops.difference(r, b))
+    histogram = spread.histogram()
+    colored = sum(histogram[COLOR_MIN_CHROMA:]) / float(small.size[0] * small.size[1])
+    if colored < PHOTO_MIN_COLOR_FRACTION:
+        # Mid-tones are measured at full resolution: downscaling turns text edges grey
+        gray = img.convert('L').histogram()
+        midtones = sum(gray[64:192]) / float(img.size[0] * img.size[1])
+        if midtones < SCAN_MAX_MIDTONES:
+            return 'bilevel'
+    if lossless and img.getcolors(LINEART_MAX_COLORS):
+        return 'lineart'
+    return 'photo' if colored >= PHOTO_MIN_COLOR_FRACTION else 'gray'
+
+
+def save_image_for_kind(img, kind, byte_budget):
+    """Encode an RGB image for its class (see classify_image). Returns (temp path, mode)."""
+    if kind in ('photo', 'gray'):
+        if kind == 'gray':
+            img = img.convert('L')
+        path = image_cache.new_temp_path('.jpg')
+        quality = save_jpeg_to_budget(img, path, byte_budget)
+        logger.debug(f"Encoded {kind} image at quality {quality}: {os.path.getsize(path)} bytes "
+                     f"(budget {byte_budget})")
+    else:
+        if kind == 'bilevel':
+            img = img.convert('L').point(lambda v: 255 if v >= BILEVEL_THRESHOLD else 0, mode='1')
+        else:
+            img = img.convert('P', palette=PILImage.Palette.ADAPTIVE, colors=LINEART_MAX_COLORS)
+        path = image_cache.new_temp_path('.png')
+        img.save(path, 'PNG', optimize=True)
+    return path, img.mode
+
+
+def strip_jpeg_metadata(path):
+    """
+    Copy a JPEG without EXIF/XMP/IPTC/ICC segments and comments; the image
+    data is copied byte for byte. Returns the copy's temp path, or None if
+    there was nothing to strip.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:2] != b'\xff\xd8':
+        return None
+    kept = [data[:2]]
+    stripped = 0
+    pos = 2
+    while pos + 4 <= len(data) and data[pos] == 0xFF:
+        marker = data[pos + 1]
+        if marker == 0xDA:  # Start of scan: the rest is image data
+            break
+        if marker == 0xFF:  # Fill byte
+            pos += 1
+            continue
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        segment = data[pos:pos + 2 + length]
+        if (0xE0 <= marker <= 0xEF and marker not in JPEG_KEEP_MARKERS) or marker == 0xFE:
+            stripped += len(segment)
+        else:
+            kept.append(segment)
+        pos += 2 + length
+    if not stripped or data[pos:pos + 2] != b'\xff\xda':
+        return None
+    kept.append(data[pos:])
+    new_path = image_cache.new_temp_path('.jpg')
+    with open(new_path, 'wb') as f:
+        f.write(b''.join(kept))
+    return new_path
+
+
+class ImageTooLarge(ValueError):
+    """An image that would decode to more pixels than the pixel budget allows"""
+
+
+def open_for_decode(path):
+    """
+    Open an image (header only) and, for JPEGs larger than MAX_IMAGE_PX, set
+    up DCT-scaled decoding. Returns (img, source size); img.size is the size
+    that will be decoded.
+    """
+    try:
+        img = PILImage.open(path)
+    except PILImage.DecompressionBombError as e:
+        raise ImageTooLarge(f"{os.path.basename(path)}: {e}")
+    w, h = img.size
+    # Large JPEGs: let the decoder scale by 1/2, 1/4 or 1/8 in the DCT domain
+    # so we never decode the full-resolution image just to throw it away
+    if img.format == 'JPEG' and (w > MAX_IMAGE_PX or h > MAX_IMAGE_PX):
+        ratio = min(MAX_IMAGE_PX / float(w), MAX_IMAGE_PX / float(h))
+        img.draft('RGB', (int(w * ratio), int(h * ratio)))
+    return img, (w, h)
+
+
+def check_decode_size(img, path):
+    """Raise ImageTooLarge if an image from open_for_decode would decode past MAX_IMAGE_PIXELS"""
+    w, h = img.size
+    if w * h > MAX_IMAGE_PIXELS:
+        raise ImageTooLarge(f"{os.path.basename(path)} is {w}x{h} pixels; images may have at most "
+                            f"{MAX_IMAGE_PIXELS // 1_000_000} megapixels")
+
+
+def process_image(path, byte_budget=None):
+    """
+    Resize, classify and encode an image for embedding. Returns a
+    ProcessedAsset or None; raises ImageTooLarge for images over the pixel budget.
+    """
+    try:
+        if isinstance(path, ProcessedAsset):
+            return path
         if not path or not os.path.exists(path):
             logger.warning(f"Image path does not exist: {path}")
             return None
+        if byte_budget is None:
+            byte_budget = IMAGE_BYTE_BUDGET
+        
+        # Derivatives are cached by content hash + processing parameters
+        source_digest = image_cache.file_digest(path)
+        cache_key = image_cache.make_key(
+            source_digest, op='resize', decode='draft', max_px=MAX_IMAGE_PX, max_file_mb=MAX_FILE_SIZE_MB,
+            quality=COMPRESSION_QUALITY, min_quality=JPEG_QUALITY_MIN, byte_budget=byte_budget,
+            codec=IMAGE_CODEC_VERSION
+        )
+        cached_path, cached_meta = image_cache.lookup_with_meta(cache_key)
+        if cached_path:
+            if cached_meta and 'width' in cached_meta:
+                return ProcessedAsset(cached_path, cached_meta['width'], cached_meta['height'],
+                                      cached_meta['mode'], cached_meta['digest'])
+            return asset_from_file(cached_path)
+        cached_meta = image_cache.get_meta(cache_key)
+        if cached_meta and cached_meta.get('passthrough'):
+            if 'width' in cached_meta:
+                return ProcessedAsset(path, cached_meta['width'], cached_meta['height'],
+                                      cached_meta['mode'], source_digest)
+            return asset_from_file(path, source_digest)
         
         # Check file size
-        file_size_mb = os.path.getsize(path) / (1024 * 1024)
+        file_size = os.path.getsize(path)
+        file_size_mb = file_size / (1024 * 1024)
         
-        img = PILImage.open(path)
-        original_w, original_h = img.size
+        # The header is checked against the pixel budget before anything is decoded
+        img, (original_w, original_h) = open_for_decode(path)
+        original_mode = img.mode
+        original_format = img.format
+        check_decode_size(img, path)
         
-        # Convert RGBA to RGB if necessary (for JPEG compatibility)
-        if img.mode in ('RGBA', 'LA', 'P'):
-            background = PILImage.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-            img = background
+        # Resize before flattening transparency, so only the small image is copied
+        if img.mode in ('P', 'PA'):
+            img = img.convert('RGBA' if img.mode == 'PA' or 'transparency' in img.info else 'RGB')
+        elif img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            img = img.convert('RGB')
         
         w, h = img.size
         
@@ -110,36 +424,150 @@ def ensure_image_resized(path):
         if w > MAX_IMAGE_PX or h > MAX_IMAGE_PX:
             ratio = min(MAX_IMAGE_PX / float(w), MAX_IMAGE_PX / float(h))
             new_size = (int(w * ratio), int(h * ratio))
-            img = img.resize(new_size, PILImage.LANCZOS)
+            # reducing_gap does a cheap integer reduce before the LANCZOS pass
+            img = img.resize(new_size, PILImage.LANCZOS, reducing_gap=RESIZE_REDUCING_GAP)
             w, h = new_size
             needs_resize = True
         
-        # Always compress if file size is too large or if we resized
-        if file_size_mb > MAX_FILE_SIZE_MB or needs_resize or w > MAX_IMAGE_PX or h > MAX_IMAGE_PX:
-            new_path = f"{os.path.splitext(path)[0]}_resized.jpg"
-            # Save with compression - use lower quality if file is very large
-            quality = COMPRESSION_QUALITY
-            if file_size_mb > 5:  # If original file > 5MB, use more compression
-                quality = 60
-            elif file_size_mb > 2:  # If original file > 2MB, use moderate compression
-                quality = 70
-            
-            img.save(new_path, 'JPEG', quality=quality, optimize=True)
-            
-            # Verify the resized file is reasonable
-            new_size_mb = os.path.getsize(new_path) / (1024 * 1024)
-            if new_size_mb > 5:  # If still too large, compress more
-                img.save(new_path, 'JPEG', quality=50, optimize=True)
-            
-            return new_path
+        # Flatten transparency onto white (for JPEG compatibility)
+        if img.mode in ('RGBA', 'LA'):
+            background = PILImage.new('RGB', img.size, (255, 255, 255))
+            background.paste(img.convert('RGBA'), mask=img.getchannel('A'))
+            img = background
+        
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        kind = classify_image(img, lossless=original_format != 'JPEG')
         
-        return path
+        # JPEGs that are small enough keep their image data (re-encoding would only
+        # lose quality) unless they are bilevel scans; only their metadata is dropped.
+        # Everything else is re-encoded for its class, which also drops metadata.
+        over_budget = original_format == 'JPEG' and file_size > byte_budget
+        must_encode = (file_size_mb > MAX_FILE_SIZE_MB or needs_resize or over_budget
+                       or original_w > MAX_IMAGE_PX or original_h > MAX_IMAGE_PX)
+        if original_format == 'JPEG' and not must_encode and kind != 'bilevel':
+            new_path, mode = strip_jpeg_metadata(path), original_mode
+            if new_path is None:
+                image_cache.put_meta(cache_key, {'passthrough': True, 'width': original_w, 'height': original_h,
+                                                 'mode': original_mode, 'source': source_digest})
+                return ProcessedAsset(path, original_w, original_h, original_mode, source_digest)
+        else:
+            new_path, mode = save_image_for_kind(img, kind, byte_budget)
+        
+        meta = {'width': w, 'height': h, 'mode': mode, 'kind': kind, 'digest': image_cache.file_digest(new_path),
+                'source': source_digest}
+        final_path = image_cache.put(cache_key, new_path, os.path.splitext(new_path)[1], meta)
+        return ProcessedAsset(final_path, w, h, mode, meta['digest'])
+    except ImageTooLarge:
+        raise
     except Exception as e:
-        print(f"Image resize error for {path}: {e}")
-        import traceback
-        traceback.print_exc()
-        # Return original path as fallback, but log the error
-        return path
+        logger.error(f"Image resize error for {path}: {e}", exc_info=True)
+        # Fall back to the original file if it is a readable image
+        return asset_from_file(path)
+
+
+def image_dhash(asset):
+    """64-bit difference hash of an image (cached by content), for spotting near-duplicates"""
+    cache_key = image_cache.make_key(asset.digest, op='dhash', size=DHASH_SIZE)
+    meta = image_cache.get_meta(cache_key)
+    if meta:
+        return meta['dhash']
+    with PILImage.open(asset.path) as img:
+        img.draft('L', (DHASH_SIZE * 8, DHASH_SIZE * 8))
+        small = img.convert('L').resize((DHASH_SIZE + 1, DHASH_SIZE), PILImage.BILINEAR)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(DHASH_SIZE):
+        for col in range(DHASH_SIZE):
+            left = pixels[row * (DHASH_SIZE + 1) + col]
+            bits = (bits << 1) | (left > pixels[row * (DHASH_SIZE + 1) + col + 1])
+    image_cache.put_meta(cache_key, {'dhash': bits, 'source': asset.digest})
+    return bits
+
+
+def near_duplicate_pairs(assets):
+    """Pairs of different images that look alike (dHash distance <= NEAR_DUPLICATE_DISTANCE)"""
+    unique = list({asset.digest: asset for asset in assets}.values())
+    hashes = []
+    for asset in unique:
+        try:
+            hashes.append((asset, image_dhash(asset)))
+        except Exception as e:
+            logger.warning(f"Could not hash image {asset.path}: {e}")
+    pairs = []
+    for i, (first, first_hash) in enumerate(hashes):
+        for second, second_hash in hashes[i + 1:]:
+            if bin(first_hash ^ second_hash).count('1') <= NEAR_DUPLICATE_DISTANCE:
+                pairs.append((first, second))
+    return pairs
+
+
+def ensure_image_resized(path):
+    """Resize and compress image if too large. Returns the path to embed."""
+    asset = process_image(path)
+    return asset.path if asset else None
+
+
+def pdf_page_dpis(pdf_path):
+    """Return, per page, the DPI that renders its long side at MAX_IMAGE_PX (or None if unreadable)."""
+    try:
+        reader = PdfReader(pdf_path)
+        dpis = []
+        for page in reader.pages:
+            box = page.mediabox
+            long_side_pt = max(float(box.width), float(box.height))
+            if long_side_pt <= 0:
+                dpis.append(None)
+                continue
+            # One pixel of headroom so rounding inside poppler never exceeds MAX_IMAGE_PX
+            dpi = min(PDF_RASTER_DPI, (MAX_IMAGE_PX - 1) * 72.0 / long_side_pt)
+            dpis.append(round(dpi, 2))
+        return dpis
+    except Exception as e:
+        logger.warning(f"Could not read page sizes from {pdf_path}: {e}")
+        return None
+
+
+def looks_scanned(page):
+    """A page that shows images but has no fonts of its own is taken for a scan"""
+    resources = page.get('/Resources')
+    resources = resources.get_object() if resources is not None else {}
+    if resources.get('/Font'):
+        return False
+    xobjects = resources.get('/XObject')
+    xobjects = xobjects.get_object() if xobjects is not None else {}
+    return any(xobjects[name].get_object().get('/Subtype') == '/Image' for name in xobjects)
+
+
+def pdf_vector_pages(pdf_path):
+    """
+    PdfPageAssets for the pages of an uploaded PDF, or None if it should be
+    rasterized instead (PDF_ATTACHMENT_MODE, scans in 'auto' mode, encrypted
+    or unreadable files).
+    """
+    if PDF_ATTACHMENT_MODE == 'raster' and PDF2IMAGE_AVAILABLE:
+        return None
+    try:
+        reader = PdfReader(pdf_path)
+        if reader.is_encrypted:
+            return None
+        digest = image_cache.file_digest(pdf_path)
+        pages = []
+        for index, page in enumerate(reader.pages):
+            # Scans are smaller rendered and re-encoded; without poppler merging is the only option
+            if PDF_ATTACHMENT_MODE == 'auto' and PDF2IMAGE_AVAILABLE and looks_scanned(page):
+                return None
+            box = page.cropbox
+            width, height = float(box.width), float(box.height)
+            if page.rotation % 180:
+                width, height = height, width
+            if width <= 0 or height <= 0:
+                return None
+            pages.append(PdfPageAsset(pdf_path, index, width, height, digest))
+        return pages or None
+    except Exception as e:
+        logger.warning(f"Cannot merge PDF {pdf_path}, rasterizing instead: {e}")
+        return None
 
 
 def convert_pdf_to_images(pdf_path):
@@ -152,64 +580,365 @@ def convert_pdf_to_images(pdf_path):
         if not pdf_path or not os.path.exists(pdf_path):
             return []
         
-        # Convert PDF pages to images
-        images = convert_from_path(pdf_path, dpi=200)
+        # Reuse previously rasterized pages for identical PDFs
+        digest = image_cache.file_digest(pdf_path)
+        params = {'dpi': PDF_RASTER_DPI, 'max_px': MAX_IMAGE_PX, 'quality': COMPRESSION_QUALITY, 'render': 'fit'}
+        manifest_key = image_cache.make_key(digest, op='pdf_pages', **params)
+        manifest = image_cache.get_meta(manifest_key)
+        if manifest:
+            cached_paths = [image_cache.lookup(k) for k in manifest.get('pages', [])]
+            if all(cached_paths):
+                return cached_paths
+        
+        # Render each page straight at the resolution that lands it at MAX_IMAGE_PX,
+        # letting poppler write the final JPEG (no oversized render, resample or re-encode)
+        page_dpis = pdf_page_dpis(pdf_path)
+        if page_dpis is None:
+            page_dpis = [None] * pdfinfo_from_path(pdf_path)["Pages"]
         image_paths = []
+        page_keys = []
+        runs = []
         
-        base_path = os.path.splitext(pdf_path)[0]
+        for page_no, dpi in enumerate(page_dpis, 1):
+            page_key = image_cache.make_key(digest, op='pdf_page', page=page_no - 1, **params)
+            page_keys.append(page_key)
+            cached_path = image_cache.lookup(page_key)
+            image_paths.append(cached_path)
+            if cached_path:
+                continue
+            # Group consecutive pages that share a DPI into one poppler call
+            run = runs[-1] if runs else None
+            if run and run['dpi'] == dpi and run['last'] == page_no - 1 and run['last'] - run['first'] + 1 < PDF_PAGE_BATCH:
+                run['last'] = page_no
+            else:
+                runs.append({'first': page_no, 'last': page_no, 'dpi': dpi})
         
-        for i, img in enumerate(images):
-            # Convert to RGB if necessary
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Resize if too large
-            w, h = img.size
-            if w > MAX_IMAGE_PX or h > MAX_IMAGE_PX:
-                ratio = min(MAX_IMAGE_PX / float(w), MAX_IMAGE_PX / float(h))
-                new_size = (int(w * ratio), int(h * ratio))
-                img = img.resize(new_size, PILImage.LANCZOS)
-            
-            # Save as JPEG with compression
-            image_path = f"{base_path}_page_{i+1}.jpg"
-            img.save(image_path, 'JPEG', quality=COMPRESSION_QUALITY, optimize=True)
-            image_paths.append(image_path)
+        os.makedirs(image_cache.CACHE_DIR, exist_ok=True)
+        for run in runs:
+            # dpi=None means the page size is unknown: fit the long side instead
+            render_args = {'size': MAX_IMAGE_PX} if run['dpi'] is None else {'dpi': run['dpi']}
+            with tempfile.TemporaryDirectory(prefix='.pdf_', dir=image_cache.CACHE_DIR) as out_dir:
+                page_files = convert_from_path(
+                    pdf_path, first_page=run['first'], last_page=run['last'],
+                    output_folder=out_dir, fmt='jpeg', paths_only=True,
+                    jpegopt={'quality': COMPRESSION_QUALITY, 'optimize': True},
+                    **render_args
+                )
+                for page_no, page_file in zip(range(run['first'], run['last'] + 1), page_files):
+                    image_paths[page_no - 1] = image_cache.put(page_keys[page_no - 1], page_file, '.jpg',
+                                                               {'source': digest})
         
+        image_paths = [p for p in image_paths if p]
+        image_cache.put_meta(manifest_key, {'pages': page_keys, 'source': digest})
         return image_paths
     except Exception as e:
         logger.error(f"PDF to image conversion error for {pdf_path}: {e}", exc_info=True)
         return []
 
 
+class AssetImage(Image):
+    """ReportLab Image for a ProcessedAsset; the size comes from the asset, so the
+    file is only read when the page is drawn."""
+
+    def __init__(self, asset, width, height, hAlign='CENTER'):
+        self.hAlign = hAlign
+        self._mask = 'auto'
+        self._drawing = None
+        self._file = self.filename = asset.path
+        self._dpi = False
+        self._img = None
+        self.imageWidth = asset.width
+        self.imageHeight = asset.height
+        self.asset = asset
+        self._setup(width, height, 'direct', 0)
+
+    def draw(self):
+        # One image object per content hash, so identical images are stored once
+        canv = self.canv
+        if not canv.hasForm(self.asset.digest):
+            try:
+                xobject = AssetXObject(self.asset)
+            except ValueError:
+                # Not a file we wrote (e.g. an original that failed processing): let ReportLab decode it
+                return Image.draw(self)
+            # The canvas has no public call to register a ready-made XObject; the
+            # document's addForm is what drawImage uses (ReportLab is pinned in requirements.txt)
+            canv._doc.addForm(self.asset.digest, xobject)
+        else:
+            report_metrics.count('images_shared')
+        canv.saveState()
+        canv.translate(getattr(self, '_offs_x', 0), getattr(self, '_offs_y', 0))
+        canv.scale(self.drawWidth, self.drawHeight)
+        canv.doForm(self.asset.digest)
+        canv.restoreState()
+
+
+class AssetXObject(pdfdoc.PDFImageXObject):
+    """
+    PDF image for a processed file, stored without decoding or re-encoding:
+    JPEGs as DCT (RGB or gray), PNGs (1-bit, palette, gray, RGB) as their
+    own Flate data with PNG predictors. Raises ValueError for anything else.
+    """
+
+    def __init__(self, asset):
+        pdfdoc.PDFImageXObject.__init__(self, asset.digest)
+        self.mask = None
+        self.palette = None
+        self.decode_parms = None
+        with open(asset.path, 'rb') as f:
+            data = f.read()
+        if data[:2] == b'\xff\xd8':
+            if not self.loadImageFromJPEG(BytesIO(data)):
+                raise ValueError(f"Unreadable JPEG: {asset.path}")
+        elif data[:8] == b'\x89PNG\r\n\x1a\n':
+            self.load_png(data)
+        else:
+            raise ValueError(f"Not a JPEG or PNG: {asset.path}")
+
+    def load_png(self, data):
+        """Take the image data of a non-interlaced PNG without alpha as is"""
+        pos = 8
+        header = None
+        idat = []
+        while pos + 8 <= len(data):
+            length, chunk_type = struct.unpack('>I4s', data[pos:pos + 8])
+            body = data[pos + 8:pos + 8 + length]
+            if chunk_type == b'IHDR':
+                header = struct.unpack('>IIBBBBB', body)
+            elif chunk_type == b'PLTE':
+                self.palette = body
+            elif chunk_type == b'IDAT':
+                idat.append(body)
+            elif chunk_type == b'IEND':
+                break
+            pos += 12 + length
+        if header is None:
+            raise ValueError("PNG without header")
+        width, height, bits, color_type, _, _, interlace = header
+        channels = {0: 1, 2: 3, 3: 1}.get(color_type)  # Gray, RGB, palette
+        if channels is None or interlace or bits == 16 or (color_type == 3 and not self.palette):
+            raise ValueError("PNG type not embeddable as is")
+        self.width, self.height, self.bitsPerComponent = width, height, bits
+        self.colorSpace = 'DeviceRGB' if color_type == 2 else 'DeviceGray'
+        self.decode_parms = {'Predictor': 15, 'Colors': channels, 'BitsPerComponent': bits, 'Columns': width}
+        self._filters = ('FlateDecode',)
+        self.streamContent = b''.join(idat)
+
+    def format(self, document):
+        stream = pdfdoc.PDFStream(content=self.streamContent)
+        d = stream.dictionary
+        d['Type'] = pdfdoc.PDFName('XObject')
+        d['Subtype'] = pdfdoc.PDFName('Image')
+        d['Width'] = self.width
+        d['Height'] = self.height
+        d['BitsPerComponent'] = self.bitsPerComponent
+        if self.palette:
+            d['ColorSpace'] = pdfdoc.PDFArray([pdfdoc.PDFName('Indexed'), pdfdoc.PDFName('DeviceRGB'),
+                                               len(self.palette) // 3 - 1, pdfdoc.PDFText(self.palette)])
+        else:
+            d['ColorSpace'] = pdfdoc.PDFName(self.colorSpace)
+        if self.colorSpace == 'DeviceCMYK' and getattr(self, '_dotrans', 0):
+            d['Decode'] = pdfdoc.PDFArray([1, 0, 1, 0, 1, 0, 1, 0])
+        d['Filter'] = pdfdoc.PDFArray([pdfdoc.PDFName(f) for f in self._filters])
+        if self.decode_parms:
+            d['DecodeParms'] = pdfdoc.PDFDictionary(self.decode_parms)
+        return stream.format(document)
+
+
+class PdfPageFlowable(Flowable):
+    """Reserves a frame-sized box for a page of an uploaded PDF. The page is
+    drawn into it by merge_pdf_pages once the report is built."""
+
+    def __init__(self, asset, max_width_inch=MAX_IMAGE_WIDTH_INCH):
+        Flowable.__init__(self)
+        self.asset = asset
+        self.max_width = max_width_inch * inch
+        self.hAlign = 'CENTER'
+
+    def wrap(self, availWidth, availHeight):
+        width_scale = min(availWidth, self.max_width) / self.asset.width
+        full_scale = min(width_scale, PDF_PAGE_MAX_HEIGHT_INCH * inch / self.asset.height)
+        # Shrink a little to use the rest of this page, or keep the size and start a new one
+        scale = min(full_scale, availHeight / self.asset.height)
+        if scale < PDF_PAGE_MIN_FIT * full_scale:
+            scale = full_scale
+        self.width, self.height = self.asset.width * scale, self.asset.height * scale
+        return self.width, self.height
+
+    def draw(self):
+        canv = self.canv
+        x, y = canv.absolutePosition(0, 0)
+        placements = canv.__dict__.setdefault('_pdf_page_placements', [])
+        placements.append((canv.getPageNumber(), self.asset, x, y, self.width, self.height))
+        canv.setStrokeColor(colors.lightgrey)
+        canv.setLineWidth(0.5)
+        canv.rect(0, 0, self.width, self.height)
+
+
+def pdf_page_transform(page, x, y, width, height):
+    """Transformation that maps a page's visible box (and /Rotate) onto a rectangle"""
+    box = page.cropbox
+    box_w, box_h = float(box.width), float(box.height)
+    rotation = page.rotation % 360
+    transform = Transformation().translate(-float(box.left), -float(box.bottom))
+    if rotation == 90:
+        transform = transform.rotate(-90).translate(0, box_w)
+    elif rotation == 180:
+        transform = transform.rotate(180).translate(box_w, box_h)
+    elif rotation == 270:
+        transform = transform.rotate(90).translate(box_h, 0)
+    shown_w = box_h if rotation in (90, 270) else box_w
+    return transform.scale(width / shown_w).translate(x, y)
+
+
+def pdf_page_form(writer, page):
+    """Copy a PDF page into writer as a Form XObject clipped to its visible box. Returns its reference."""
+    contents = page['/Contents'] if '/Contents' in page else None
+    if contents is None:
+        data = b''
+    elif isinstance(contents, ArrayObject):
+        data = b'\n'.join(stream.get_object().get_data() for stream in contents)
+    else:
+        data = contents.get_data()
+    form = DecodedStreamObject()
+    form.set_data(data)
+    form = form.flate_encode()
+    box = page.cropbox
+    form.update({
+        NameObject('/Type'): NameObject('/XObject'),
+        NameObject('/Subtype'): NameObject('/Form'),
+        NameObject('/BBox'): ArrayObject([FloatObject(v) for v in (box.left, box.bottom, box.right, box.top)]),
+    })
+    if '/Resources' in page:
+        form[NameObject('/Resources')] = page.raw_get('/Resources').clone(writer)
+    if '/Group' in page:
+        form[NameObject('/Group')] = page.raw_get('/Group').clone(writer)
+    return pdf_add_object(writer, form)
+
+
+def pdf_add_object(writer, obj):
+    """Store a new indirect object (a stream) in writer and return its reference. PyPDF2 3.0
+    has no public call for this, so the version is pinned in requirements.txt."""
+    return writer._add_object(obj)
+
+
+def pdf_page_links(page, transform):
+    """
+    Web links of a PDF page, moved to where the page is drawn. Returns (links, dropped):
+    other annotations (internal links, form fields, comments) refer to the source
+    document or need more than a position change, so they are only counted.
+    """
+    links = []
+    dropped = 0
+    for annot in (page['/Annots'] if '/Annots' in page else None) or []:
+        annot = annot.get_object()
+        action = annot['/A'].get_object() if '/A' in annot else None
+        if annot.get('/Subtype') != '/Link' or not action or action.get('/S') != '/URI':
+            dropped += 1
+            continue
+        left, bottom, right, top = (float(v) for v in annot['/Rect'])
+        corners = [transform.apply_on(point) for point in
+                   ((left, bottom), (left, top), (right, bottom), (right, top))]
+        xs, ys = [p[0] for p in corners], [p[1] for p in corners]
+        link = DictionaryObject({
+            NameObject('/Type'): NameObject('/Annot'),
+            NameObject('/Subtype'): NameObject('/Link'),
+            NameObject('/Rect'): ArrayObject([FloatObject(f"{v:.4f}") for v in (min(xs), min(ys), max(xs), max(ys))]),
+            NameObject('/Border'): ArrayObject([NumberObject(0)] * 3),
+            NameObject('/A'): DictionaryObject({
+                NameObject('/S'): NameObject('/URI'),
+                NameObject('/URI'): action['/URI'].get_object(),
+            }),
+        })
+        links.append(link)
+    return links, dropped
+
+
+def merge_pdf_pages(report_file, placements, output):
+    """Draw uploaded PDF pages into the boxes reserved for them in a built report"""
+    report_file.seek(0)
+    report = PdfReader(report_file)
+    writer = PdfWriter()
+    writer.append_pages_from_reader(report)
+    if report.metadata:
+        writer.add_metadata(report.metadata)
+    readers = {}
+    forms = {}
+    placed = {}
+    for page_number, asset, x, y, width, height in placements:
+        if asset.path not in readers:
+            readers[asset.path] = PdfReader(asset.path)
+        source = readers[asset.path].pages[asset.page]
+        # A page used twice is stored once
+        key = (asset.digest, asset.page)
+        if key not in forms:
+            forms[key] = pdf_page_form(writer, source)
+        
+        target = writer.pages[page_number - 1]
+        count = placed.get(page_number, 0)
+        placed[page_number] = count + 1
+        name = f"/UploadedPage{count}"
+        resources = target['/Resources'] if '/Resources' in target else None
+        resources = DictionaryObject({k: resources.raw_get(k) for k in resources}) if resources else DictionaryObject()
+        xobjects = resources['/XObject'] if '/XObject' in resources else None
+        xobjects = DictionaryObject({k: xobjects.raw_get(k) for k in xobjects}) if xobjects else DictionaryObject()
+        xobjects[NameObject(name)] = forms[key]
+        resources[NameObject('/XObject')] = xobjects
+        target[NameObject('/Resources')] = resources
+        
+        # Report content is isolated in q/Q so the page is drawn in default coordinates
+        transform = pdf_page_transform(source, x, y, width, height)
+        ctm = ' '.join(f"{v:.6f}" for v in transform.ctm)
+        before, after = DecodedStreamObject(), DecodedStreamObject()
+        before.set_data(b'q')
+        after.set_data(f"Q q {ctm} cm {name} Do Q".encode('ascii'))
+        contents = target.raw_get('/Contents') if '/Contents' in target else ArrayObject()
+        contents = list(contents.get_object()) if isinstance(contents.get_object(), ArrayObject) else [contents]
+        target[NameObject('/Contents')] = ArrayObject(
+            [pdf_add_object(writer, before)] + contents + [pdf_add_object(writer, after)])
+        
+        links, dropped = pdf_page_links(source, transform)
+        for link in links:
+            writer.add_annotation(page_number - 1, link)
+        if dropped:
+            logger.warning(f"{asset.path} page {asset.page + 1}: {dropped} annotation(s) other than "
+                           f"web links not kept in the report")
+            report_metrics.count('pdf_annotations_dropped', dropped)
+    writer.write(output)
+
+
 def image_flowable(path, max_width_inch=MAX_IMAGE_WIDTH_INCH):
-    """Return ReportLab Image flowable scaled to max width."""
+    """Return ReportLab Image flowable scaled to max width (accepts a path, a ProcessedAsset
+    or a PdfPageAsset, which becomes a full-width PDF page)."""
     if not path or not os.path.exists(path):
         return None
+    if isinstance(path, PdfPageAsset):
+        report_metrics.count('pdf_pages_embedded')
+        return PdfPageFlowable(path, max_width_inch)
     try:
-        # Ensure image is resized first (in case it wasn't already)
-        resized_path = ensure_image_resized(path)
-        if not resized_path:
+        # Paths that were not preprocessed are resized here
+        asset = process_image(path)
+        if not asset:
             return None
+        report_metrics.count('images_embedded')
         
         max_w_pts = max_width_inch * 72
-        img = Image(resized_path)
-        iw, ih = img.drawWidth, img.drawHeight
+        draw_w, draw_h = float(asset.width), float(asset.height)
         
         # Additional safety check - if still too large, scale down
-        if iw > max_w_pts:
-            scale = max_w_pts / iw
-            img.drawWidth *= scale
-            img.drawHeight *= scale
+        if draw_w > max_w_pts:
+            scale = max_w_pts / draw_w
+            draw_w *= scale
+            draw_h *= scale
         
         # Ensure reasonable size limits (max 8 inches height)
         max_h_pts = 8 * 72
-        if img.drawHeight > max_h_pts:
-            scale = max_h_pts / img.drawHeight
-            img.drawWidth *= scale
-            img.drawHeight *= scale
+        if draw_h > max_h_pts:
+            scale = max_h_pts / draw_h
+            draw_w *= scale
+            draw_h *= scale
         
-        img.hAlign = 'CENTER'
-        return img
+        return AssetImage(asset, draw_w, draw_h, hAlign='CENTER')
     except Exception as e:
         logger.error(f"Error creating image flowable for {path}: {e}", exc_info=True)
         return None
@@ -243,13 +972,43 @@ def format_synopsis_text(text, format_type="plain"):
     
     return text
 
+KV_TABLE_STYLE = TableStyle([
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 6),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+    ('TOPPADDING', (0, 0), (-1, -1), 4),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+])
+LABEL_CACHE_SIZE = 256
+_label_paragraphs = {}
+
+
+def label_paragraph(text):
+    """Key-column Paragraph for a label; parsed once, copied per use."""
+    text = str(text)
+    label = _label_paragraphs.get(text)
+    if label is None:
+        if len(_label_paragraphs) >= LABEL_CACHE_SIZE:
+            _label_paragraphs.clear()
+        label = _label_paragraphs[text] = Paragraph(text, styles['TableKey'])
+    # Layout stores wrap state on the flowable, so each table cell gets its own copy
+    return copy.copy(label)
+
+
 def make_table_from_dict(dct, colWidths=[2.5 * inch, 4.5 * inch]):
     """Create a consistent table layout for key-value pairs."""
     if not dct:
         return []
+    with report_metrics.stage('tables'):
+        return _make_table_from_dict(dct, colWidths)
+
+
+def _make_table_from_dict(dct, colWidths):
+    """Build the key-value table (timed by make_table_from_dict)"""
     data = []
     for k, v in dct.items():
-        keyp = Paragraph(str(k), styles['TableKey'])
+        keyp = label_paragraph(k)
         # Escape HTML and preserve newlines for formatted text
         v_escaped = str(v).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
         # Convert newlines to <br/> for ReportLab
@@ -257,14 +1016,7 @@ def make_table_from_dict(dct, colWidths=[2.5 * inch, 4.5 * inch]):
         valp = Paragraph(v_escaped, styles['TableValue'])
         data.append([keyp, valp])
     tbl = Table(data, colWidths=colWidths, hAlign='LEFT')
-    tbl.setStyle(TableStyle([
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 6),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 0), (-1, -1), 4),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-    ]))
+    tbl.setStyle(KV_TABLE_STYLE)
     return [tbl, Spacer(1, 0.12 * inch)]
 
 
@@ -324,198 +1076,391 @@ def add_page_number(canvas, doc):
 
 
 # =============================
-# MAIN PDF GENERATION
+# REPORT SECTIONS
 # =============================
+# Layouts are declared in report_templates.py and compiled here once, at
+# import. Each section type turns a section spec into a builder that turns
+# one slice of the report data into flowables; headings and labels are
+# built once and copied per report. Keeping sections independent lets the
+# preview engine rebuild only the sections whose inputs changed.
 
-def generate_report_pdf(data):
-    """Generate PDF report with comprehensive error handling"""
-    try:
-        logger.info("Starting PDF report generation")
-    buffer = BytesIO()
-    story = []
+def compile_header_section(spec):
+    """University header lines and report title"""
+    lines = [Paragraph(text, styles[style]) for text, style in spec['lines']]
+    title = Paragraph(spec['title'], styles['CenteredBold'])
 
-    # HEADER
-        try:
-    story.append(Paragraph("CHRIST (Deemed to be University), Bangalore", styles['HeaderMain']))
-    story.append(Paragraph("School of Engineering and Technology", styles['HeaderSub']))
-    story.append(Paragraph("Department of AI, ML & Data Science", styles['HeaderSub']))
-    story.append(Spacer(1, 0.3 * inch))
-    story.append(Paragraph("<b>Activity Report</b>", styles['CenteredBold']))
-    story.append(Spacer(1, 0.2 * inch))
-        except Exception as e:
-            logger.error(f"Error creating header: {e}", exc_info=True)
-            raise
+    def build_header_section(data, general_info):
+        story = [copy.copy(line) for line in lines]
+        story.append(Spacer(1, 0.3 * inch))
+        story.append(copy.copy(title))
+        story.append(Spacer(1, 0.2 * inch))
+        return story
+    return [], build_header_section
 
-    # GENERAL INFORMATION
-    story.append(Paragraph("General Information", styles['SectionTitle']))
-    general_info = data.get("general_info", {})
-    format_date_and_time(general_info)
-    story.extend(make_table_from_dict(general_info))
-
-    # SPEAKER DETAILS
-    story.append(Paragraph("Speaker/Guest/Presenter Details", styles['SectionTitle']))
-    for sp in data.get("speakers", []):
-        speaker_info = {
-            "Name": sp.get("name", ""),
-            "Title/Position": sp.get("title", ""),
-            "Organization": sp.get("organization", ""),
-            "Contact Info": sp.get("contact", ""),
-            "Title of Presentation": sp.get("presentation_title", "")
-        }
-        story.extend(make_table_from_dict(speaker_info))
-
-    # PARTICIPANTS
-    story.append(Paragraph("Participants profile", styles['SectionTitle']))
-    for p in data.get("participants", []):
-        pdata = {
-            "Type of Participants": p.get("type", ""),
-            "No. of Participants": p.get("count", "")
-        }
-        story.extend(make_table_from_dict(pdata))
-
-    # SYNOPSIS (TABLE FORMAT)
-    story.append(Paragraph("Synopsis of the Activity (Description)", styles['SectionTitle']))
-    synopsis = data.get("synopsis", {})
-    syn_dict = {}
-        
-        # Format highlights
-    if synopsis.get("highlights"):
-            highlights_text = format_synopsis_text(
-                synopsis["highlights"], 
-                synopsis.get("highlights_format", "plain")
-            )
-            syn_dict["Highlights of the Activity"] = highlights_text
-        
-        # Format key takeaways
-    if synopsis.get("key_takeaways"):
-            takeaways_text = format_synopsis_text(
-                synopsis["key_takeaways"],
-                synopsis.get("key_takeaways_format", "plain")
-            )
-            syn_dict["Key Takeaways"] = takeaways_text
-        
-        # Format summary
-    if synopsis.get("summary"):
-            summary_text = format_synopsis_text(
-                synopsis["summary"],
-                synopsis.get("summary_format", "plain")
-            )
-            syn_dict["Summary of the Activity"] = summary_text
-        
-        # Format follow-up
-    if synopsis.get("follow_up"):
-            followup_text = format_synopsis_text(
-                synopsis["follow_up"],
-                synopsis.get("follow_up_format", "plain")
-            )
-            syn_dict["Follow-up plan"] = followup_text
-        
-    story.extend(make_table_from_dict(syn_dict))
-
-    # REPORT PREPARED BY
-    story.append(Paragraph("Report prepared by", styles['SectionTitle']))
-    for p in data.get("preparers", []):
-        pdata = {
-            "Name of the Organiser": p.get("name", ""),
-            "Designation/Title": p.get("designation", "")
-        }
-        story.extend(make_table_from_dict(pdata))
-        if p.get("signature_path"):
-            sig = image_flowable(p.get("signature_path"), 1.5)
-            if sig:
-                story.append(Paragraph("Digital Signature:", styles['TableKey']))
-                story.append(sig)
-                story.append(Spacer(1, 0.2 * inch))
-
-    # SPEAKER PROFILE
-    story.append(Paragraph("Speaker Profile", styles['SectionTitle']))
-    profile = data.get("speaker_profile", {})
-    if profile.get("bio"):
-        story.append(Paragraph(profile["bio"], styles['NormalText']))
-        story.append(Spacer(1, 0.15 * inch))
-    if profile.get("image_path"):
-        img = image_flowable(profile["image_path"], 2.5)
-        if img:
-            story.append(img)
+
+def compile_info_table_section(spec):
+    """Table of the (formatted) general information"""
+    title = Paragraph(spec['title'], styles['SectionTitle'])
+
+    def build_info_table_section(data, general_info):
+        return [copy.copy(title)] + make_table_from_dict(general_info)
+    return ['general_info'], build_info_table_section
+
+
+def compile_record_tables_section(spec):
+    """One key-value table per record in a list (speakers, participants...)"""
+    title = Paragraph(spec['title'], styles['SectionTitle'])
+    source = spec['source']
+    fields = list(spec['fields'])
+    signature = spec.get('signature')
+    if signature:
+        signature_label = Paragraph(signature['label'], styles['TableKey'])
+
+    def build_record_tables_section(data, general_info):
+        story = [copy.copy(title)]
+        for record in data.get(source, []):
+            story.extend(make_table_from_dict({label: record.get(key, "") for label, key in fields}))
+            if signature and record.get(signature['key']):
+                sig = image_flowable(record.get(signature['key']), signature['width_inch'])
+                if sig:
+                    story.append(copy.copy(signature_label))
+                    story.append(sig)
+                    story.append(Spacer(1, 0.2 * inch))
+        return story
+    return [source], build_record_tables_section
+
+
+def compile_text_fields_section(spec):
+    """One table of the non-empty text fields of a dict (synopsis)"""
+    title = Paragraph(spec['title'], styles['SectionTitle'])
+    source = spec['source']
+    fields = list(spec['fields'])
+
+    def build_text_fields_section(data, general_info):
+        values = data.get(source, {})
+        rows = {}
+        for label, key in fields:
+            if values.get(key):
+                rows[label] = format_synopsis_text(values[key], values.get(f"{key}_format", "plain"))
+        return [copy.copy(title)] + make_table_from_dict(rows)
+    return [source], build_text_fields_section
+
+
+def compile_profile_section(spec):
+    """Free text followed by an image (speaker profile)"""
+    title = Paragraph(spec['title'], styles['SectionTitle'])
+    source = spec['source']
+
+    def build_profile_section(data, general_info):
+        story = [copy.copy(title)]
+        profile = data.get(source, {})
+        if profile.get(spec['text_key']):
+            story.append(Paragraph(profile[spec['text_key']], styles['NormalText']))
             story.append(Spacer(1, 0.15 * inch))
+        if profile.get(spec['image_key']):
+            img = image_flowable(profile[spec['image_key']], spec['image_width_inch'])
+            if img:
+                story.append(img)
+                story.append(Spacer(1, 0.15 * inch))
+        return story
+    return [source], build_profile_section
+
+
+def compile_photos_section(spec):
+    """Activity photos on a new page, titled with the activity type and date"""
+    title = Paragraph(spec['title'], styles['PhotoHeading'])
+    empty = Paragraph(spec['empty_text'], styles['NormalText'])
+    source = spec['source']
 
-    # PHOTOS SECTION
-    photos = data.get("photos", [])
-    if photos:
-        story.append(PageBreak())
-            title = general_info.get("Activity Type", "")
+    def build_photos_section(data, general_info):
+        photos = data.get(source, [])
+        if not photos:
+            return [copy.copy(empty)]
+        story = [PageBreak(), copy.copy(title)]
+        activity_type = general_info.get("Activity Type", "")
         date_display = general_info.get("Date/s", "")
-        story.append(Paragraph("Photos of the activity", styles["PhotoHeading"]))
-            if title and date_display:
-        story.append(Paragraph(f"({title} – {date_display})", styles["PhotoHeading"]))
+        if activity_type and date_display:
+            story.append(Paragraph(f"({activity_type} – {date_display})", styles["PhotoHeading"]))
         story.append(Spacer(1, 0.2 * inch))
-
         for p in photos:
             img = image_flowable(p)
             if img:
                 story.append(img)
                 story.append(Spacer(1, 0.25 * inch))
+        return story
+    return [source, 'general_info'], build_photos_section
+
+
+def compile_attachments_section(spec):
+    """Uploaded documents (attendance, brochure...) on a new page"""
+    title = Paragraph(spec['title'], styles['PhotoHeading'])
+    source = spec['source']
+
+    def build_attachments_section(data, general_info):
+        story = []
+        section_files = data.get(source, [])
+        if section_files:
+            story.append(PageBreak())
+            story.append(copy.copy(title))
+            story.append(Spacer(1, 0.2 * inch))
+            for file_path in section_files:
+                img = image_flowable(file_path)
+                if img:
+                    story.append(img)
+                    story.append(Spacer(1, 0.25 * inch))
+        return story
+    return [source], build_attachments_section
+
+
+SECTION_TYPES = {
+    'header': compile_header_section,
+    'info_table': compile_info_table_section,
+    'record_tables': compile_record_tables_section,
+    'text_fields': compile_text_fields_section,
+    'profile': compile_profile_section,
+    'photos': compile_photos_section,
+    'attachments': compile_attachments_section,
+}
+
+
+def compile_template(template):
+    """Compile a template into [(name, data keys the section depends on, builder)] in report order"""
+    sections = []
+    for spec in template:
+        input_keys, builder = SECTION_TYPES[spec['type']](spec)
+        sections.append((spec['name'], input_keys, builder))
+    return sections
+
+
+COMPILED_TEMPLATES = {name: compile_template(template) for name, template in TEMPLATES.items()}
+REPORT_SECTIONS = COMPILED_TEMPLATES['default']
+
+
+def template_for(general_info):
+    """Return (template name, compiled sections) for a report's activity type"""
+    name = ACTIVITY_TEMPLATES.get(general_info.get("Activity Type"), 'default')
+    if name not in COMPILED_TEMPLATES:
+        logger.warning(f"Unknown report template {name}, using default")
+        name = 'default'
+    return name, COMPILED_TEMPLATES[name]
+
+
+# =============================
+# SECTION CACHE (LIVE PREVIEW)
+# =============================
+SECTION_CACHE_SIZE = 64  # Sections kept per process
+_section_cache = OrderedDict()
+
+
+def section_fingerprint(name, inputs):
+    """Hash a section's inputs, including the content of any files they reference."""
+    digests = []
+
+    def collect(value):
+        if isinstance(value, dict):
+            for v in value.values():
+                collect(v)
+        elif isinstance(value, (list, tuple)):
+            for v in value:
+                collect(v)
+        elif isinstance(value, ProcessedAsset):
+            digests.append(value.digest)
+        elif isinstance(value, PdfPageAsset):
+            digests.append(f"{value.digest}:{value.page}")
+        elif isinstance(value, str) and value and os.path.isfile(value):
+            digests.append(image_cache.file_digest(value))
+
+    collect(inputs)
+    payload = json.dumps({'section': name, 'inputs': inputs, 'files': digests}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def canonical_report_value(value):
+    """Normalize report data for hashing: sorted keys, files replaced by their content hash"""
+    if isinstance(value, dict):
+        return {str(k): canonical_report_value(v) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))
+                if k not in NON_CONTENT_KEYS}
+    if isinstance(value, (list, tuple)):
+        return [canonical_report_value(v) for v in value]
+    if isinstance(value, ProcessedAsset):
+        return {'file_sha256': value.digest}
+    if isinstance(value, PdfPageAsset):
+        return {'file_sha256': value.digest, 'page': value.page}
+    if isinstance(value, str) and value and os.path.isfile(value):
+        return {'file_sha256': image_cache.file_digest(value)}
+    return value
+
+
+@contextmanager
+def reportlab_settings():
+    """Apply REPORTLAB_SETTINGS for one document build, then restore the previous values"""
+    with _reportlab_settings_lock:  # Builds on other threads must not see (or undo) them halfway
+        saved = {name: getattr(rl_config, name) for name in REPORTLAB_SETTINGS}
+        try:
+            for name, value in REPORTLAB_SETTINGS.items():
+                setattr(rl_config, name, value)
+            yield
+        finally:
+            for name, value in saved.items():
+                setattr(rl_config, name, value)
+
+
+def output_settings():
+    """Current values of every setting that changes a report's bytes, and the report templates"""
+    import preprocess  # Imports this module, so it cannot be imported at the top
+
+    settings = {name: globals()[name] for name in OUTPUT_SETTINGS}
+    settings.update({name: getattr(preprocess, name) for name in PREPROCESS_OUTPUT_SETTINGS})
+    settings['JPEG_KEEP_MARKERS'] = sorted(settings['JPEG_KEEP_MARKERS'])
+    settings['templates'] = [TEMPLATES, ACTIVITY_TEMPLATES]
+    return settings
+
+
+def report_content_key(data):
+    """Hash everything that determines a report's bytes (data, referenced files, build settings)"""
+    payload = json.dumps({
+        'version': REPORT_BUILD_VERSION,
+        'settings': output_settings(),
+        'data': canonical_report_value(data)
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def build_section_cached(name, inputs, builder, data, general_info):
+    """Return a section's flowables, rebuilding only if its inputs changed. Returns (flowables, rebuilt)."""
+    key = section_fingerprint(name, inputs)
+    cached = _section_cache.get(key)
+    rebuilt = cached is None
+    if rebuilt:
+        cached = builder(data, general_info)
+        _section_cache[key] = cached
+        while len(_section_cache) > SECTION_CACHE_SIZE:
+            _section_cache.popitem(last=False)
     else:
-        story.append(Paragraph("No photos available.", styles["NormalText"]))
-
-        # NEW SECTIONS: Attendance List, Brochure, Notice, Feedback, Impact
-        section_titles = {
-            'attendance_list': 'Attendance List',
-            'brochure': 'Brochure',
-            'notice': 'Notice for Approval',
-            'feedback': 'Feedback Analysis',
-            'impact': 'Impact Analysis'
-        }
-        
-        for section_key, section_title in section_titles.items():
-            section_files = data.get(section_key, [])
-            if section_files:
-                story.append(PageBreak())
-                story.append(Paragraph(section_title, styles["PhotoHeading"]))
-                story.append(Spacer(1, 0.2 * inch))
-                
-                for file_path in section_files:
-                    img = image_flowable(file_path)
-                    if img:
-                        story.append(img)
-                        story.append(Spacer(1, 0.25 * inch))
-
-    # BUILD
+        _section_cache.move_to_end(key)
+    # Layout stores wrap and split state on every flowable, including the Paragraphs
+    # inside table cells, so each build gets its own deep copy. Only the (read-only)
+    # paragraph styles are shared.
+    memo = {id(style): style for style in styles.byName.values()}
+    return copy.deepcopy(cached, memo), rebuilt
+
+
+# =============================
+# MAIN PDF GENERATION
+# =============================
+
+def write_report_pdf(data, output, use_section_cache=False):
+    """Build the PDF report into a writable binary file object. Returns the filename."""
+    try:
+        logger.info("Starting PDF report generation")
+        story = []
+
+        general_info = dict(data.get("general_info", {}))
+        format_date_and_time(general_info)
+
+        template_name, sections = template_for(general_info)
+        rebuilt = []
+        for name, input_keys, builder in sections:
+            try:
+                with report_metrics.stage(f'section:{name}'):
+                    if use_section_cache:
+                        inputs = {key: data.get(key) for key in input_keys}
+                        inputs['template'] = template_name
+                        flowables, was_rebuilt = build_section_cached(name, inputs, builder, data, general_info)
+                        if was_rebuilt:
+                            rebuilt.append(name)
+                    else:
+                        flowables = builder(data, general_info)
+                story.extend(flowables)
+            except Exception as e:
+                logger.error(f"Error creating {name} section: {e}", exc_info=True)
+                raise
+        if use_section_cache:
+            logger.info(f"Preview sections rebuilt: {', '.join(rebuilt) or 'none'}")
+            report_metrics.count('sections_rebuilt', len(rebuilt))
+
+        # BUILD
+        # Uploaded PDF pages are merged into a first build of the report
+        merge_pages = any(isinstance(f, PdfPageFlowable) for f in story)
+        target = tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_MAX_BYTES) if merge_pages else output
         try:
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        leftMargin=0.9 * inch,
-        rightMargin=0.9 * inch,
-        topMargin=0.9 * inch,
-        bottomMargin=0.9 * inch
-    )
-    doc.build(story, onFirstPage=add_page_number, onLaterPages=add_page_number)
-    pdf = buffer.getvalue()
-    buffer.close()
-            logger.info(f"PDF built successfully, size: {len(pdf)} bytes")
+            doc = SimpleDocTemplate(
+                target,
+                pagesize=A4,
+                leftMargin=0.9 * inch,
+                rightMargin=0.9 * inch,
+                topMargin=0.9 * inch,
+                bottomMargin=0.9 * inch,
+                invariant=1  # Fixed timestamps and document ID: same input, same bytes
+            )
+            with report_metrics.stage('doc_build'), reportlab_settings():
+                doc.build(story, onFirstPage=add_page_number, onLaterPages=add_page_number)
+            if merge_pages:
+                with report_metrics.stage('merge_pdf_pages'):
+                    merge_pdf_pages(target, getattr(doc.canv, '_pdf_page_placements', []), output)
+            report_metrics.count('pages', doc.page)
+            report_metrics.count('pdf_bytes', output.tell())
+            logger.info(f"PDF built successfully, size: {output.tell()} bytes")
         except Exception as e:
-            buffer.close()
             logger.error(f"Error building PDF: {e}", exc_info=True)
             raise
+        finally:
+            if merge_pages:
+                target.close()
 
-    # construct filename like Workshop_Title_Date.pdf
+        # construct filename like Workshop_Title_Date.pdf
         try:
-    title_words = (
-        general_info.get("Title of the Activity", "Activity")
-        .replace(":", "")
-        .replace("/", "")
-        .replace(" ", "")
-    )
-    date_field = general_info.get("Date/s", "").replace(" ", "").replace("–", "_")
-    filename = f"Workshop_{title_words}_{date_field}.pdf"
+            title_words = (
+                general_info.get("Title of the Activity", "Activity")
+                .replace(":", "")
+                .replace("/", "")
+                .replace(" ", "")
+            )
+            date_field = general_info.get("Date/s", "").replace(" ", "").replace("–", "_")
+            filename = f"Workshop_{title_words}_{date_field}.pdf"
         except Exception as e:
             logger.warning(f"Error constructing filename: {e}, using default")
             filename = f"ActivityReport_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
 
         logger.info(f"Report generated successfully: {filename}")
-    return pdf, filename
+        return filename
         
     except Exception as e:
-        logger.error(f"Critical error in generate_report_pdf: {e}", exc_info=True)
+        logger.error(f"Critical error in write_report_pdf: {e}", exc_info=True)
         raise
+
+
+def generate_report_pdf(data, use_section_cache=False):
+    """Generate PDF report in memory. Returns (pdf_bytes, filename)."""
+    buffer = BytesIO()
+    try:
+        filename = write_report_pdf(data, buffer, use_section_cache)
+        return buffer.getvalue(), filename
+    finally:
+        buffer.close()
+
+
+def spool_report_pdf(data, use_section_cache=False):
+    """
+    Generate PDF report into a spooled temporary file that moves to disk
+    once it grows past PDF_SPOOL_MAX_BYTES. Returns (file, filename) with
+    the file rewound; the caller closes it.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_MAX_BYTES)
+    try:
+        filename = write_report_pdf(data, spool, use_section_cache)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool, filename
+
+
+def generate_preview_pdf(data):
+    """Generate a live preview, reusing flowables of sections that did not change"""
+    return generate_report_pdf(data, use_section_cache=True)
+
+
+def spool_preview_pdf(data):
+    """Spooled variant of generate_preview_pdf. Returns (file, filename)."""
+    return spool_report_pdf(data, use_section_cache=True)
@@ -0,0 +1,116 @@
+"""
+Per-stage timings and counters for report generation.
+
+A GenerationMetrics object collects the time spent in each stage (upload
+preprocessing, PDF rasterization, section building, tables, doc.build...)
+and counters (images processed, bytes in/out, pages produced) for one
+report or preview. Code inside the pipeline records into the active
+metrics through stage() and count(), which do nothing when none is active:
+
+    metrics = GenerationMetrics('preview', user_id)
+    with metrics.activate():
+        ...
+    metrics.log()
+    metrics.as_dict()
+
+Stages may nest (tables are timed inside their section), and stages timed
+in preprocessing workers are summed across workers, so stage times can add
+up to more than the total.
+"""
+import json
+import time
+import logging
+import contextvars
+from contextlib import contextmanager
+from collections import OrderedDict
+
+logger = logging.getLogger('report_generator.report')
+
+_active = contextvars.ContextVar('report_metrics', default=None)
+
+
+class GenerationMetrics:
+    """Timings and counters for one report generation"""
+
+    def __init__(self, kind, user_id=None, **tags):
+        self.kind = kind
+        self.user_id = user_id
+        self.tags = tags
+        self.stages = OrderedDict()
+        self.counters = OrderedDict()
+        self.started = time.perf_counter()
+        self.total = None
+
+    def add_time(self, name, seconds):
+        """Add seconds to a stage"""
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name, amount=1):
+        """Increase a counter"""
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block as (part of) a stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    @contextmanager
+    def activate(self):
+        """Make this the metrics that stage() and count() record into"""
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+            self.total = time.perf_counter() - self.started
+
+    def as_dict(self):
+        """Plain-dict view, rounded for logging and storage"""
+        total = self.total if self.total is not None else time.perf_counter() - self.started
+        return {
+            'kind': self.kind,
+            'user_id': self.user_id,
+            **self.tags,
+            'total_s': round(total, 4),
+            'stages_s': {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            'counters': dict(self.counters),
+        }
+
+    def log(self):
+        """Write the metrics as one structured line to the report logger"""
+        logger.info(f"Report metrics - User: {self.user_id}, Kind: {self.kind}, "
+                    f"Metrics: {json.dumps(self.as_dict(), sort_keys=True)}")
+
+
+def current():
+    """The active GenerationMetrics, or None"""
+    return _active.get()
+
+
+@contextmanager
+def stage(name):
+    """Time a block into the active metrics (if any)"""
+    metrics = _active.get()
+    if metrics is None:
+        yield
+    else:
+        with metrics.stage(name):
+            yield
+
+
+def add_time(name, seconds):
+    """Add seconds to a stage of the active metrics (if any)"""
+    metrics = _active.get()
+    if metrics is not None:
+        metrics.add_time(name, seconds)
+
+
+def count(name, amount=1):
+    """Increase a counter of the active metrics (if any)"""
+    metrics = _active.get()
+    if metrics is not None:
+        metrics.count(name, amount)
@@ -0,0 +1,88 @@
+"""
+Declarative report layouts.
+
+A template is an ordered list of sections. Each section names a section
+type (see SECTION_TYPES in report_logic.py), the report data it reads and
+its headings/labels. report_logic compiles every template once at import
+into section builders with pre-built headings, label paragraphs and table
+styles, so adding or reordering a section is a change here only.
+
+Activity types without an entry in ACTIVITY_TEMPLATES use 'default'.
+"""
+
+DEFAULT_TEMPLATE = [
+    {
+        'name': 'header', 'type': 'header',
+        'lines': [
+            ("CHRIST (Deemed to be University), Bangalore", 'HeaderMain'),
+            ("School of Engineering and Technology", 'HeaderSub'),
+            ("Department of AI, ML & Data Science", 'HeaderSub'),
+        ],
+        'title': "<b>Activity Report</b>",
+    },
+    {
+        'name': 'general_info', 'type': 'info_table',
+        'title': "General Information",
+    },
+    {
+        'name': 'speakers', 'type': 'record_tables', 'source': 'speakers',
+        'title': "Speaker/Guest/Presenter Details",
+        'fields': [
+            ("Name", 'name'),
+            ("Title/Position", 'title'),
+            ("Organization", 'organization'),
+            ("Contact Info", 'contact'),
+            ("Title of Presentation", 'presentation_title'),
+        ],
+    },
+    {
+        'name': 'participants', 'type': 'record_tables', 'source': 'participants',
+        'title': "Participants profile",
+        'fields': [
+            ("Type of Participants", 'type'),
+            ("No. of Participants", 'count'),
+        ],
+    },
+    {
+        'name': 'synopsis', 'type': 'text_fields', 'source': 'synopsis',
+        'title': "Synopsis of the Activity (Description)",
+        # (label, text key); '<key>_format' selects plain/bullet/numbered
+        'fields': [
+            ("Highlights of the Activity", 'highlights'),
+            ("Key Takeaways", 'key_takeaways'),
+            ("Summary of the Activity", 'summary'),
+            ("Follow-up plan", 'follow_up'),
+        ],
+    },
+    {
+        'name': 'preparers', 'type': 'record_tables', 'source': 'preparers',
+        'title': "Report prepared by",
+        'fields': [
+            ("Name of the Organiser", 'name'),
+            ("Designation/Title", 'designation'),
+        ],
+        'signature': {'key': 'signature_path', 'label': "Digital Signature:", 'width_inch': 1.5},
+    },
+    {
+        'name': 'speaker_profile', 'type': 'profile', 'source': 'speaker_profile',
+        'title': "Speaker Profile",
+        'text_key': 'bio', 'image_key': 'image_path', 'image_width_inch': 2.5,
+    },
+    {
+        'name': 'photos', 'type': 'photos', 'source': 'photos',
+        'title': "Photos of the activity",
+        'empty_text': "No photos available.",
+    },
+    {'name': 'attendance_list', 'type': 'attachments', 'source': 'attendance_list', 'title': "Attendance List"},
+    {'name': 'brochure', 'type': 'attachments', 'source': 'brochure', 'title': "Brochure"},
+    {'name': 'notice', 'type': 'attachments', 'source': 'notice', 'title': "Notice for Approval"},
+    {'name': 'feedback', 'type': 'attachments', 'source': 'feedback', 'title': "Feedback Analysis"},
+    {'name': 'impact', 'type': 'attachments', 'source': 'impact', 'title': "Impact Analysis"},
+]
+
+TEMPLATES = {
+    'default': DEFAULT_TEMPLATE,
+}
+
+# Activity Type -> template name
+ACTIVITY_TEMPLATES = {}
@@ -8,14 +8,40 @@ import unittest
 from datetime import datetime
 import tempfile
 import shutil
+import json
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from database import init_db, create_user, verify_user, save_draft, get_user_drafts
-from report_logic import generate_report_pdf, ensure_image_resized, convert_pdf_to_images, image_flowable
+from report_logic import generate_report_pdf, ensure_image_resized, convert_pdf_to_images, image_flowable, pdf_page_dpis
+import report_logic
+import image_cache
+from preprocess import preprocess_uploads
+import report_jobs
+import preview_store
+from database import get_report_job
 from PIL import Image
 import io
+import database
+
+_saved_locations = None
+
+
+def setUpModule():
+    """Keep the derivative cache and the database of this run out of the working directory"""
+    global _saved_locations
+    temp_dir = tempfile.mkdtemp(prefix='report_tests_')
+    _saved_locations = (temp_dir, image_cache.CACHE_DIR, image_cache.CACHE_INDEX_DB, database.DB_NAME)
+    image_cache.CACHE_DIR = os.path.join(temp_dir, 'derivatives')
+    image_cache.CACHE_INDEX_DB = os.path.join(temp_dir, 'derivatives.db')
+    database.DB_NAME = os.path.join(temp_dir, 'report_generator.db')
+
+
+def tearDownModule():
+    """Restore the cache and database locations"""
+    temp_dir, image_cache.CACHE_DIR, image_cache.CACHE_INDEX_DB, database.DB_NAME = _saved_locations
+    shutil.rmtree(temp_dir, ignore_errors=True)
 
 class TestDatabase(unittest.TestCase):
     """Test database operations"""
@@ -76,10 +102,280 @@ class TestImageProcessing(unittest.TestCase):
         self.assertLessEqual(width, 1200)
         self.assertLessEqual(height, 1200)
     
+    def test_large_jpeg_scaled_decode(self):
+        """Test that draft-decoded large JPEGs still land exactly at MAX_IMAGE_PX"""
+        large = tempfile.NamedTemporaryFile(suffix='.jpg', delete=False)
+        large.close()
+        try:
+            Image.new('RGB', (5000, 3000), color='purple').save(large.name, 'JPEG')
+            result = ensure_image_resized(large.name)
+            self.assertNotEqual(result, large.name)
+            with Image.open(result) as img:
+                self.assertEqual(img.size, (1200, 720))
+        finally:
+            os.remove(large.name)
+    
+    def test_editor_downscaled_photo_kept(self):
+        """Test that a photo the editor downscaled to MAX_IMAGE_PX is not resized again"""
+        downscaled = tempfile.NamedTemporaryFile(suffix='.jpg', delete=False)
+        downscaled.close()
+        try:
+            Image.new('RGB', (1200, 900), color='teal').save(downscaled.name, 'JPEG',
+                                                             quality=report_logic.COMPRESSION_QUALITY)
+            result = ensure_image_resized(downscaled.name)
+            with Image.open(result) as img:
+                self.assertEqual(img.size, (report_logic.MAX_IMAGE_PX, 900))
+        finally:
+            os.remove(downscaled.name)
+
+    def test_jpeg_byte_budget(self):
+        """Test that JPEGs over the byte budget are re-encoded to fit it"""
+        noisy = tempfile.NamedTemporaryFile(suffix='.jpg', delete=False)
+        noisy.close()
+        try:
+            Image.effect_noise((1000, 800), 40).convert('RGB').save(noisy.name, 'JPEG', quality=95)
+            budget = 250 * 1024
+            self.assertGreater(os.path.getsize(noisy.name), budget)
+            asset = report_logic.process_image(noisy.name, byte_budget=budget)
+            self.assertNotEqual(asset.path, noisy.name)
+            self.assertEqual((asset.width, asset.height), (1000, 800))
+            self.assertLessEqual(os.path.getsize(asset.path), budget * (1 + report_logic.JPEG_BUDGET_TOLERANCE))
+            
+            # Within budget: left as is
+            self.assertEqual(report_logic.process_image(noisy.name, byte_budget=10 * 1024 * 1024).path, noisy.name)
+        finally:
+            os.remove(noisy.name)
+    
+    def test_scan_stored_as_bilevel(self):
+        """Test that a black-and-white scan is embedded as a 1-bit image, not an RGB JPEG"""
+        from PIL import ImageDraw
+        from PyPDF2 import PdfReader
+        scan = tempfile.NamedTemporaryFile(suffix='.jpg', delete=False)
+        scan.close()
+        try:
+            page = Image.new('RGB', (1240, 1754), 'white')
+            draw = ImageDraw.Draw(page)
+            for i in range(50):
+                draw.text((80, 60 + i * 30), f"Participant {i}    Roll No. 23{i:04d}    ________", fill='black')
+            page.save(scan.name, 'JPEG', quality=85)
+            
+            asset = report_logic.process_image(scan.name)
+            self.assertEqual(asset.mode, '1')
+            self.assertTrue(asset.path.endswith('.png'))
+            self.assertLess(os.path.getsize(asset.path), os.path.getsize(scan.name) / 10)
+            
+            pdf_bytes, _ = generate_report_pdf({'general_info': {}, 'photos': [scan.name]})
+            images = [xobjects[name].get_object() for page in PdfReader(io.BytesIO(pdf_bytes)).pages
+                      for xobjects in [page['/Resources'].get('/XObject', {})] for name in xobjects]
+            self.assertEqual(len(images), 1)
+            self.assertEqual(images[0]['/BitsPerComponent'], 1)
+            with Image.open(asset.path) as img:
+                self.assertEqual(images[0].get_data(), img.tobytes())
+        finally:
+            os.remove(scan.name)
+    
+    def test_jpeg_metadata_stripped(self):
+        """Test that EXIF is dropped from JPEGs kept as they are, without touching the pixels"""
+        photo = tempfile.NamedTemporaryFile(suffix='.jpg', delete=False)
+        photo.close()
+        try:
+            exif = Image.Exif()
+            exif[0x010F] = 'Camera Maker'
+            Image.effect_noise((600, 400), 40).convert('RGB').save(photo.name, 'JPEG', exif=exif.tobytes())
+            asset = report_logic.process_image(photo.name)
+            self.assertNotEqual(asset.path, photo.name)
+            with Image.open(asset.path) as stripped, Image.open(photo.name) as original:
+                self.assertEqual(len(stripped.getexif()), 0)
+                self.assertEqual(stripped.tobytes(), original.tobytes())
+        finally:
+            os.remove(photo.name)
+    
     def test_image_flowable(self):
         """Test image flowable creation"""
         result = image_flowable(self.test_image.name)
         self.assertIsNotNone(result)
+    
+    def test_pdf_page_dpis(self):
+        """Test that PDF pages are rendered at the DPI matching MAX_IMAGE_PX"""
+        from reportlab.pdfgen import canvas
+        from reportlab.lib.pagesizes import A4
+        pdf_file = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
+        pdf_file.close()
+        try:
+            c = canvas.Canvas(pdf_file.name, pagesize=A4)
+            c.showPage()
+            c.setPageSize((216, 144))  # 3x2 inch card
+            c.showPage()
+            c.save()
+            a4_dpi, card_dpi = pdf_page_dpis(pdf_file.name)
+            self.assertLessEqual(A4[1] * a4_dpi / 72, 1200)
+            self.assertGreater(A4[1] * a4_dpi / 72, 1190)
+            self.assertEqual(card_dpi, 200)
+        finally:
+            os.remove(pdf_file.name)
+    
+    def test_processed_asset(self):
+        """Test that processing returns an immutable asset with final dimensions"""
+        import pickle
+        asset = report_logic.process_image(self.test_image.name)
+        self.assertEqual((asset.width, asset.height, asset.mode), (1200, 1200, 'RGB'))
+        self.assertEqual(asset.digest, image_cache.file_digest(asset.path))
+        with self.assertRaises(AttributeError):
+            asset.width = 10
+        self.assertEqual(pickle.loads(pickle.dumps(asset)), asset)
+    
+    def test_asset_flowable_does_not_reopen_image(self):
+        """Test that cached assets and their flowables never reopen the image"""
+        asset = report_logic.process_image(self.test_image.name)
+        original_open = report_logic.PILImage.open
+        def fail_open(*args, **kwargs):
+            raise AssertionError("image reopened")
+        report_logic.PILImage.open = fail_open
+        try:
+            self.assertEqual(report_logic.process_image(self.test_image.name), asset)
+            flowable = image_flowable(asset)
+        finally:
+            report_logic.PILImage.open = original_open
+        self.assertAlmostEqual(flowable.drawWidth, report_logic.MAX_IMAGE_WIDTH_INCH * 72)
+        self.assertAlmostEqual(flowable.drawHeight, report_logic.MAX_IMAGE_WIDTH_INCH * 72)
+
+class TestDerivativeCache(unittest.TestCase):
+    """Test the content-addressed derivative cache"""
+    
+    def setUp(self):
+        """Point the cache at a temporary directory"""
+        self.temp_dir = tempfile.mkdtemp()
+        self._saved = (image_cache.CACHE_DIR, image_cache.CACHE_INDEX_DB)
+        image_cache.CACHE_DIR = os.path.join(self.temp_dir, 'derivatives')
+        image_cache.CACHE_INDEX_DB = os.path.join(self.temp_dir, 'derivatives.db')
+        self.image_path = os.path.join(self.temp_dir, 'photo.jpg')
+        Image.new('RGB', (2400, 1600), color='green').save(self.image_path, 'JPEG')
+    
+    def tearDown(self):
+        """Restore cache settings"""
+        image_cache.CACHE_DIR, image_cache.CACHE_INDEX_DB = self._saved
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_resize_is_cached(self):
+        """Test that identical uploads reuse the cached derivative"""
+        first = ensure_image_resized(self.image_path)
+        copy_path = os.path.join(self.temp_dir, 'copy.jpg')
+        shutil.copyfile(self.image_path, copy_path)
+        second = ensure_image_resized(copy_path)
+        self.assertEqual(first, second)
+        self.assertTrue(first.startswith(image_cache.CACHE_DIR))
+        self.assertEqual(image_cache.cache_stats()['entries'], 1)
+    
+    def test_lru_eviction(self):
+        """Test that eviction removes least recently used entries"""
+        saved_age = image_cache.CACHE_MIN_AGE_SECONDS
+        image_cache.CACHE_MIN_AGE_SECONDS = -1
+        try:
+            paths = []
+            for i in range(3):
+                path = os.path.join(self.temp_dir, f'img_{i}.jpg')
+                Image.new('RGB', (1600, 1600), color=(i * 80, 0, 0)).save(path, 'JPEG')
+                paths.append(ensure_image_resized(path))
+            image_cache.evict(max_bytes=2 * os.path.getsize(paths[-1]))
+            self.assertFalse(os.path.exists(paths[0]))
+            self.assertTrue(os.path.exists(paths[-1]))
+        finally:
+            image_cache.CACHE_MIN_AGE_SECONDS = saved_age
+    
+    def test_metadata_entries_evicted(self):
+        """Test that metadata-only entries are evicted, least recently used first, past their row budget"""
+        from unittest import mock
+        keys = [image_cache.make_key(f'{i:064x}', op='dhash') for i in range(3)]
+        for i, key in enumerate(keys):
+            image_cache.put_meta(key, {'dhash': i})
+        with mock.patch.object(image_cache, 'CACHE_MIN_AGE_SECONDS', -1):
+            image_cache.evict(max_meta_rows=2)
+        self.assertIsNone(image_cache.get_meta(keys[0]))
+        self.assertEqual(image_cache.get_meta(keys[-1]), {'dhash': 2})
+
+@unittest.skipUnless(shutil.which('pdftoppm'), "poppler not installed")
+class TestPdfConversion(unittest.TestCase):
+    """Test streamed PDF rasterization"""
+    
+    def setUp(self):
+        """Create a multi-page PDF"""
+        from reportlab.pdfgen import canvas
+        self.temp_dir = tempfile.mkdtemp()
+        self.pdf_path = os.path.join(self.temp_dir, 'register.pdf')
+        c = canvas.Canvas(self.pdf_path)
+        for i in range(5):
+            c.drawString(100, 700, f"Attendance page {i + 1}")
+            c.showPage()
+        c.save()
+    
+    def tearDown(self):
+        """Clean up PDF"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_every_page_converted(self):
+        """Test that each page becomes one bounded image"""
+        pages = convert_pdf_to_images(self.pdf_path)
+        self.assertEqual(len(pages), 5)
+        for page in pages:
+            with Image.open(page) as img:
+                self.assertLessEqual(max(img.size), 1200)
+        self.assertEqual(convert_pdf_to_images(self.pdf_path), pages)
+
+class TestPreprocessing(unittest.TestCase):
+    """Test the parallel upload preprocessing stage"""
+    
+    def setUp(self):
+        """Create a mix of valid and broken uploads"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.paths = []
+        for i in range(4):
+            path = os.path.join(self.temp_dir, f'photo_{i}.jpg')
+            Image.new('RGB', (1600, 1000 + i * 100), color='blue').save(path, 'JPEG')
+            self.paths.append(path)
+        self.missing = os.path.join(self.temp_dir, 'missing.jpg')
+    
+    def tearDown(self):
+        """Clean up uploads"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_results_keep_upload_order(self):
+        """Test that results come back in the original order"""
+        paths = self.paths[:2] + [self.missing] + self.paths[2:]
+        results, errors = preprocess_uploads(paths, max_workers=2)
+        self.assertEqual(len(results), len(paths))
+        self.assertEqual(results[2], [])
+        heights = [Image.open(r[0]).size[1] for i, r in enumerate(results) if i != 2]
+        self.assertEqual(heights, sorted(set(heights)))
+        self.assertEqual(errors, [])
+    
+    def test_inline_when_capped(self):
+        """Test that a parallelism cap of one processes inline"""
+        results, errors = preprocess_uploads(self.paths, max_workers=1)
+        self.assertTrue(all(len(r) == 1 for r in results))
+    
+    def test_pixel_budget(self):
+        """Test that images are checked against the pixel budgets from their headers"""
+        from unittest import mock
+        import preprocess
+        bomb = os.path.join(self.temp_dir, 'bomb.png')
+        Image.new('RGB', (2500, 2000), color=tuple(os.urandom(3))).save(bomb, 'PNG')
+        large_jpeg = os.path.join(self.temp_dir, 'large.jpg')
+        Image.new('RGB', (4000, 3000), color='green').save(large_jpeg, 'JPEG')
+        
+        with mock.patch.object(report_logic, 'MAX_IMAGE_PIXELS', 4_000_000):
+            # The JPEG only decodes at half size, so it fits; the PNG does not
+            errors = preprocess.pixel_budget_errors([bomb, large_jpeg])
+            self.assertEqual([path for path, _ in errors], [bomb])
+            with self.assertRaises(report_logic.ImageTooLarge):
+                report_logic.process_image(bomb)
+            
+            data, errors = preprocess.prepare_report_data({'photos': [bomb, large_jpeg]}, max_workers=1)
+            self.assertEqual(len(data['photos']), 1)
+            self.assertEqual([path for path, _ in errors], [bomb])
+        
+        # The report budget admits uploads in order until it is used up
+        errors = preprocess.pixel_budget_errors(self.paths, budget=3_500_000)
+        self.assertEqual([path for path, _ in errors], self.paths[2:])
 
 class TestReportGeneration(unittest.TestCase):
     """Test PDF report generation"""
@@ -163,6 +459,873 @@ class TestReportGeneration(unittest.TestCase):
             for img_path in test_images:
                 if os.path.exists(img_path):
                     os.remove(img_path)
+    
+    def test_duplicate_images_embedded_once(self):
+        """Test that identical images under different paths share one image object"""
+        from PyPDF2 import PdfReader
+        temp_dir = tempfile.mkdtemp()
+        try:
+            photo = Image.effect_noise((800, 600), 30).convert('RGB')
+            paths = []
+            for name in ['photo.jpg', 'brochure_copy.jpg', 'notice_copy.jpg']:
+                paths.append(os.path.join(temp_dir, name))
+                photo.save(paths[-1], 'JPEG')
+            self.test_data['photos'] = paths[:1]
+            self.test_data['brochure'] = paths[1:2]
+            self.test_data['notice'] = paths[2:]
+            pdf_bytes, _ = generate_report_pdf(self.test_data)
+            
+            images = set()
+            for page in PdfReader(io.BytesIO(pdf_bytes)).pages:
+                xobjects = page['/Resources'].get('/XObject', {})
+                images.update(xobjects.raw_get(name).idnum for name in xobjects)
+            self.assertEqual(len(images), 1)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    def test_image_streams_stored_binary(self):
+        """Test that images are embedded without ASCII85 and rl_config is left as found"""
+        from reportlab import rl_config
+        from PyPDF2 import PdfReader
+        temp_dir = tempfile.mkdtemp()
+        try:
+            photo = os.path.join(temp_dir, 'photo.jpg')
+            Image.effect_noise((800, 600), 30).convert('RGB').save(photo, 'JPEG')
+            self.test_data['photos'] = [photo]
+            use_a85, rl_config.useA85 = rl_config.useA85, 1  # ReportLab's default
+            try:
+                pdf_bytes, _ = generate_report_pdf(self.test_data)
+                self.assertEqual(rl_config.useA85, 1)
+            finally:
+                rl_config.useA85 = use_a85
+            
+            filters = []
+            for page in PdfReader(io.BytesIO(pdf_bytes)).pages:
+                xobjects = page['/Resources'].get('/XObject', {})
+                filters.extend(xobjects[name].get('/Filter') for name in xobjects)
+            self.assertEqual(filters, [['/DCTDecode']])
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    def test_near_duplicates_flagged(self):
+        """Test that a slightly altered copy of a photo is reported as a near-duplicate"""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            photo = Image.linear_gradient('L').resize((800, 600)).convert('RGB')
+            original = os.path.join(temp_dir, 'original.jpg')
+            photo.save(original, 'JPEG', quality=90)
+            recompressed = os.path.join(temp_dir, 'recompressed.jpg')
+            photo.save(recompressed, 'JPEG', quality=60)
+            other = os.path.join(temp_dir, 'other.jpg')
+            photo.rotate(90).save(other, 'JPEG', quality=90)
+            assets = [report_logic.process_image(p) for p in [original, recompressed, other]]
+            pairs = report_logic.near_duplicate_pairs(assets)
+            self.assertEqual([(a.path, b.path) for a, b in pairs], [(original, recompressed)])
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    def test_pdf_attachment_merged_as_vector(self):
+        """Test that a born-digital PDF is merged as vector pages with correct page numbers"""
+        from reportlab.pdfgen import canvas
+        from reportlab.lib.pagesizes import A4, landscape
+        from PyPDF2 import PdfReader
+        from preprocess import prepare_report_data
+        temp_dir = tempfile.mkdtemp()
+        try:
+            brochure = os.path.join(temp_dir, 'brochure.pdf')
+            c = canvas.Canvas(brochure, pagesize=A4)
+            c.drawString(72, 750, "Brochure page one")
+            c.showPage()
+            c.setPageSize(landscape(A4))
+            c.drawString(72, 500, "Brochure page two")
+            c.showPage()
+            c.save()
+            self.test_data['brochure'] = [brochure]
+            data, errors = prepare_report_data(self.test_data, max_workers=1)
+            self.assertEqual(errors, [])
+            self.assertEqual([type(page) for page in data['brochure']], [report_logic.PdfPageAsset] * 2)
+            
+            pdf_bytes, _ = generate_report_pdf(data)
+            self.assertEqual(pdf_bytes, generate_report_pdf(data)[0])
+            pages = PdfReader(io.BytesIO(pdf_bytes)).pages
+            texts = [page.extract_text() for page in pages]
+            self.assertIn("Brochure page one", texts[-2])
+            self.assertIn("Brochure page two", texts[-1])
+            for number, text in enumerate(texts, 1):
+                self.assertIn(f"Page {number}", text)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    def test_pdf_attachment_keeps_web_links(self):
+        """Test that web links on merged PDF pages still point at their text, and other annotations are dropped"""
+        from reportlab.pdfgen import canvas
+        from reportlab.lib.pagesizes import A4
+        from PyPDF2 import PdfReader
+        from preprocess import prepare_report_data
+        temp_dir = tempfile.mkdtemp()
+        try:
+            brochure = os.path.join(temp_dir, 'brochure.pdf')
+            c = canvas.Canvas(brochure, pagesize=A4)
+            c.bookmarkPage('top')
+            c.drawString(72, 750, "Register online")
+            c.linkURL('https://example.com/register', (72, 745, 200, 762), relative=0)
+            c.linkAbsolute('Back to top', 'top', (72, 700, 200, 717))
+            c.showPage()
+            c.save()
+            self.test_data['brochure'] = [brochure]
+            data, _ = prepare_report_data(self.test_data, max_workers=1)
+            pdf_bytes, _ = generate_report_pdf(data)
+            
+            page = PdfReader(io.BytesIO(pdf_bytes)).pages[-1]
+            annots = [a.get_object() for a in page.get('/Annots', [])]
+            self.assertEqual([a['/A']['/URI'] for a in annots], ['https://example.com/register'])
+            left, bottom, right, top = (float(v) for v in annots[0]['/Rect'])
+            mediabox = page.mediabox
+            self.assertTrue(0 < left < right < float(mediabox.right))
+            self.assertTrue(float(mediabox.top) / 2 < bottom < top < float(mediabox.top))
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    def test_spooled_report_generation(self):
+        """Test that large reports spill from memory to disk"""
+        saved = report_logic.PDF_SPOOL_MAX_BYTES
+        report_logic.PDF_SPOOL_MAX_BYTES = 1024
+        try:
+            pdf_file, filename = report_logic.spool_report_pdf(self.test_data)
+            with pdf_file:
+                self.assertTrue(pdf_file._rolled)
+                self.assertEqual(pdf_file.read(5), b'%PDF-')
+            self.assertTrue(filename.endswith('.pdf'))
+        finally:
+            report_logic.PDF_SPOOL_MAX_BYTES = saved
+
+class TestReportTemplates(unittest.TestCase):
+    """Test declarative report templates"""
+    
+    def tearDown(self):
+        """Remove the test template"""
+        report_logic.COMPILED_TEMPLATES.pop('test', None)
+        report_logic.ACTIVITY_TEMPLATES.pop('Test Activity', None)
+    
+    def test_template_per_activity_type(self):
+        """Test that a section added in config appears for its activity type"""
+        from PyPDF2 import PdfReader
+        template = report_logic.TEMPLATES['default'][:2] + [{
+            'name': 'coordinators', 'type': 'record_tables', 'source': 'coordinators',
+            'title': "Student Coordinators", 'fields': [("Coordinator", 'name')]
+        }]
+        report_logic.COMPILED_TEMPLATES['test'] = report_logic.compile_template(template)
+        report_logic.ACTIVITY_TEMPLATES['Test Activity'] = 'test'
+        pdf_bytes, _ = generate_report_pdf({
+            'general_info': {'Activity Type': 'Test Activity'},
+            'coordinators': [{'name': 'Asha Rao'}],
+            'speakers': [{'name': 'Not Shown'}]
+        })
+        text = PdfReader(io.BytesIO(pdf_bytes)).pages[0].extract_text()
+        self.assertIn("Student Coordinators", text)
+        self.assertIn("Asha Rao", text)
+        self.assertNotIn("Not Shown", text)
+    
+    def test_label_paragraphs_reused(self):
+        """Test that label paragraphs are parsed once and copied per table"""
+        first = report_logic.label_paragraph("Venue")
+        second = report_logic.label_paragraph("Venue")
+        self.assertIsNot(first, second)
+        self.assertIs(first.frags, second.frags)
+
+class TestIncrementalPreview(unittest.TestCase):
+    """Test section-level caching for live previews"""
+    
+    def setUp(self):
+        """Create report data with photos"""
+        self.temp_dir = tempfile.mkdtemp()
+        photos = []
+        for i in range(3):
+            path = os.path.join(self.temp_dir, f'photo_{i}.jpg')
+            Image.new('RGB', (800, 600), color=(i * 60, 80, 160)).save(path, 'JPEG')
+            photos.append(path)
+        self.data = {
+            'general_info': {'Activity Type': 'Workshop', 'Start Date': '2025-01-15', 'End Date': '2025-01-15'},
+            'synopsis': {'summary': 'First summary'},
+            'photos': photos,
+            'brochure': photos[:1]
+        }
+        report_logic._section_cache.clear()
+    
+    def tearDown(self):
+        """Clean up photos"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def rebuilt_sections(self):
+        """Return the sections rebuilt by one preview"""
+        rebuilt = []
+        original = report_logic.build_section_cached
+        def tracking(name, *args):
+            flowables, was_rebuilt = original(name, *args)
+            if was_rebuilt:
+                rebuilt.append(name)
+            return flowables, was_rebuilt
+        report_logic.build_section_cached = tracking
+        try:
+            pdf_bytes, _ = report_logic.generate_preview_pdf(self.data)
+            self.assertTrue(pdf_bytes.startswith(b'%PDF-'))
+        finally:
+            report_logic.build_section_cached = original
+        return rebuilt
+    
+    def test_only_changed_sections_rebuild(self):
+        """Test that editing the synopsis does not rebuild photo sections"""
+        self.assertIn('photos', self.rebuilt_sections())
+        self.assertEqual(self.rebuilt_sections(), [])
+        self.data['synopsis'] = {'summary': 'Edited summary'}
+        self.assertEqual(self.rebuilt_sections(), ['synopsis'])
+    
+    def test_photo_content_change_rebuilds(self):
+        """Test that replacing a photo's content rebuilds its section"""
+        self.rebuilt_sections()
+        Image.new('RGB', (800, 600), color='white').save(self.data['photos'][2], 'JPEG')
+        self.assertEqual(self.rebuilt_sections(), ['photos'])
+    
+    def test_cached_section_builds_at_different_widths(self):
+        """Test that two builds of a cached section do not share layout state"""
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Table
+        text = ' '.join(['summary'] * 60)
+        def builder(data, general_info):
+            return [Table([[report_logic.label_paragraph('Summary'),
+                            Paragraph(text, report_logic.styles['TableValue'])]], colWidths=['30%', '70%'])]
+        
+        wide, _ = report_logic.build_section_cached('widths', {'text': text}, builder, {}, {})
+        narrow, rebuilt = report_logic.build_section_cached('widths', {'text': text}, builder, {}, {})
+        self.assertFalse(rebuilt)
+        wide_cell, narrow_cell = wide[0]._cellvalues[0][1], narrow[0]._cellvalues[0][1]
+        self.assertIsNot(wide_cell, narrow_cell)
+        SimpleDocTemplate(io.BytesIO(), pagesize=(612, 792)).build(wide)
+        wide_lines = len(wide_cell.blPara.lines)
+        
+        SimpleDocTemplate(io.BytesIO(), pagesize=(400, 792)).build(narrow)
+        self.assertGreater(len(narrow_cell.blPara.lines), wide_lines)
+        self.assertEqual(len(wide_cell.blPara.lines), wide_lines)
+
+class TestPreviewThumbnails(unittest.TestCase):
+    """Test stored previews served as page thumbnails"""
+    
+    def setUp(self):
+        """Store previews in a temporary directory"""
+        self.temp_dir = tempfile.mkdtemp()
+        self._saved_dir = preview_store.PREVIEW_DIR
+        preview_store.PREVIEW_DIR = self.temp_dir
+        self.pdf_bytes, _ = generate_report_pdf({
+            'general_info': {'Activity Type': 'Workshop', 'Venue': 'Test Venue'},
+            'synopsis': {'summary': 'Preview summary'}
+        })
+    
+    def tearDown(self):
+        """Restore settings"""
+        preview_store.PREVIEW_DIR = self._saved_dir
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_save_preview(self):
+        """Test that previews are stored once per user and content"""
+        preview_id, page_count = preview_store.save_preview(1, io.BytesIO(self.pdf_bytes))
+        self.assertGreaterEqual(page_count, 1)
+        self.assertTrue(preview_store.is_preview_id(preview_id))
+        self.assertTrue(os.path.exists(preview_store.preview_path(1, preview_id)))
+        self.assertEqual(preview_store.save_preview(1, io.BytesIO(self.pdf_bytes))[0], preview_id)
+        self.assertNotEqual(preview_store.save_preview(2, io.BytesIO(self.pdf_bytes))[0], preview_id)
+    
+    def test_thumbnail_width_snapping(self):
+        """Test that requested widths map onto the allowed set"""
+        self.assertEqual(preview_store.snap_thumbnail_width('500'), 480)
+        self.assertEqual(preview_store.snap_thumbnail_width(5000), 960)
+        self.assertEqual(preview_store.snap_thumbnail_width('abc'), preview_store.DEFAULT_THUMBNAIL_WIDTH)
+    
+    def test_other_users_preview_not_found(self):
+        """Test that a preview id does not resolve for another user"""
+        preview_id, _ = preview_store.save_preview(1, io.BytesIO(self.pdf_bytes))
+        self.assertIsNone(preview_store.page_thumbnail(2, preview_id, 1))
+        self.assertIsNone(preview_store.page_thumbnail(1, '../' + preview_id[3:], 1))
+    
+    @unittest.skipUnless(shutil.which('pdftoppm'), "poppler not installed")
+    def test_page_thumbnail(self):
+        """Test that a page thumbnail is small and cached"""
+        preview_id, _ = preview_store.save_preview(1, io.BytesIO(self.pdf_bytes))
+        path = preview_store.page_thumbnail(1, preview_id, 1, 480)
+        self.assertIsNotNone(path)
+        with Image.open(path) as img:
+            self.assertEqual(img.width, 480)
+        self.assertLess(os.path.getsize(path), 100 * 1024)
+        self.assertEqual(preview_store.page_thumbnail(1, preview_id, 1, 480), path)
+
+class TestReportJobs(unittest.TestCase):
+    """Test the background report job queue"""
+    
+    def setUp(self):
+        """Queue a report with raw photo uploads"""
+        self.temp_dir = tempfile.mkdtemp()
+        self._saved_dir = report_jobs.REPORTS_DIR
+        report_jobs.REPORTS_DIR = os.path.join(self.temp_dir, 'reports')
+        self.user_id = create_user(f'jobs-{os.getpid()}-{id(self)}@example.com', 'password123')
+        photos = []
+        for i in range(2):
+            path = os.path.join(self.temp_dir, f'upload_{i}.jpg')
+            Image.new('RGB', (1800, 1200), color='orange').save(path, 'JPEG')
+            photos.append(path)
+        self.data = {
+            'general_info': {'Activity Type': 'Workshop', 'Venue': 'Test Venue'},
+            'speakers': [{'name': 'Test Speaker'}],
+            'participants': [{'type': 'Student', 'count': '10'}],
+            'preparers': [{'name': 'Test Preparer', 'designation': 'Faculty', 'signature_path': None}],
+            'speaker_profile': {},
+            'photos': photos
+        }
+    
+    def tearDown(self):
+        """Restore settings"""
+        report_jobs.REPORTS_DIR = self._saved_dir
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_job_lifecycle(self):
+        """Test that a queued job is rendered and becomes downloadable"""
+        job_id = report_jobs.enqueue_report(self.user_id, self.data)
+        self.assertEqual(get_report_job(job_id, self.user_id)['status'], 'queued')
+        self.assertIsNone(get_report_job(job_id, self.user_id + 1000))
+        
+        report_jobs.worker_loop(max_jobs=10)
+        
+        job = get_report_job(job_id, self.user_id)
+        self.assertEqual(job['status'], 'done')
+        self.assertTrue(job['filename'].endswith('.pdf'))
+        with open(job['result_path'], 'rb') as f:
+            self.assertEqual(f.read(5), b'%PDF-')
+    
+    def test_job_records_metrics(self):
+        """Test that per-stage timings and counters are stored with the job"""
+        job_id = report_jobs.enqueue_report(self.user_id, self.data)
+        report_jobs.worker_loop(max_jobs=10)
+        metrics = json.loads(get_report_job(job_id, self.user_id)['metrics'])
+        self.assertEqual(metrics['user_id'], self.user_id)
+        self.assertEqual(metrics['job_id'], job_id)
+        for stage in ['preprocess', 'resize_images', 'tables', 'section:photos', 'doc_build']:
+            self.assertIn(stage, metrics['stages_s'])
+        self.assertEqual(metrics['counters']['images_processed'], 2)
+        self.assertEqual(metrics['counters']['images_embedded'], 2)
+        self.assertGreater(metrics['counters']['bytes_in'], metrics['counters']['bytes_out'])
+        self.assertGreaterEqual(metrics['counters']['pages'], 1)
+    
+    def test_render_worker_ignores_master_signal_handlers(self):
+        """Test that a worker forked from a process with its own SIGTERM handler can be terminated"""
+        import time
+        import signal
+        import multiprocessing
+        from unittest import mock
+        ctx = multiprocessing.get_context('fork')
+        started = ctx.Event()
+        saved = signal.signal(signal.SIGTERM, lambda signum, frame: None)
+        try:
+            with mock.patch.object(report_jobs, 'worker_loop', lambda: (started.set(), time.sleep(60))):
+                process = ctx.Process(target=report_jobs.render_worker_main)
+                process.start()
+            self.assertTrue(started.wait(10))
+            report_jobs.stop_render_workers([process])
+            self.assertEqual(process.exitcode, -signal.SIGTERM)
+        finally:
+            signal.signal(signal.SIGTERM, saved)
+
+    def test_only_jobs_without_heartbeat_requeued(self):
+        """Test that a long job with live heartbeats keeps running and a requeued one cannot finish"""
+        from database import get_db, heartbeat_report_job, requeue_stale_report_jobs, finish_report_job
+        job_id = report_jobs.enqueue_report(self.user_id, self.data)
+        conn = get_db()
+        conn.execute("UPDATE report_jobs SET status = 'running', worker = 'w1', attempts = 1, "
+                     "started_at = datetime('now', '-1 hour'), heartbeat_at = datetime('now', '-1 hour') "
+                     "WHERE id = ?", (job_id,))
+        conn.commit()
+        conn.close()
+
+        self.assertTrue(heartbeat_report_job(job_id, 'w1'))
+        self.assertFalse(heartbeat_report_job(job_id, 'w2'))
+        requeue_stale_report_jobs(60, 3)
+        self.assertEqual(get_report_job(job_id)['status'], 'running')
+
+        conn = get_db()
+        conn.execute("UPDATE report_jobs SET heartbeat_at = datetime('now', '-5 minutes') WHERE id = ?", (job_id,))
+        conn.commit()
+        conn.close()
+        requeue_stale_report_jobs(60, 3)
+        self.assertEqual(get_report_job(job_id)['status'], 'queued')
+        self.assertFalse(finish_report_job(job_id, '/tmp/late.pdf', 'late.pdf', worker='w1'))
+        self.assertFalse(heartbeat_report_job(job_id, 'w1'))
+        self.assertEqual(get_report_job(job_id)['status'], 'queued')
+        report_jobs.worker_loop(max_jobs=10)
+        self.assertEqual(get_report_job(job_id)['status'], 'done')
+
+    def test_old_reports_expire(self):
+        """Test that reports and finished jobs past the retention period are deleted, and reuse keeps a report"""
+        import time
+        from database import get_db
+        old_job = report_jobs.enqueue_report(self.user_id, self.data)
+        self.data['general_info']['Venue'] = 'Other Venue'
+        reused_job = report_jobs.enqueue_report(self.user_id, self.data)
+        report_jobs.worker_loop(max_jobs=2)
+        old_path, reused_path = (get_report_job(job_id)['result_path'] for job_id in (old_job, reused_job))
+        week_ago = time.time() - 7 * 24 * 3600
+        for path in (old_path, reused_path):
+            os.utime(path, (week_ago, week_ago))
+        conn = get_db()
+        conn.execute("UPDATE report_jobs SET finished_at = datetime('now', '-7 days') WHERE id IN (?, ?)",
+                     (old_job, reused_job))
+        conn.commit()
+        conn.close()
+        
+        self.assertEqual(report_jobs.enqueue_report(self.user_id, self.data), reused_job)
+        stats = report_jobs.expire_reports(3600)
+        self.assertEqual(stats['deleted'], 1)
+        self.assertEqual(stats['jobs_deleted'], 2)
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(os.path.exists(reused_path))
+        self.assertIsNone(get_report_job(old_job))
+    
+    def test_saved_signature_keeps_upload(self):
+        """Test that signatures are saved as the upload, not as an evictable resized copy"""
+        from database import get_user_signatures
+        signature = os.path.join(self.temp_dir, 'signature.png')
+        Image.new('L', (1600, 400), color=255).save(signature)
+        self.data['preparers'][0].update({'signature_upload': signature, 'save_signature': True})
+        job_id = report_jobs.enqueue_report(self.user_id, self.data)
+        report_jobs.worker_loop(max_jobs=10)
+        self.assertEqual(get_report_job(job_id)['status'], 'done')
+        self.assertEqual([s['signature_path'] for s in get_user_signatures(self.user_id)], [signature])
+
+    def test_content_key_covers_output_settings(self):
+        """Test that changing any output-affecting setting changes the report's content key"""
+        from unittest import mock
+        import preprocess
+        key = report_logic.report_content_key(self.data)
+        for module, name, value in [(report_logic, 'IMAGE_BYTE_BUDGET', 100 * 1024),
+                                    (report_logic, 'JPEG_QUALITY_MIN', 30),
+                                    (report_logic, 'SCAN_MAX_MIDTONES', 0.1),
+                                    (preprocess, 'REPORT_IMAGE_BUDGET_BYTES', 1024 * 1024),
+                                    (preprocess, 'REPORT_PIXEL_BUDGET', 1000)]:
+            with mock.patch.object(module, name, value):
+                self.assertNotEqual(report_logic.report_content_key(self.data), key, name)
+        self.assertEqual(report_logic.report_content_key(self.data), key)
+
+    def test_failed_job_records_error(self):
+        """Test that a failing build marks the job failed"""
+        self.data['general_info'] = None
+        job_id = report_jobs.enqueue_report(self.user_id, self.data)
+        report_jobs.worker_loop(max_jobs=10)
+        job = get_report_job(job_id, self.user_id)
+        self.assertEqual(job['status'], 'failed')
+        self.assertTrue(job['error'])
+    
+    def test_identical_reports_reused(self):
+        """Test that the same content is rendered once and served from storage"""
+        job_id = report_jobs.enqueue_report(self.user_id, self.data)
+        self.assertEqual(report_jobs.enqueue_report(self.user_id, self.data), job_id)
+        report_jobs.worker_loop(max_jobs=10)
+        job = get_report_job(job_id, self.user_id)
+        self.assertEqual(job['status'], 'done')
+        
+        # Same content under a different upload path, submitted by another user
+        other_user = create_user(f'jobs-other-{os.getpid()}-{id(self)}@example.com', 'password123')
+        copy_path = os.path.join(self.temp_dir, 'renamed_upload.jpg')
+        shutil.copy(self.data['photos'][0], copy_path)
+        self.data['photos'][0] = copy_path
+        other_id = report_jobs.enqueue_report(other_user, self.data)
+        other_job = get_report_job(other_id, other_user)
+        self.assertEqual(other_job['status'], 'done')
+        self.assertEqual(other_job['result_path'], job['result_path'])
+        self.assertEqual(other_job['content_key'], job['content_key'])
+    
+    def test_deterministic_build(self):
+        """Test that identical data produces byte-identical PDFs"""
+        first, _ = generate_report_pdf(self.data)
+        second, _ = generate_report_pdf(self.data)
+        self.assertEqual(first, second)
+
+class TestBatchReports(unittest.TestCase):
+    """Test batch report generation from a spreadsheet"""
+    
+    def setUp(self):
+        """Write a sheet with one valid row and one broken row"""
+        self.temp_dir = tempfile.mkdtemp()
+        photos_dir = os.path.join(self.temp_dir, 'inputs', 'fdp')
+        os.makedirs(photos_dir)
+        for i in range(2):
+            Image.new('RGB', (1200, 800), color='teal').save(os.path.join(photos_dir, f'photo_{i}.jpg'), 'JPEG')
+        self.sheet = os.path.join(self.temp_dir, 'activities.csv')
+        with open(self.sheet, 'w') as f:
+            f.write("Report ID,Activity Type,Venue,Speaker Name,Prepared By,Photos Folder\n")
+            f.write("FDP-1,FDP,Main Hall,Dr. A; Dr. B,Test Preparer,inputs/fdp\n")
+            f.write("FDP-2,FDP,Main Hall,Dr. C,Test Preparer,inputs/missing\n")
+        self.output_dir = os.path.join(self.temp_dir, 'out')
+    
+    def tearDown(self):
+        """Clean up"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_batch_manifest_and_resume(self):
+        """Test that rows are rendered, errors recorded per row and done rows skipped on rerun"""
+        import batch_reports
+        manifest = batch_reports.run_batch(self.sheet, self.output_dir, max_workers=2)
+        done, failed = manifest['rows']['FDP-1'], manifest['rows']['FDP-2']
+        self.assertEqual(done['status'], 'done')
+        self.assertEqual(failed['status'], 'failed')
+        self.assertIn('Folder not found', failed['error'])
+        pdf_path = os.path.join(self.output_dir, done['pdf'])
+        with open(pdf_path, 'rb') as f:
+            self.assertEqual(f.read(5), b'%PDF-')
+        with open(os.path.join(self.output_dir, batch_reports.MANIFEST_NAME)) as f:
+            self.assertEqual(json.load(f)['summary'], {'done': 1, 'failed': 1, 'pending': 0})
+        
+        mtime = os.path.getmtime(pdf_path)
+        rerun = batch_reports.run_batch(self.sheet, self.output_dir, max_workers=2)
+        self.assertEqual(rerun['rows']['FDP-1'], done)
+        self.assertEqual(os.path.getmtime(pdf_path), mtime)
+    
+    def test_batch_runs_on_render_worker(self):
+        """Test that a queued batch is run by a render worker, one run per batch at a time"""
+        import uuid
+        from unittest import mock
+        import batch_reports
+        from database import find_batch_job
+        user_id = create_user(f'batch_{os.getpid()}_{id(self)}@example.com', 'password123')
+        batch_id = uuid.uuid4().hex
+        with mock.patch.object(batch_reports, 'BATCH_DIR', os.path.join(self.temp_dir, 'batches')), \
+                mock.patch.object(batch_reports, 'BATCH_INPUT_DIR', self.temp_dir):
+            job_id = report_jobs.enqueue_batch(user_id, batch_id, self.sheet)
+            self.assertIsNotNone(job_id)
+            self.assertIsNone(report_jobs.enqueue_batch(user_id, batch_id, self.sheet))
+            report_jobs.worker_loop(max_jobs=10)
+            job = find_batch_job(batch_id)
+            self.assertEqual(job['id'], job_id)
+            self.assertEqual(job['status'], 'done')
+            self.assertEqual(json.loads(job['metrics']), {'done': 1, 'failed': 1, 'pending': 0})
+            # Once finished, the batch can be queued again (and resumes from its manifest)
+            self.assertIsNotNone(report_jobs.enqueue_batch(user_id, batch_id, self.sheet))
+            report_jobs.worker_loop(max_jobs=10)
+            self.assertEqual(find_batch_job(batch_id)['status'], 'done')
+
+    def test_old_batches_expire(self):
+        """Test that old batch outputs and inputs are deleted, except while a batch is queued or running"""
+        import time
+        from unittest import mock
+        import batch_reports
+        from database import fail_report_job
+        user_id = create_user(f'batch_gc_{os.getpid()}_{id(self)}@example.com', 'password123')
+        batch_dir = os.path.join(self.temp_dir, 'old_batches')
+        input_dir = os.path.join(self.temp_dir, 'old_inputs')
+        month_ago = time.time() - 40 * 24 * 3600
+        for path in [os.path.join(batch_dir, name) for name in ('a' * 32, 'b' * 32)] + [os.path.join(input_dir, 'fdp')]:
+            os.makedirs(path)
+            with open(os.path.join(path, 'file.pdf'), 'wb') as f:
+                f.write(b'%PDF-')
+            os.utime(os.path.join(path, 'file.pdf'), (month_ago, month_ago))
+            os.utime(path, (month_ago, month_ago))
+        
+        with mock.patch.object(batch_reports, 'BATCH_DIR', batch_dir), \
+                mock.patch.object(batch_reports, 'BATCH_INPUT_DIR', input_dir):
+            job_id = report_jobs.enqueue_batch(user_id, 'b' * 32, self.sheet)
+            stats = report_jobs.expire_batches()
+            self.assertEqual(stats['outputs']['deleted'], 1)
+            self.assertEqual(sorted(os.listdir(batch_dir)), ['b' * 32])
+            self.assertEqual(os.listdir(input_dir), ['fdp'])
+            
+            fail_report_job(job_id, 'cancelled')
+            stats = report_jobs.expire_batches()
+            self.assertEqual(stats['outputs']['deleted'], 1)
+            self.assertEqual(stats['inputs']['deleted'], 1)
+            self.assertEqual(os.listdir(input_dir), [])
+    
+    def test_restricted_paths(self):
+        """Test that admin batches cannot read folders outside the input directory"""
+        import batch_reports
+        row = {'Activity Type': 'FDP', 'Venue': 'Main Hall', 'Photos Folder': '../../etc'}
+        with self.assertRaises(ValueError):
+            batch_reports.row_to_report_data(row, os.path.join(self.temp_dir, 'inputs'), restrict=True)
+
+class TestColdStart(unittest.TestCase):
+    """Test that importing the app stays cheap"""
+    
+    def test_app_import_is_lazy(self):
+        """Test that importing app loads none of the rendering dependencies"""
+        import benchmark_imports
+        _, timings = benchmark_imports.import_profile('app')
+        self.assertIn('flask', timings)
+        self.assertEqual(benchmark_imports.lazy_modules_loaded(timings), [])
+    
+    def test_database_import_has_no_side_effects(self):
+        """Test that the schema is created on first connection, not at import"""
+        import subprocess
+        temp_dir = tempfile.mkdtemp()
+        try:
+            here = os.path.dirname(os.path.abspath(__file__))
+            script = ("import os, database; assert not os.path.exists(database.DB_NAME); "
+                      "conn = database.get_db(); "
+                      "print(conn.execute('SELECT COUNT(*) FROM users').fetchone()[0])")
+            result = subprocess.run([sys.executable, '-c', script], cwd=temp_dir, capture_output=True,
+                                    text=True, env={**os.environ, 'PYTHONPATH': here})
+            self.assertEqual(result.returncode, 0, result.stderr)
+            self.assertEqual(result.stdout.strip(), '0')
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    def test_editor_image_settings_are_lazy(self):
+        """Test that the editor's upload settings come without loading report_logic"""
+        import subprocess
+        temp_dir = tempfile.mkdtemp()
+        try:
+            here = os.path.dirname(os.path.abspath(__file__))
+            script = ("import sys, app; settings = app.image_upload_settings(); "
+                      "assert 'report_logic' not in sys.modules; "
+                      "import report_logic; "
+                      "assert settings == {'max_px': report_logic.MAX_IMAGE_PX, "
+                      "'jpeg_quality': report_logic.COMPRESSION_QUALITY / 100}, settings")
+            result = subprocess.run([sys.executable, '-c', script], cwd=temp_dir, capture_output=True,
+                                    text=True, env={**os.environ, 'PYTHONPATH': here})
+            self.assertEqual(result.returncode, 0, result.stderr)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+class TestUploadStore(unittest.TestCase):
+    """Test content-addressed upload storage"""
+    
+    def setUp(self):
+        """Create an empty store"""
+        self.store_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        """Clean up"""
+        shutil.rmtree(self.store_dir, ignore_errors=True)
+    
+    def test_identical_uploads_stored_once(self):
+        """Test that the same content is stored once under its hash"""
+        import hashlib
+        import upload_store
+        content = b'brochure' * 1000
+        first, created = upload_store.store_stream(io.BytesIO(content), '.PDF', self.store_dir)
+        self.assertTrue(created)
+        digest = hashlib.sha256(content).hexdigest()
+        self.assertEqual(first, os.path.join(self.store_dir, digest[:2], digest[2:4], f'{digest}.pdf'))
+        
+        os.utime(first, (0, 0))
+        second, created = upload_store.store_stream(io.BytesIO(content), '.pdf', self.store_dir)
+        self.assertEqual(second, first)
+        self.assertFalse(created)
+        self.assertGreater(os.path.getmtime(first), 0)  # Refreshed for the upload GC grace period
+        
+        other, created = upload_store.store_stream(io.BytesIO(b'notice'), '.pdf', self.store_dir)
+        self.assertNotEqual(other, first)
+        files = [name for _, _, names in os.walk(self.store_dir) for name in names]
+        self.assertEqual(len(files), 2)
+
+class TestChunkedUpload(unittest.TestCase):
+    """Test chunked, resumable uploads"""
+    
+    def setUp(self):
+        """Use a temp directory as the upload folder"""
+        import time
+        self.temp_dir = tempfile.mkdtemp()
+        self.user_id = create_user(f'chunks_{os.getpid()}_{time.time()}@example.com', 'password123')
+        buffer = io.BytesIO()
+        Image.new('RGB', (300, 200), color=tuple(os.urandom(3))).save(buffer, 'PNG')
+        self.content = buffer.getvalue()
+    
+    def tearDown(self):
+        """Clean up"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_resume_and_asset_id(self):
+        """Test that chunks are verified, resumed by offset and stored as an asset"""
+        import hashlib
+        import chunked_upload
+        from database import get_upload_session
+        upload_id = chunked_upload.start_upload(self.user_id, 'photo.PNG', len(self.content), {'png'},
+                                                hashlib.sha256(self.content).hexdigest(), self.temp_dir)
+        half = len(self.content) // 2
+        first, rest = self.content[:half], self.content[half:]
+        
+        with self.assertRaises(chunked_upload.UploadError):
+            chunked_upload.append_chunk(get_upload_session(upload_id, self.user_id), 0, first, '0' * 64,
+                                        self.temp_dir)
+        chunked_upload.append_chunk(get_upload_session(upload_id, self.user_id), 0, first,
+                                    hashlib.sha256(first).hexdigest(), self.temp_dir)
+        # A retry of the same chunk after a dropped response is told where to resume
+        upload = get_upload_session(upload_id, self.user_id)
+        with self.assertRaises(chunked_upload.UploadError) as ctx:
+            chunked_upload.append_chunk(upload, 0, first, hashlib.sha256(first).hexdigest(), self.temp_dir)
+        self.assertEqual(ctx.exception.status, 409)
+        self.assertEqual(chunked_upload.upload_state(upload)['offset'], half)
+        
+        upload = chunked_upload.append_chunk(upload, half, rest, hashlib.sha256(rest).hexdigest(), self.temp_dir)
+        asset_id = upload['asset_id']
+        self.assertEqual(asset_id, hashlib.sha256(self.content).hexdigest() + '.png')
+        path = chunked_upload.asset_path(self.user_id, asset_id, {'png'}, self.temp_dir)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(os.listdir(os.path.join(self.temp_dir, '.staging')), [])
+        
+        # Asset ids only resolve for the user who uploaded them
+        self.assertIsNone(chunked_upload.asset_path(self.user_id + 1, asset_id, {'png'}, self.temp_dir))
+        self.assertIsNone(chunked_upload.asset_path(self.user_id, asset_id, {'pdf'}, self.temp_dir))
+
+    def test_stale_request_cannot_overwrite_committed_chunk(self):
+        """Test that a request holding an outdated offset is refused before it writes"""
+        import hashlib
+        import chunked_upload
+        from database import get_upload_session
+        upload_id = chunked_upload.start_upload(self.user_id, 'photo.png', len(self.content), {'png'},
+                                                store_dir=self.temp_dir)
+        stale = get_upload_session(upload_id, self.user_id)
+        half = len(self.content) // 2
+        first = self.content[:half]
+        chunked_upload.append_chunk(stale, 0, first, hashlib.sha256(first).hexdigest(), self.temp_dir)
+
+        other = b'x' * half
+        with self.assertRaises(chunked_upload.UploadError) as ctx:
+            chunked_upload.append_chunk(stale, 0, other, hashlib.sha256(other).hexdigest(), self.temp_dir)
+        self.assertEqual(ctx.exception.status, 409)
+        with open(chunked_upload.staging_path(upload_id, self.temp_dir), 'rb') as f:
+            self.assertEqual(f.read(), first)
+
+    def test_finished_upload_kept_until_session_expires(self):
+        """Test that the GC keeps an unsubmitted asset until its session expires, and then both go"""
+        import time
+        import hashlib
+        from unittest import mock
+        import upload_gc
+        import chunked_upload
+        from database import get_db, get_upload_session
+        upload_id = chunked_upload.start_upload(self.user_id, 'scan.png', len(self.content), {'png'},
+                                                store_dir=self.temp_dir)
+        upload = chunked_upload.append_chunk(get_upload_session(upload_id, self.user_id), 0, self.content,
+                                             hashlib.sha256(self.content).hexdigest(), self.temp_dir)
+        path = chunked_upload.asset_object_path(upload['asset_id'], self.temp_dir)
+        os.utime(path, (time.time() - 2 * upload_gc.GC_GRACE_SECONDS,) * 2)
+
+        with mock.patch.object(upload_gc, 'GC_STATE_FILE', os.path.join(self.temp_dir, 'gc.json')):
+            upload_gc.sweep_all(self.temp_dir)
+            self.assertTrue(os.path.exists(path))
+
+            conn = get_db()
+            conn.execute("UPDATE upload_sessions SET updated_at = datetime('now', '-2 days') WHERE id = ?",
+                         (upload_id,))
+            conn.commit()
+            conn.close()
+            chunked_upload.expire_uploads(store_dir=self.temp_dir)
+            self.assertIsNone(get_upload_session(upload_id, self.user_id))
+            upload_gc.sweep_all(self.temp_dir)
+            self.assertFalse(os.path.exists(path))
+
+class TestUploadGC(unittest.TestCase):
+    """Test garbage collection of unreferenced uploads"""
+    
+    def setUp(self):
+        """Create uploads referenced in different ways, plus orphans"""
+        import time
+        import upload_gc
+        from unittest import mock
+        from database import save_signature, create_report_job
+        self.temp_dir = tempfile.mkdtemp()
+        self.upload_dir = os.path.join(self.temp_dir, 'uploads')
+        self.state_patch = mock.patch.object(upload_gc, 'GC_STATE_FILE', os.path.join(self.temp_dir, 'gc.json'))
+        self.state_patch.start()
+        self.paths = {}
+        for name in ('draft', 'signature', 'job', 'orphan', 'new_orphan', 'legacy_resized'):
+            path = os.path.join(self.upload_dir, 'photos', f'{name}.jpg')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(name.encode() * 100)
+            if name != 'new_orphan':
+                os.utime(path, (time.time() - 2 * upload_gc.GC_GRACE_SECONDS,) * 2)
+            self.paths[name] = path
+        user_id = create_user(f'gc_{os.getpid()}_{time.time()}@example.com', 'password123')
+        save_draft(user_id, 'GC Draft', {'photo1': self.paths['draft'], 'venue': 'Main Hall'})
+        save_signature(user_id, self.paths['signature'], 'GC Signature', False)
+        self.job_id = create_report_job(user_id, {'photos': [self.paths['job']]})
+    
+    def tearDown(self):
+        """Clean up"""
+        from database import fail_report_job
+        fail_report_job(self.job_id, 'test cleanup')
+        self.state_patch.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def test_sweep_deletes_only_unreferenced(self):
+        """Test that batched sweeps delete old orphans and report the space reclaimed"""
+        import upload_gc
+        sweeps = []
+        while not sweeps or not sweeps[-1]['pass_complete']:
+            sweeps.append(upload_gc.sweep(self.upload_dir, batch_size=4))
+        self.assertEqual(len(sweeps), 2)
+        self.assertEqual(sum(s['deleted'] for s in sweeps), 2)
+        self.assertEqual(sum(s['referenced'] for s in sweeps), 3)
+        self.assertEqual(sum(s['recent'] for s in sweeps), 1)
+        self.assertEqual(sum(s['bytes_reclaimed'] for s in sweeps), len(b'orphan' * 100) + len(b'legacy_resized' * 100))
+        remaining = {os.path.basename(p) for p in upload_gc.list_upload_files(self.upload_dir)}
+        self.assertEqual(remaining, {'draft.jpg', 'signature.jpg', 'job.jpg', 'new_orphan.jpg'})
+    
+    def test_dry_run_keeps_files(self):
+        """Test that a dry run reports without deleting"""
+        import upload_gc
+        stats = upload_gc.sweep_all(self.upload_dir, batch_size=2, dry_run=True)
+        self.assertEqual(stats['deleted'], 2)
+        self.assertEqual(len(upload_gc.list_upload_files(self.upload_dir)), 6)
+
+    def test_derivative_reference_keeps_source(self):
+        """Test that a reference to a cached resize keeps the stored upload it was made from"""
+        import time
+        import upload_gc
+        import upload_store
+        from database import save_signature
+        buffer = io.BytesIO()
+        Image.new('RGB', (2400, 600), color='navy').save(buffer, 'JPEG')
+        buffer.seek(0)
+        source, _ = upload_store.store_stream(buffer, '.jpg', self.upload_dir)
+        os.utime(source, (time.time() - 2 * upload_gc.GC_GRACE_SECONDS,) * 2)
+        derivative = ensure_image_resized(source)
+        self.assertNotEqual(derivative, source)
+
+        user_id = create_user(f'gc_derivative_{os.getpid()}_{time.time()}@example.com', 'password123')
+        save_signature(user_id, derivative, 'Resized signature', False)
+        upload_gc.sweep_all(self.upload_dir)
+        self.assertTrue(os.path.exists(source))
+    
+    def test_deleted_source_drops_cache_entries(self):
+        """Test that deleting a stored upload also drops the cache entries made from it"""
+        import time
+        import upload_gc
+        import upload_store
+        buffer = io.BytesIO()
+        Image.new('RGB', (2400, 600), color='teal').save(buffer, 'JPEG')
+        buffer.seek(0)
+        source, _ = upload_store.store_stream(buffer, '.jpg', self.upload_dir)
+        derivative = ensure_image_resized(source)
+        os.utime(source, (time.time() - 2 * upload_gc.GC_GRACE_SECONDS,) * 2)
+        
+        stats = upload_gc.sweep_all(self.upload_dir)
+        self.assertFalse(os.path.exists(source))
+        self.assertFalse(os.path.exists(derivative))
+        self.assertGreaterEqual(stats['cache_entries_dropped'], 1)
+        self.assertEqual(image_cache.derivative_sources([derivative]), {})
+
+    def test_expire_previews(self):
+        """Test that only preview PDFs past their retention are deleted"""
+        import time
+        import upload_gc
+        preview_dir = os.path.join(self.temp_dir, 'previews')
+        os.makedirs(os.path.join(preview_dir, '1'))
+        old, new = (os.path.join(preview_dir, '1', f'{name}.pdf') for name in ('old', 'new'))
+        for path in (old, new):
+            with open(path, 'wb') as f:
+                f.write(b'%PDF-' * 10)
+        os.utime(old, (time.time() - 2 * upload_gc.PREVIEW_RETENTION_SECONDS,) * 2)
+        self.assertEqual(upload_gc.expire_previews(dry_run=True, preview_dir=preview_dir)['deleted'], 1)
+        stats = upload_gc.expire_previews(preview_dir=preview_dir)
+        self.assertEqual(stats, {'deleted': 1, 'bytes_reclaimed': 50})
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(new))
 
 class TestErrorHandling(unittest.TestCase):
     """Test error handling"""
@@ -206,7 +1369,19 @@ def run_all_tests():
     # Add test classes
     suite.addTests(loader.loadTestsFromTestCase(TestDatabase))
     suite.addTests(loader.loadTestsFromTestCase(TestImageProcessing))
+    suite.addTests(loader.loadTestsFromTestCase(TestDerivativeCache))
+    suite.addTests(loader.loadTestsFromTestCase(TestPdfConversion))
+    suite.addTests(loader.loadTestsFromTestCase(TestPreprocessing))
     suite.addTests(loader.loadTestsFromTestCase(TestReportGeneration))
+    suite.addTests(loader.loadTestsFromTestCase(TestReportTemplates))
+    suite.addTests(loader.loadTestsFromTestCase(TestIncrementalPreview))
+    suite.addTests(loader.loadTestsFromTestCase(TestPreviewThumbnails))
+    suite.addTests(loader.loadTestsFromTestCase(TestReportJobs))
+    suite.addTests(loader.loadTestsFromTestCase(TestBatchReports))
+    suite.addTests(loader.loadTestsFromTestCase(TestColdStart))
+    suite.addTests(loader.loadTestsFromTestCase(TestUploadStore))
+    suite.addTests(loader.loadTestsFromTestCase(TestChunkedUpload))
+    suite.addTests(loader.loadTestsFromTestCase(TestUploadGC))
     suite.addTests(loader.loadTestsFromTestCase(TestErrorHandling))
     
     # Run tests
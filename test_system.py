@@ -108,17 +108,7 @@ for file in required_files:
 
 # 7. Check upload directories
 print("\n7. Checking upload directories...")
-upload_dirs = [
-    'uploads',
-    'uploads/photos',
-    'uploads/speaker',
-    'uploads/signatures',
-    'uploads/attendance',
-    'uploads/brochure',
-    'uploads/notice',
-    'uploads/feedback',
-    'uploads/impact'
-]
+upload_dirs = ['uploads']  # Uploads are stored by content hash below this
 
 for dir_path in upload_dirs:
     if os.path.exists(dir_path):
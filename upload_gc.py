@@ -0,0 +1,294 @@
+"""
+Garbage collection for the uploads directory.
+
+Every draft save and report request writes new files below uploads/, and
+trees from before the derivative cache also hold _resized.jpg and
+_page_N.jpg siblings. An upload stays while something refers to it:
+
+  - the form data of a draft (collaborators share the owner's draft),
+  - a saved signature,
+  - a report job that is still queued or running (its payload holds the
+    raw upload paths),
+  - a finished chunked upload whose session has not expired (its asset id
+    may still be submitted).
+
+A reference to a processed image in cache/derivatives (which has its own
+size-based eviction) keeps the upload it was made from: the derivative
+index records the source's SHA-256, which names the stored upload.
+Everything else older than GC_GRACE_SECONDS is deleted, and so are the
+derivative index entries (and files) made from a deleted stored upload.
+
+Preview PDFs in cache/previews are not referenced by anything once the
+editor has shown them; expire_previews() deletes those older than
+PREVIEW_RETENTION_SECONDS.
+
+A sweep examines at most GC_BATCH_SIZE files, starting after the last file
+the previous sweep reached (kept in GC_STATE_FILE), so the render workers
+can collect a little at a time:
+
+    python upload_gc.py [--dry-run] [--all] [--batch-size N] [--previews]
+"""
+import os
+import re
+import sys
+import glob
+import json
+import time
+import bisect
+import shutil
+import logging
+import argparse
+
+import image_cache
+from database import get_upload_references
+from upload_store import STORE_DIR, object_path
+from chunked_upload import asset_object_path
+from preview_store import PREVIEW_DIR, PREVIEW_MAX_AGE_SECONDS
+
+logger = logging.getLogger('report_generator.report')
+
+# =============================
+# CONFIGURATION
+# =============================
+UPLOAD_DIR = STORE_DIR
+GC_GRACE_SECONDS = 3600  # Newer uploads are kept: the draft or job referring to them may not be saved yet
+GC_BATCH_SIZE = 500  # Files examined per sweep
+GC_STATE_FILE = os.path.join('cache', 'upload_gc.json')
+PREVIEW_RETENTION_SECONDS = 2 * PREVIEW_MAX_AGE_SECONDS  # Outlives browser-cached preview pages
+
+STORED_NAME = re.compile(r'([0-9a-f]{64})\.[^.]+')  # <sha256><ext>, as upload_store names content
+
+
+def json_strings(value):
+    """All strings inside a decoded JSON value"""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from json_strings(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from json_strings(item)
+
+
+def source_uploads(values, upload_dir=UPLOAD_DIR):
+    """Stored uploads that the cached derivatives among values were made from"""
+    cache_root = os.path.join(os.path.abspath(image_cache.CACHE_DIR), '')
+    derivatives = set()
+    for value in values:
+        path = os.path.abspath(value)
+        if path.startswith(cache_root):
+            # The index keeps the path as it was written (relative to the app directory)
+            derivatives.update({value, path, os.path.relpath(path)})
+    sources = set()
+    for digest in set(image_cache.derivative_sources(derivatives).values()):
+        sources.update(glob.glob(object_path(digest, '.*', upload_dir)))
+    return sources
+
+
+def referenced_paths(upload_dir=UPLOAD_DIR):
+    """Absolute paths below upload_dir that drafts, saved signatures or unfinished jobs refer to"""
+    refs = get_upload_references()
+    values = list(refs['signatures'])
+    for text in refs['drafts'] + refs['jobs']:
+        try:
+            values.extend(json_strings(json.loads(text)))
+        except ValueError:
+            continue
+    values = [value for value in values if value]
+    values.extend(source_uploads(values, upload_dir))
+    values.extend(filter(None, (asset_object_path(asset_id, upload_dir) for asset_id in refs['assets'])))
+    root = os.path.join(os.path.abspath(upload_dir), '')
+    return {path for path in (os.path.abspath(value) for value in values) if path.startswith(root)}
+
+
+def list_upload_files(upload_dir=UPLOAD_DIR):
+    """Every file below upload_dir, sorted, so sweeps can resume by position"""
+    paths = []
+    for root, dirs, files in os.walk(upload_dir):
+        # Chunked uploads in progress (.staging) expire with their sessions
+        dirs[:] = [name for name in dirs if not name.startswith('.')]
+        paths.extend(os.path.join(root, name) for name in files)
+    return sorted(paths)
+
+
+def load_state():
+    """The sweep cursor and last run time"""
+    try:
+        with open(GC_STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state):
+    """Write the sweep state atomically"""
+    os.makedirs(os.path.dirname(GC_STATE_FILE) or '.', exist_ok=True)
+    tmp_path = f"{GC_STATE_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, GC_STATE_FILE)
+
+
+def sweep(upload_dir=UPLOAD_DIR, batch_size=GC_BATCH_SIZE, grace_seconds=GC_GRACE_SECONDS, dry_run=False,
+          from_start=False):
+    """
+    Delete unreferenced uploads among the next batch_size files (the first
+    ones with from_start). Returns stats: files scanned, deleted, kept as
+    referenced or recent, bytes reclaimed and whether the sweep reached the
+    end of the tree.
+    """
+    cursor = None if from_start else load_state().get('cursor')
+    paths = list_upload_files(upload_dir)
+    start = bisect.bisect_right(paths, cursor) if cursor else 0
+    batch = paths[start:start + batch_size]
+    referenced = referenced_paths(upload_dir)
+    cutoff = time.time() - grace_seconds
+
+    stats = {'scanned': len(batch), 'deleted': 0, 'referenced': 0, 'recent': 0, 'bytes_reclaimed': 0,
+             'cache_entries_dropped': 0, 'pass_complete': start + batch_size >= len(paths)}
+    deleted_digests = set()
+    for path in batch:
+        if os.path.abspath(path) in referenced:
+            stats['referenced'] += 1
+            continue
+        try:
+            st = os.stat(path)
+            if st.st_mtime > cutoff:
+                stats['recent'] += 1
+                continue
+            if not dry_run:
+                os.remove(path)
+        except FileNotFoundError:
+            continue
+        stats['deleted'] += 1
+        stats['bytes_reclaimed'] += st.st_size
+        match = STORED_NAME.fullmatch(os.path.basename(path))
+        if match:
+            deleted_digests.add(match.group(1))
+
+    if not dry_run:
+        # Content also stored under another extension is still a source
+        gone = [d for d in deleted_digests if not glob.glob(object_path(d, '.*', upload_dir))]
+        stats['cache_entries_dropped'] = image_cache.forget_sources(gone)
+        save_state({'cursor': None if stats['pass_complete'] else batch[-1], 'last_sweep': time.time()})
+    if stats['deleted']:
+        logger.info(f"Upload GC {'would delete' if dry_run else 'deleted'} {stats['deleted']} files, "
+                    f"{stats['bytes_reclaimed']} bytes - Stats: {json.dumps(stats, sort_keys=True)}")
+    return stats
+
+
+def expire_previews(max_age_seconds=PREVIEW_RETENTION_SECONDS, dry_run=False, preview_dir=PREVIEW_DIR):
+    """Delete preview PDFs older than max_age_seconds. Returns files deleted and bytes reclaimed."""
+    stats = {'deleted': 0, 'bytes_reclaimed': 0}
+    cutoff = time.time() - max_age_seconds
+    for root, _, files in os.walk(preview_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+                if st.st_mtime > cutoff:
+                    continue
+                if not dry_run:
+                    os.remove(path)
+            except FileNotFoundError:
+                continue
+            stats['deleted'] += 1
+            stats['bytes_reclaimed'] += st.st_size
+    if stats['deleted']:
+        logger.info(f"Preview cleanup {'would delete' if dry_run else 'deleted'} {stats['deleted']} files, "
+                    f"{stats['bytes_reclaimed']} bytes")
+    return stats
+
+
+def tree_stat(path):
+    """Newest mtime and total size of a file, or of a directory and everything below it"""
+    st = os.stat(path)
+    if not os.path.isdir(path):
+        return st.st_mtime, st.st_size
+    newest, size = st.st_mtime, 0
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            newest = max(newest, st.st_mtime)
+            if name in files:
+                size += st.st_size
+    return newest, size
+
+
+def expire_entries(directory, max_age_seconds, dry_run=False, keep=()):
+    """
+    Delete the entries of directory (files, or subdirectories with everything
+    in them) in which nothing changed for max_age_seconds, except the names in
+    keep. Returns entries deleted and bytes reclaimed.
+    """
+    stats = {'deleted': 0, 'bytes_reclaimed': 0}
+    cutoff = time.time() - max_age_seconds
+    try:
+        names = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        return stats
+    for name in names:
+        if name in keep:
+            continue
+        path = os.path.join(directory, name)
+        try:
+            newest, size = tree_stat(path)
+            if newest > cutoff:
+                continue
+            if not dry_run:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+        except FileNotFoundError:
+            continue
+        stats['deleted'] += 1
+        stats['bytes_reclaimed'] += size
+    if stats['deleted']:
+        logger.info(f"Cleanup of {directory} {'would delete' if dry_run else 'deleted'} {stats['deleted']} "
+                    f"entries, {stats['bytes_reclaimed']} bytes")
+    return stats
+
+
+def sweep_all(upload_dir=UPLOAD_DIR, batch_size=GC_BATCH_SIZE, grace_seconds=GC_GRACE_SECONDS, dry_run=False):
+    """Sweep the whole tree, batch by batch. Returns the summed stats."""
+    if dry_run:
+        batch_size = sys.maxsize  # Nothing is deleted, so the cursor does not move
+    total = {}
+    from_start = True
+    while True:
+        stats = sweep(upload_dir, batch_size, grace_seconds, dry_run, from_start)
+        for key, value in stats.items():
+            if key != 'pass_complete':
+                total[key] = total.get(key, 0) + value
+        if stats['pass_complete']:
+            return total
+        from_start = False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--upload-dir', default=UPLOAD_DIR)
+    parser.add_argument('--batch-size', type=int, default=GC_BATCH_SIZE)
+    parser.add_argument('--grace', type=int, default=GC_GRACE_SECONDS, help='keep uploads newer than this (seconds)')
+    parser.add_argument('--all', action='store_true', help='sweep the whole tree instead of one batch')
+    parser.add_argument('--dry-run', action='store_true', help='report what would be deleted')
+    parser.add_argument('--previews', action='store_true', help='also delete expired preview PDFs')
+    args = parser.parse_args(argv)
+
+    if args.all:
+        stats = sweep_all(args.upload_dir, args.batch_size, args.grace, args.dry_run)
+    else:
+        stats = sweep(args.upload_dir, args.batch_size, args.grace, args.dry_run)
+    if args.previews:
+        stats['previews'] = expire_previews(dry_run=args.dry_run)
+    print(json.dumps(stats, indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Content-addressed storage for uploads.
+
+An upload is hashed while it streams into a temporary file inside the
+store, then renamed to <STORE_DIR>/ab/cd/<sha256><ext>. Content that five
+collaborators upload, or that every /save_draft call sends again, is
+written once and every caller gets the same path back. The path is the
+reference drafts, report jobs and saved signatures keep, as before.
+
+Storing content that already exists refreshes the file's mtime, so the
+upload GC (upload_gc.py) treats it as new for its grace period while the
+draft or job that now refers to it is being saved.
+"""
+import os
+import hashlib
+import logging
+import tempfile
+
+logger = logging.getLogger('report_generator.report')
+
+# =============================
+# CONFIGURATION
+# =============================
+STORE_DIR = 'uploads'
+COPY_CHUNK_BYTES = 256 * 1024
+FILE_MODE = 0o644
+
+
+def object_path(digest, ext, store_dir=STORE_DIR):
+    """Path of stored content: ab/cd/<digest><ext> below the store"""
+    return os.path.join(store_dir, digest[:2], digest[2:4], f"{digest}{ext}")
+
+
+def touch(path):
+    """Refresh a stored file's mtime. Returns False if it does not exist."""
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def store_stream(stream, ext, store_dir=STORE_DIR):
+    """
+    Store the content read from a file object, under its SHA-256 and the
+    given extension ('.jpg', '.pdf'...). Returns (path, created), where
+    created is False if the content was already stored.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(prefix='.upload_', dir=store_dir)
+    try:
+        # Hash while copying, so the upload is written once and never re-read
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter(lambda: stream.read(COPY_CHUNK_BYTES), b''):
+                digest.update(chunk)
+                f.write(chunk)
+        return place(tmp_path, digest.hexdigest(), ext, store_dir)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def store_file(path, ext, store_dir=STORE_DIR, expected_sha256=None):
+    """
+    Move a finished file on the store's filesystem (a chunked upload's
+    staging file) into the store. Returns (path, created). Raises
+    ValueError, and drops the file, if its SHA-256 is not the expected one.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    try:
+        if expected_sha256 and digest.hexdigest() != expected_sha256.lower():
+            raise ValueError("File checksum does not match")
+        return place(path, digest.hexdigest(), ext, store_dir)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def place(tmp_path, digest, ext, store_dir=STORE_DIR):
+    """Rename a file with the given SHA-256 into the store, unless that content is there already"""
+    path = object_path(digest, ext.lower(), store_dir)
+    if touch(path):
+        logger.debug(f"Upload already stored: {path}")
+        return path, False
+    os.chmod(tmp_path, FILE_MODE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(tmp_path, path)
+    return path, True